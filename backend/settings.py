@@ -45,7 +45,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'accounts',
-    'news',
+    'news.apps.NewsConfig',
     'knox',
     'corsheaders'
 ]
@@ -118,6 +118,25 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # response cache for the article and analytics endpoints, the local memory
+    # cache evicts the least recently used entries once MAX_ENTRIES is reached
+    'news': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'news-responses',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        }
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -156,3 +175,46 @@ USE_TZ = True
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'models')
 STATIC_URL = '/static/'
+
+
+# News app
+
+# read the article endpoints from the denormalized ArticleFeed table instead of joining
+# news_article, news_articlenlp and news_topiclkp on every request
+NEWS_READ_FROM_FEED = True
+
+# cache alias used for cached endpoint responses, set to None to turn the response cache off.
+# Entries are invalidated when articles change. The timeout is still needed since the
+# timeFrame params are relative to the current time
+NEWS_RESPONSE_CACHE = 'news'
+NEWS_RESPONSE_CACHE_TIMEOUT = 300
+
+# load and warm up the trained models (see news/model_registry.py) when the app starts instead of
+# on the first request that uses them. Off by default so management commands don't pay for it.
+# With gunicorn --preload the models are loaded once before the workers fork, and the
+# memory-mapped arrays are shared by every worker
+NEWS_PRELOAD_MODELS = False
+
+# load the NLTK data used by the analysis endpoints (punkt, stopwords, WordNet) when the app starts,
+# fails at startup with a LookupError if it hasn't been downloaded
+NEWS_PRELOAD_NLTK = False
+
+# 'exact' scores every article vector for get_similar, 'approximate' only scores the vectors in the
+# query's LSH buckets (manage.py build_vector_index --lsh-tables N). Check the recall with
+# manage.py benchmark_vector_index before switching
+NEWS_SIMILARITY_SEARCH = 'exact'
+
+# number of vectors inferred for new headlines/text to keep in memory per process
+NEWS_INFERRED_VECTOR_CACHE_SIZE = 1024
+
+# worker processes used by /api/analysis/analyze_batch, 0 runs the analysis in the web worker instead
+NEWS_ANALYSIS_WORKERS = 2
+
+# longest text, in characters, the analysis endpoints will take. Texts longer than the chunk
+# length are tokenized and analyzed a chunk at a time so the memory used doesn't grow with the text
+NEWS_ANALYSIS_MAX_TEXT_LENGTH = 1000000
+NEWS_ANALYSIS_CHUNK_LENGTH = 50000
+
+# analysis results kept in memory per process, they're also stored in the news_analysisresult
+# table so every process can reuse them (see news/analysis_cache.py). 0 turns both off
+NEWS_ANALYSIS_RESULT_CACHE_SIZE = 4096
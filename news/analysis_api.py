@@ -1,23 +1,63 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import TopicLkp
-from textblob import TextBlob
-import math
-from textblob import TextBlob
-from nltk.tokenize import word_tokenize, sent_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from gensim.models import LdaMulticore
-from backend import settings
-import os
+from django.conf import settings
+from .analysis_cache import analysis_results, memoize_analyses
+from .analysis_pool import analyze_texts, get_chunk_length
+from .cache import get_topic_names
+from .model_registry import registry
+from .models import AnalysisResult
+from .nlp import (
+    ANALYSES, find_keywords, get_batch_topic_probabilities, get_sentiment, get_topic_probabilities, preprocess_for_topics
+)
+from .sentiment import LEXICON, SENTIMENT_ENGINES, TEXTBLOB
 
 
 class AnalysisView(viewsets.ViewSet):
+    # most texts analyze_batch will take in one request
+    max_batch_size = 1000
+
+    # GET /api/analysis/model_stats
+    # load time and memory footprint of the trained models in this server process
+    # response looks like this:
+    # {
+    #   "<model name>": {
+    #       "loaded": true,
+    #       "load_seconds": <seconds>,
+    #       "heap_bytes": <bytes>,
+    #       "mapped_bytes": <bytes of memory-mapped arrays>
+    #   },
+    #   ...
+    # }
+    @action(methods=['GET'], detail=False)
+    def model_stats(self, request):
+        return Response(registry.get_stats())
+
+    # GET /api/analysis/cache_stats
+    # hit/miss counts of the in memory analysis result cache for this server process, and the
+    # number of results stored in the database for every process
+    # response looks like this:
+    # {
+    #   "size": <count>,
+    #   "maxsize": <count>,
+    #   "hits": <count>,
+    #   "misses": <count>,
+    #   "hit_rate": <hits / (hits + misses)>,
+    #   "stored": <count>
+    # }
+    @action(methods=['GET'], detail=False)
+    def cache_stats(self, request):
+        stats = analysis_results.get_stats()
+        stats['stored'] = AnalysisResult.objects.count()
+
+        return Response(stats)
 
     # POST /api/analysis/get_sentiment
     # body of request must be:
-    #   {"text": "<text data>"}
+    #   {"text": "<text data>", "engine": <optional, "textblob" (default) or "lexicon">}
+    #
+    # both engines give the same scores, "lexicon" is faster for texts without modifiers or
+    # negations (see sentiment.py)
     @action(methods=['POST'], detail=False)
     def get_sentiment(self, request):
         # request body must contain "text"
@@ -27,13 +67,26 @@ class AnalysisView(viewsets.ViewSet):
         # "text" must be a string
         if type(request.data['text']) != str:
             return Response({'error': 'text must be a string'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        blob = TextBlob(request.data['text'])
 
-        return Response({
-            'sentiment': blob.sentiment.polarity,
-            'subjectivity': blob.sentiment.subjectivity
-        })
+        # very long texts are refused, see NEWS_ANALYSIS_MAX_TEXT_LENGTH
+        if len(request.data['text']) > self.get_max_text_length():
+            return Response(
+                {'error': f'text must be at most {self.get_max_text_length()} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        engine = request.data.get('engine', TEXTBLOB)
+
+        if engine not in SENTIMENT_ENGINES:
+            return Response(
+                {'error': f'engine must be one of {", ".join(SENTIMENT_ENGINES)}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        sentiment = self.memoize(
+            request.data['text'], 'sentiment', lambda text: self.score_sentiment(text, engine), engine
+        )
+
+        return Response(sentiment)
 
     # POST /api/analysis/get_keywords
     # body of request must be:
@@ -48,130 +101,30 @@ class AnalysisView(viewsets.ViewSet):
         if type(request.data['text']) != str:
             return Response({'error': 'text must be a string'}, status=status.HTTP_400_BAD_REQUEST)
 
-        keywords = self.find_keywords(request.data['text'])
+        # very long texts are refused, see NEWS_ANALYSIS_MAX_TEXT_LENGTH
+        if len(request.data['text']) > self.get_max_text_length():
+            return Response(
+                {'error': f'text must be at most {self.get_max_text_length()} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        keywords = self.memoize(request.data['text'], 'keywords', self.find_keywords)
 
         return Response({
             'keywords': keywords
         })
 
-    # Helper methods for getting keywords via TF-IDF
-    def get_unique_terms(self, tokens: list) -> list:
-        # find the unique terms, then count how many times each term appears
-        unique_terms = []
-
-        for token in tokens:
-            if token not in unique_terms:
-                unique_terms.append(token)
-
-        return unique_terms
-
-    def get_term_frequency(self, unique_terms: list, all_tokens: list) -> dict:
-        # find how many times each term appears
-        term_counts = {}
-        for term in unique_terms:
-            term_counts.update({term: 0})
-
-        for token in all_tokens:
-            term_counts[token] += 1
-
-        # find term frequencies by diving # of times each term appears by the term counts
-        term_freqs = {}
-        num_terms = len(all_tokens)
-
-        for term in unique_terms:
-            term_freqs.update({term: term_counts[term] / num_terms})
-
-        return term_freqs
-
-    def get_inverse_document_frequency(self, content: str, unique_terms: list) -> dict:
-        # split content into sentences
-        sentences = sent_tokenize(content)
-        num_sentences = len(sentences)
-
-        # split each sentence into word tokens, no need to remove stop words here
-        sentences = [word_tokenize(sent) for sent in sentences]
-
-        # find number of sentences containing each term
-        sentence_freqs = {}
-
-        for term in unique_terms:
-            sentence_freqs.update({term: 0})
-            
-        for term in unique_terms:
-            for sent in sentences:
-                if term in sent:
-                    sentence_freqs[term] += 1
-
-        # compute inverse document frequency for each term
-        idf = {}
-
-        for term in unique_terms:
-            term_val = 0
-
-            # avoid division by 0
-            if sentence_freqs[term] != 0:
-                term_val = math.log(num_sentences / sentence_freqs[term])
-
-            idf.update({
-                term: term_val
-            })
-
-        return idf
-
-    def get_tf_idf(self, unique_terms: list, term_freqs: dict, idf: dict) -> dict:
-        # find tfidf for each term
-        tfidf = {}
-
-        for term in unique_terms:
-            tfidf.update({
-                term: term_freqs[term] * idf[term]
-            })
-
-        return tfidf
-
-    def find_keywords(self, content: str) -> str:
+    def find_keywords(self, content: str) -> list:
         """
-        Find the top ten key words using the TF-IDF calculation.
-
-        Term Frequency = (# of times term appears) / (total # of terms in article)
-        Inverse Document Frequency = log(# of sentences / # of sentences with the term)
-        TF-IDF - term frequency * inverse document frequency
-
-        Higher TF-IDF score means the term is more important.
+        Find the top ten key words using the TF-IDF calculation, see nlp.find_keywords.
 
         Args:
             content (str): content from news article to find keywords for
 
         Returns:
-            str: semi-colon separated list of keywords
+            list: top ten keywords, highest TF-IDF score first
         """
-        # tokenize the content and remove stopwords and punctuation
-        sentences = sent_tokenize(content)
-        tokens = []
-        # sent tokenize first so the way it creates tokens is consistent with how it's done when computing IDF
-        for sent in sentences:
-            tokens += word_tokenize(sent)
-        
-        tokens = [t for t in tokens if t.lower() not in stopwords.words('english') and len(t) >= 3 and t.lower() != 'said']
-
-        unique_terms = self.get_unique_terms(tokens)
-
-        # get TF and IDF then calculate TF-IDF
-        term_freqs = self.get_term_frequency(unique_terms, tokens)
-        idf = self.get_inverse_document_frequency(content, unique_terms)
-        tfidf_scores = self.get_tf_idf(unique_terms, term_freqs, idf)
-
-        # take the top 10 words with highest TF-IDF score
-        # swap keys and values so the list can be sorted by TF-IDF score easily
-        swapped_key_and_vals = []
-        for item in tfidf_scores.items():
-            swapped_key_and_vals.append((item[1], item[0]))
-
-        # take the last ten items in reversed order so it's sorted in descending order
-        top_ten = sorted(swapped_key_and_vals)[-1:-11:-1]
-        top_ten_terms = [item[1] for item in top_ten]
-
-        return top_ten_terms
+        return find_keywords(content, chunk_length=get_chunk_length())
 
     @action(methods=['POST'], detail=False)
     def get_topic_probability(self, request) -> int:
@@ -201,53 +154,205 @@ class AnalysisView(viewsets.ViewSet):
         if type(request.data['text']) != str:
             return Response({'error': 'text must be a string'}, status=status.HTTP_400_BAD_REQUEST)
 
-        model = LdaMulticore.load(os.path.join(settings.STATIC_ROOT, 'news_lda_model'))
-
-        preprocessed = self.preprocess(request.data['text'])
-
-        # create bag of words with preprocessed article
-        bow = model.id2word.doc2bow(preprocessed)
+        # very long texts are refused, see NEWS_ANALYSIS_MAX_TEXT_LENGTH
+        if len(request.data['text']) > self.get_max_text_length():
+            return Response(
+                {'error': f'text must be at most {self.get_max_text_length()} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # make prediction
-        # pred is a list of tuples of the form (<topic id>, <topic probability>)
-        probabilities = model[bow]
+        # tokenized differently from the 'topics' analysis, so it's stored under its own name
+        probabilities = self.memoize(
+            request.data['text'], 'topic_probability', lambda text: get_topic_probabilities(self.preprocess(text))
+        )
 
-        # Look up the topic name for each result and format for response
-        response = []
+        return Response(self.format_topic_probabilities(probabilities))
 
-        for prob in probabilities:
-            topic_name = TopicLkp.objects.filter(topic_id=prob[0]).first().topic_name
-            probability = prob[1]
+    def score_sentiment(self, text: str, engine: str) -> dict:
+        if engine == LEXICON:
+            return registry.get('sentiment_lexicon').score_texts([text], get_chunk_length())[0]
 
-            response.append({
-                'topic_name': topic_name,
-                'probability': probability
-            })
+        return get_sentiment(text, get_chunk_length())
 
-        return Response(response)
+    def get_max_text_length(self) -> int:
+        return getattr(settings, 'NEWS_ANALYSIS_MAX_TEXT_LENGTH', 1000000)
 
-    def preprocess(self, text: str) -> list:
+    def memoize(self, text: str, analysis: str, analyze, sentiment_engine: str = TEXTBLOB):
         """
-        Preprocess text for topic modeling.
-        This involves removing stop words and any words less than
-        three characters. It also word tokenizes sentences and 
-        lemmatizes each word.
+        Run one analysis on a text, or get its result from the analysis cache if the text has been
+        analyzed before, see analysis_cache.py.
 
         Args:
-            text (str): Article to preprocess
+            text (str): text to analyze
+            analysis (str): name the result is stored under
+            analyze (callable): function that is given the text and returns the result
+            sentiment_engine (str): engine analyze scores the sentiment with, see sentiment.py
 
         Returns:
-            list: list of lowercase, lemmatized tokens from the article
+            result of the analysis
         """
-        stop_words = stopwords.words('english')
-        lemmatizer = WordNetLemmatizer()
+        results = memoize_analyses(
+            [text], (analysis,), lambda texts, analyses: [{analysis: analyze(text)} for text in texts], sentiment_engine
+        )
 
-        tokens = word_tokenize(text.lower()) # make all text lower case
-        words = [] # words resulting from applying the filters
+        return results[0][analysis]
 
-        for token in tokens:
-            if len(token) > 3 and token not in stop_words:
-                words.append(lemmatizer.lemmatize(token))
-        
-        return words
+    def valid_analyses(self, analyses) -> bool:
+        # analyses must be a non empty list of analysis names
+        return type(analyses) == list and bool(analyses) and all(analysis in ANALYSES for analysis in analyses)
 
+    def format_topic_probabilities(self, probabilities: list) -> list:
+        # look up the topic name for each (topic id, probability) and format for response
+        topic_names = get_topic_names()
+
+        return [
+            {'topic_name': topic_names.get(topic_id), 'probability': probability}
+            for topic_id, probability in probabilities
+        ]
+
+    # POST /api/analysis/analyze
+    # sentiment, keywords and topic probabilities of a text in one request. The text is only
+    # tokenized once, the same sentences and tokens are used for the keywords and the topics
+    # body of request must be:
+    #   {
+    #     "text": "<text data>",
+    #     "analyses": <optional, any of ["sentiment", "keywords", "topics"], defaults to all of them>
+    #   }
+    #
+    # response looks like this:
+    # {
+    #   "sentiment": {"sentiment": <sentiment>, "subjectivity": <subjectivity>},
+    #   "keywords": [<keyword>, ...],
+    #   "topics": [{"topic_name": <name>, "probability": <probability>}, ...]
+    # }
+    @action(methods=['POST'], detail=False)
+    def analyze(self, request):
+        # request body must contain "text"
+        if 'text' not in request.data:
+            return Response({'error': 'must supply text'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # "text" must be a string
+        if type(request.data['text']) != str:
+            return Response({'error': 'text must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # very long texts are refused, see NEWS_ANALYSIS_MAX_TEXT_LENGTH
+        if len(request.data['text']) > self.get_max_text_length():
+            return Response(
+                {'error': f'text must be at most {self.get_max_text_length()} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        analyses = request.data.get('analyses', list(ANALYSES))
+
+        if not self.valid_analyses(analyses):
+            return Response(
+                {'error': f'analyses must be a list containing any of {", ".join(ANALYSES)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = memoize_analyses([request.data['text']], tuple(analyses), analyze_texts)[0]
+
+        if 'topics' in result:
+            result['topics'] = self.format_topic_probabilities(result['topics'])
+
+        return Response(result)
+
+    # POST /api/analysis/analyze_batch
+    # runs the analyses on many texts in one request, spread across a pool of worker processes
+    # (NEWS_ANALYSIS_WORKERS setting)
+    # body of request must be:
+    #   {
+    #     "texts": ["<text data>", ...],
+    #     "analyses": <optional, any of ["sentiment", "keywords", "topics"], defaults to all of them>,
+    #     "engine": <optional, sentiment engine, "textblob" (default) or "lexicon" to score every text at once>
+    #   }
+    #
+    # response has the results for each text in the same order as the texts:
+    # [
+    #   {
+    #     "sentiment": {"sentiment": <sentiment>, "subjectivity": <subjectivity>},
+    #     "keywords": [<keyword>, ...],
+    #     "topics": [{"topic_name": <name>, "probability": <probability>}, ...]
+    #   },
+    #   ...
+    # ]
+    @action(methods=['POST'], detail=False)
+    def analyze_batch(self, request):
+        texts = request.data.get('texts')
+        analyses = request.data.get('analyses', list(ANALYSES))
+        engine = request.data.get('engine', TEXTBLOB)
+
+        error = self.get_texts_error(texts)
+
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not self.valid_analyses(analyses):
+            return Response(
+                {'error': f'analyses must be a list containing any of {", ".join(ANALYSES)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if engine not in SENTIMENT_ENGINES:
+            return Response(
+                {'error': f'engine must be one of {", ".join(SENTIMENT_ENGINES)}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # only the texts that haven't been analyzed before are sent to the workers
+        results = memoize_analyses(
+            texts, tuple(analyses), lambda texts, analyses: analyze_texts(texts, analyses, engine), engine
+        )
+
+        # topic names come from the database so they're added here instead of in the workers
+        for result in results:
+            if 'topics' in result:
+                result['topics'] = self.format_topic_probabilities(result['topics'])
+
+        return Response(results)
+
+    # POST /api/analysis/get_topic_probability_batch
+    # topic probabilities of many texts with one pass of the LDA model over all of them
+    # body of request must be:
+    #   {"texts": ["<text data>", ...]}
+    #
+    # response looks like this, distributions has the probability of every topic for each text
+    # in the same order as topic_names, topics is the same as get_topic_probability for each text:
+    # {
+    #   "topic_names": [<name of topic 0>, <name of topic 1>, ...],
+    #   "distributions": [[<probability of topic 0>, <probability of topic 1>, ...], ...],
+    #   "topics": [[{"topic_name": <name>, "probability": <probability>}, ...], ...]
+    # }
+    @action(methods=['POST'], detail=False)
+    def get_topic_probability_batch(self, request):
+        texts = request.data.get('texts')
+        error = self.get_texts_error(texts)
+
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        distributions, probabilities = get_batch_topic_probabilities([self.preprocess(text) for text in texts])
+        topic_names = get_topic_names()
+
+        return Response({
+            'topic_names': [topic_names.get(topic_id) for topic_id in range(distributions.shape[1])],
+            'distributions': distributions.tolist(),
+            'topics': [self.format_topic_probabilities(text_probabilities) for text_probabilities in probabilities]
+        })
+
+    def get_texts_error(self, texts) -> str:
+        # error message if texts isn't a list of strings the batch endpoints can take, otherwise None
+        if type(texts) != list or not texts or any(type(text) != str for text in texts):
+            return 'texts must be a list of strings'
+
+        if any(len(text) > self.get_max_text_length() for text in texts):
+            return f'each text must be at most {self.get_max_text_length()} characters'
+
+        if len(texts) > self.max_batch_size:
+            return f'at most {self.max_batch_size} texts can be given'
+
+        return None
+
+    def preprocess(self, text: str) -> list:
+        # tokens used for topic modeling, see nlp.preprocess_for_topics. Long texts give a
+        # generator of the tokens so they aren't all in memory at once
+        return preprocess_for_topics(text, get_chunk_length())
@@ -0,0 +1,151 @@
+# Memoized results of the text analyses, so the same text sent again (retries, duplicate feeds,
+# users clicking twice) doesn't run TextBlob, NLTK or gensim again.
+#
+# Results are keyed on a hash of the text, the analysis, the options that change its result
+# (the sentiment engine, and the chunk length for texts that are analyzed a chunk at a time)
+# and the version of the model that produced it. There are two tiers, an LRU in each server process and the AnalysisResult table
+# shared by all of them. A retrained model or a library upgrade changes the version, so old
+# results are never returned, they're just left in the table until it's cleared.
+from django.conf import settings
+from functools import lru_cache
+from hashlib import sha256
+from importlib.metadata import version
+from .analysis_pool import get_chunk_length
+from .lru import LRUCache
+from .models import AnalysisResult
+from .sentiment import TEXTBLOB
+import nltk
+import os
+
+# bump when a change to the analysis code changes its results
+ANALYSIS_CACHE_VERSION = 1
+
+# results kept in memory per process, see NEWS_ANALYSIS_RESULT_CACHE_SIZE
+analysis_results = LRUCache(getattr(settings, 'NEWS_ANALYSIS_RESULT_CACHE_SIZE', 4096))
+
+
+def cache_enabled() -> bool:
+    return getattr(settings, 'NEWS_ANALYSIS_RESULT_CACHE_SIZE', 4096) > 0
+
+@lru_cache(maxsize=None)
+def get_model_version(analysis: str) -> str:
+    """
+    Version of everything an analysis depends on. It's worked out once per process, the
+    models are also only loaded once per process so it matches the model in use.
+
+    Args:
+        analysis (str): 'sentiment', 'keywords', 'topics' or 'topic_probability'
+
+    Returns:
+        str: version string that is part of the cache key
+    """
+    if analysis == 'sentiment':
+        return f'{ANALYSIS_CACHE_VERSION}:textblob-{version("textblob")}'
+
+    if analysis == 'keywords':
+        return f'{ANALYSIS_CACHE_VERSION}:nltk-{nltk.__version__}'
+
+    # the topics depend on the trained LDA model, a retrained model has a new modification time
+    lda_path = os.path.join(settings.STATIC_ROOT, 'news_lda_model')
+    lda_mtime = os.stat(lda_path).st_mtime_ns if os.path.exists(lda_path) else 0
+
+    return f'{ANALYSIS_CACHE_VERSION}:nltk-{nltk.__version__}:lda-{lda_mtime}'
+
+def get_cache_key(text: str, analysis: str, sentiment_engine: str = TEXTBLOB) -> str:
+    name = f'sentiment:{sentiment_engine}' if analysis == 'sentiment' else analysis
+
+    # texts longer than the chunk length are analyzed a chunk at a time, which changes the results
+    chunk_length = get_chunk_length()
+
+    if chunk_length is not None and len(text) > chunk_length:
+        name += f':chunk-{chunk_length}'
+
+    prefix = f'{name}:{get_model_version(analysis)}:'.encode()
+
+    return sha256(prefix + text.encode()).hexdigest()
+
+def get_results(texts: list, analyses: tuple, sentiment_engine: str = TEXTBLOB) -> list:
+    """
+    Look up stored results, in memory first and then in the database.
+
+    Args:
+        texts (list): texts that were analyzed
+        analyses (tuple): analyses to look up
+        sentiment_engine (str): engine the sentiment was scored with, see sentiment.py
+
+    Returns:
+        list: a dict for each text with the analyses that were found, a new dict for every call
+              so callers can change it
+    """
+    results = [{} for _ in texts]
+    missing = {}
+
+    for i, text in enumerate(texts):
+        for analysis in analyses:
+            key = get_cache_key(text, analysis, sentiment_engine)
+            result = analysis_results.get(key)
+
+            if result is None:
+                missing.setdefault(key, []).append((i, analysis))
+            else:
+                results[i][analysis] = result
+
+    if missing:
+        for key, result in AnalysisResult.objects.filter(key__in=list(missing)).values_list('key', 'result'):
+            analysis_results.set(key, result)
+
+            for i, analysis in missing[key]:
+                results[i][analysis] = result
+
+    return results
+
+def save_results(texts: list, results: list, sentiment_engine: str = TEXTBLOB):
+    """
+    Store new results in both tiers.
+
+    Args:
+        texts (list): texts that were analyzed
+        results (list): dict of analysis name to JSON serializable result for each text
+        sentiment_engine (str): engine the sentiment was scored with, see sentiment.py
+    """
+    rows = {}
+
+    for text, result in zip(texts, results):
+        for analysis, value in result.items():
+            key = get_cache_key(text, analysis, sentiment_engine)
+            analysis_results.set(key, value)
+            rows[key] = AnalysisResult(key=key, analysis=analysis, result=value)
+
+    # another process may have stored the same result since it was looked up
+    AnalysisResult.objects.bulk_create(rows.values(), ignore_conflicts=True)
+
+def memoize_analyses(texts: list, analyses: tuple, analyze, sentiment_engine: str = TEXTBLOB) -> list:
+    """
+    Get the results of the analyses for each text, only calling analyze for the texts that
+    don't have all of them stored.
+
+    Args:
+        texts (list): texts to analyze
+        analyses (tuple): analyses to run
+        analyze (callable): given the texts that are missing results and the analyses, returns
+                            a dict of analysis name to result for each text
+        sentiment_engine (str): engine analyze scores the sentiment with, see sentiment.py
+
+    Returns:
+        list: dict of analysis name to result for each text, in the same order as the texts
+    """
+    if not cache_enabled():
+        return analyze(texts, analyses)
+
+    results = get_results(texts, analyses, sentiment_engine)
+    missing = [i for i, result in enumerate(results) if len(result) < len(analyses)]
+
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        computed = analyze(missing_texts, analyses)
+        save_results(missing_texts, computed, sentiment_engine)
+
+        for i, result in zip(missing, computed):
+            results[i] = dict(result)
+
+    return results
@@ -0,0 +1,102 @@
+# Runs text analysis for many texts at once in a pool of worker processes.
+#
+# The pool is created the first time it's needed and kept for the life of the server process,
+# each worker loads the models when it starts so they stay warm between batches. Workers only
+# run the CPU heavy analysis, anything that needs the database (e.g. topic names) is done by
+# the caller with the results.
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from .model_registry import registry
+from .nlp import ANALYSES, analyze_text, warm_up
+from .sentiment import LEXICON, TEXTBLOB
+from itertools import repeat
+from threading import Lock
+
+_executor = None
+_executor_lock = Lock()
+
+
+def warm_up_worker():
+    # runs once in each worker process so the first batch doesn't pay for loading
+    warm_up()
+
+    try:
+        registry.get('lda_model')
+    except FileNotFoundError:
+        pass
+
+def get_num_workers() -> int:
+    return getattr(settings, 'NEWS_ANALYSIS_WORKERS', 0)
+
+def get_chunk_length() -> int:
+    # texts longer than this are analyzed a chunk at a time, see nlp.iter_chunks
+    return getattr(settings, 'NEWS_ANALYSIS_CHUNK_LENGTH', None)
+
+def get_executor(num_workers: int = None) -> ProcessPoolExecutor:
+    # num_workers only sets the size of the pool when it's started, it defaults to NEWS_ANALYSIS_WORKERS
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=num_workers or get_num_workers(), initializer=warm_up_worker)
+
+        return _executor
+
+def shutdown_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+def analyze_texts(texts: list, analyses: tuple = ANALYSES, sentiment_engine: str = TEXTBLOB,
+                  num_workers: int = None) -> list:
+    """
+    Run the requested analyses on every text, spread across the worker processes.
+    With no workers, or a single text, it runs in this process instead.
+
+    Args:
+        texts (list): texts to analyze
+        analyses (tuple): any of 'sentiment', 'keywords' and 'topics'
+        sentiment_engine (str): 'textblob', or 'lexicon' to score the sentiment of all the texts
+                                at once in this process, see sentiment.py
+        num_workers (int): worker processes to use, defaults to NEWS_ANALYSIS_WORKERS
+
+    Returns:
+        list: result of analyze_text for each text, in the same order as the texts
+    """
+    if sentiment_engine == LEXICON and 'sentiment' in analyses:
+        others = tuple(analysis for analysis in analyses if analysis != 'sentiment')
+        results = analyze_texts(texts, others, num_workers=num_workers) if others else [{} for _ in texts]
+
+        sentiments = registry.get('sentiment_lexicon').score_texts(texts, get_chunk_length())
+
+        for result, sentiment in zip(results, sentiments):
+            result['sentiment'] = sentiment
+
+        return results
+
+    if num_workers is None:
+        num_workers = get_num_workers()
+
+    chunk_length = get_chunk_length()
+
+    if num_workers < 1 or len(texts) < 2:
+        return [analyze_text(text, analyses, chunk_length) for text in texts]
+
+    # send the texts in chunks so each worker gets a few at a time instead of one per round trip
+    chunksize = max(1, len(texts) // (num_workers * 4))
+
+    try:
+        return list(get_executor(num_workers).map(
+            analyze_text, texts, repeat(analyses), repeat(chunk_length), chunksize=chunksize
+        ))
+    except BrokenProcessPool:
+        # a worker died (e.g. killed for using too much memory), start a new pool and try once more
+        shutdown_executor()
+
+        return list(get_executor(num_workers).map(
+            analyze_text, texts, repeat(analyses), repeat(chunk_length), chunksize=chunksize
+        ))
@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class NewsConfig(AppConfig):
     name = 'news'
+
+    def ready(self):
+        # connect the signal handlers that keep the ArticleFeed read model in sync
+        from . import signals
+
+        # load the NLTK tokenizer, stopwords and WordNet now instead of on the first request
+        if getattr(settings, 'NEWS_PRELOAD_NLTK', False):
+            from .nlp import warm_up
+            warm_up()
+
+        # load the trained models now instead of on the first request that needs them
+        if getattr(settings, 'NEWS_PRELOAD_MODELS', False):
+            from .model_registry import registry
+            registry.load_all()
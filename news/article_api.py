@@ -1,22 +1,27 @@
-from rest_framework import viewsets
+from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import action
+from rest_framework.utils.encoders import JSONEncoder
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .serializers import ArticleSerializer
-from .models import Article, ArticleNlp, TopicLkp
-from .utils import get_article_nlp, get_counts_by_sentiment, get_subjectivity_by_sentiment, get_counts_by_date_per_topic
-from backend import settings
-import os
-
-from gensim.models.doc2vec import Doc2Vec
-import nltk
-from nltk.corpus import stopwords
-import pickle
-import string
+from .serializers import ArticleSerializer, ArticleFeedSerializer
+from .models import Article, ArticleFeed, ArticleNlp, TopicLkp
+from .cache import cached_response, get_cache_stats
+from .feed import read_from_feed
+from .pagination import ArticleCursorPagination
+from .similarity import find_similar_articles, get_stored_similar_article_ids, infer_similar_articles, inferred_vectors
+from .utils import get_article_nlp, get_article_feed, get_feed_fields, search_headlines, get_counts_by_sentiment, get_subjectivity_by_sentiment, get_counts_by_date_per_topic
+import json
 
 
 class ArticleViewSet(viewsets.ViewSet):
+    # number of rows fetched from the database at a time by the export
+    export_chunk_size = 2000
+    # most articles get_similar_batch will take in one request
+    max_similar_batch_size = 100
+    # most similar articles that can be asked for with numResults
+    max_similar_results = 100
 
     # /api/article<optional query params>
     # gets multiple articles along with some filtering
@@ -31,44 +36,71 @@ class ArticleViewSet(viewsets.ViewSet):
     #   7. minSubjectivity - only return articles with subjectivity greater than or equal to this value
     #   8. maxSubjectivity - only return articles with subjectivity less than or equal to this value
     #   9. topicName - only return articles with this topic
-    #  10. order - Must be 'new' or 'old'. This determines if the results will be ordered from
+    #  10. order - Must be 'new', 'old' or 'relevance'. This determines if the results will be ordered from
     #              newest to oldest or oldest to newest. Default from newest to oldest.
+    #              'relevance' orders by how well the headline matches headlineSearch (postgres only,
+    #              other databases and cursor pagination order by newest)
     #  11. headlineLike - return articles with a headline like this (case insensitive)
+    #  12. headlineSearch - full text search on the headline, backed by an index on postgres.
+    #              Supports quoted phrases, "or" and -word to exclude a word
+    #
+    # sparse fieldsets, only the columns needed are read from the database:
+    #   fields - comma separated list of fields to return, e.g. fields=id,headline,nlp
+    #   exclude - comma separated list of fields to leave out, e.g. exclude=content
+    #   summary - return a 'summary' with the first N characters of the content instead of the content
+    #
+    # pagination, if neither is given all articles are returned:
+    #   page - page number, the response includes total_pages
+    #   cursor - keyset pagination, leave it empty for the first page then pass the next_cursor
+    #            from the previous response. Deep pages are as cheap as the first page since
+    #            there is no COUNT(*) or OFFSET. Articles with no publish date are left out.
+    #
+    # responses are cached until the article data changes, see cache.py
+    @cached_response('article_list')
     def list(self, request):
-        article_queryset = Article.objects.all().order_by('-date_published')
+        article_queryset = self.get_article_queryset().order_by('-date_published')
 
         query_params = request.query_params
 
+        try:
+            fields, summary_length = get_feed_fields(query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         # any filtering will be provided as query parameters
         article_queryset = self.filter_articles(article_queryset, query_params)
 
+        # join the NLP and topic name onto each article so the feed is a single query,
+        # or no join at all when reading from the ArticleFeed read model
+        feed_queryset = get_article_feed(article_queryset, fields, summary_length)
+
         # apply pagination
-        data_for_serializer = article_queryset
+        data_for_serializer = feed_queryset
         total_pages = 1
         page_no = 1
-
-        if 'page' in query_params:
+        next_cursor = None
+
+        if 'cursor' in query_params:
+            paginator = ArticleCursorPagination()
+            newest_first = query_params.get('order') != 'old'
+            data_for_serializer = paginator.paginate_queryset(feed_queryset, request, newest_first)
+            next_cursor = paginator.next_cursor
+        elif 'page' in query_params:
             paginator = PageNumberPagination()
-            data_for_serializer = paginator.paginate_queryset(article_queryset, request)
+            data_for_serializer = paginator.paginate_queryset(feed_queryset, request)
             total_pages = paginator.page.paginator.num_pages
             page_no = paginator.page.number
-            
-        
-        article_serializer = ArticleSerializer(data_for_serializer, many=True)
-        
-        response_data = article_serializer.data
 
-        # this seems ineffecient - has to do N queries where N is the number of articles 
-        # in the database. Need to find a better way to do this. Ideally have one query
-        # for articles and one for NLP, then find a way to combine them. Or one query that 
-        # joins article with article_nlp and construct the response myself without serializers
-        for article in response_data:
-            nlp_queryset = ArticleNlp.objects.filter(article_id=article['id'])
-            article_nlp = nlp_queryset.first()
-            article['nlp'] = get_article_nlp(article_nlp)
+        feed_serializer = ArticleFeedSerializer(data_for_serializer, many=True, response_fields=fields)
+        response_data = feed_serializer.data
 
         # need to do this check again so the final repsonse can be formatted
-        if 'page' in query_params:
+        if 'cursor' in query_params:
+            response_data = {
+                'next_cursor': next_cursor,
+                'articles': response_data
+            }
+        elif 'page' in query_params:
             response_data = {
                 'page': page_no,
                 'total_pages': total_pages,
@@ -77,8 +109,20 @@ class ArticleViewSet(viewsets.ViewSet):
 
         return Response(response_data)
 
+    # articles for the list endpoints, from the ArticleFeed read model if it's turned on
+    # (NEWS_READ_FROM_FEED setting) since it doesn't need any joins
+    def get_article_queryset(self):
+        if read_from_feed():
+            return ArticleFeed.objects.all()
+
+        return Article.objects.all()
+
     # applies filtering to articles based on query params provided
+    # works on both Article and ArticleFeed querysets
     def filter_articles(self, article_queryset, query_params):
+        # ArticleFeed has the NLP columns itself, Article has to go through the articlenlp relation
+        nlp = '' if article_queryset.model is ArticleFeed else 'articlenlp__'
+
         if query_params.get('publisher'):
             article_queryset = article_queryset.filter(publisher=query_params.get('publisher'))
 
@@ -89,8 +133,12 @@ class ArticleViewSet(viewsets.ViewSet):
         if query_params.get('endDate'):
             article_queryset = article_queryset.filter(date_published__lte=query_params.get('endDate'))
 
+        # the NLP filters are collected and applied in a single filter() call so they share one
+        # join to news_articlenlp. Chaining filter() on a reverse relation adds a new join each time
+        nlp_filters = {}
+
         if query_params.get('topic'):
-            article_queryset = article_queryset.filter(articlenlp__topic=query_params.get('topic'))
+            nlp_filters[f'{nlp}topic'] = query_params.get('topic')
 
         # will only filter on topic or topic_name, not both. If both are supplied, it will only filter on topic
         if query_params.get('topicName') and not query_params.get('topic'):
@@ -98,23 +146,30 @@ class ArticleViewSet(viewsets.ViewSet):
             
             # if an invalid topic name was given, don't do any filtering
             if topic:
-                article_queryset = article_queryset.filter(articlenlp__topic=topic.topic_id)
+                nlp_filters[f'{nlp}topic'] = topic.topic_id
 
         if query_params.get('minSentiment'):
-            article_queryset = article_queryset.filter(articlenlp__sentiment__gte=query_params.get('minSentiment'))
+            nlp_filters[f'{nlp}sentiment__gte'] = query_params.get('minSentiment')
 
         if query_params.get('maxSentiment'):
-            article_queryset = article_queryset.filter(articlenlp__sentiment__lte=query_params.get('maxSentiment'))
+            nlp_filters[f'{nlp}sentiment__lte'] = query_params.get('maxSentiment')
 
         if query_params.get('minSubjectivity'):
-            article_queryset = article_queryset.filter(articlenlp__subjectivity__gte=query_params.get('minSubjectivity'))
+            nlp_filters[f'{nlp}subjectivity__gte'] = query_params.get('minSubjectivity')
 
         if query_params.get('maxSubjectivity'):
-            article_queryset = article_queryset.filter(articlenlp__subjectivity__lte=query_params.get('maxSubjectivity'))
+            nlp_filters[f'{nlp}subjectivity__lte'] = query_params.get('maxSubjectivity')
+
+        if nlp_filters:
+            article_queryset = article_queryset.filter(**nlp_filters)
 
         if query_params.get('headlineLike'):
             article_queryset = article_queryset.filter(headline__icontains=query_params.get('headlineLike'))
 
+        if query_params.get('headlineSearch'):
+            rank = query_params.get('order') == 'relevance'
+            article_queryset = search_headlines(article_queryset, query_params.get('headlineSearch'), rank)
+
         if query_params.get('order'):
             # only need to handle case for sorting oldest to newest since it sorts by newest by default
             if query_params.get('order') == 'old':
@@ -122,11 +177,59 @@ class ArticleViewSet(viewsets.ViewSet):
 
         return article_queryset
 
+    # /api/article/export<optional query params>
+    # streams every article as newline delimited JSON (one article per line), ordered by id.
+    # Use this instead of /api/article without pagination to pull the whole corpus, the rows
+    # are read from a single query in chunks (a server-side cursor on postgres) and written out
+    # as they come, so memory use doesn't grow with the number of articles.
+    #
+    # optional query params:
+    #   the same filters as /api/article, plus fields, exclude and summary (order is ignored)
+    #   afterId - only export articles with an id greater than this, pass the id of the last
+    #             line received to resume an export that was cut off
+    @action(methods=['GET'], detail=False)
+    def export(self, request):
+        query_params = request.query_params
+
+        try:
+            fields, summary_length = get_feed_fields(query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        article_queryset = self.filter_articles(self.get_article_queryset(), query_params)
+
+        if query_params.get('afterId'):
+            if not query_params.get('afterId').isnumeric():
+                return Response({'error': 'afterId must be an article id'}, status=status.HTTP_400_BAD_REQUEST)
+
+            article_queryset = article_queryset.filter(pk__gt=int(query_params.get('afterId')))
+
+        # ordering by the primary key keeps the export stable so afterId can resume it
+        feed_queryset = get_article_feed(article_queryset.order_by('pk'), fields, summary_length)
+        rows = feed_queryset.iterator(chunk_size=self.export_chunk_size)
+
+        return StreamingHttpResponse(self.stream_ndjson(rows, fields), content_type='application/x-ndjson')
+
+    # serializes feed rows one at a time as lines of JSON
+    def stream_ndjson(self, rows, fields: list):
+        feed_serializer = ArticleFeedSerializer(response_fields=fields)
+
+        for row in rows:
+            yield json.dumps(feed_serializer.to_representation(row), cls=JSONEncoder) + '\n'
+
     # /api/article/<article id>
     # gets a specific news article
     def retrieve(self, request, pk=None):
         response_data = {}
 
+        # the read model has everything in one row, if the article isn't in it fall through
+        # to the tables so missing articles/NLP get the same responses as before
+        if read_from_feed():
+            feed_row = get_article_feed(ArticleFeed.objects.filter(pk=pk)).first()
+
+            if feed_row:
+                return Response(ArticleFeedSerializer(feed_row).data)
+
         # queries for article and NLP
         article_queryset = Article.objects.filter(pk=pk)
         nlp_queryset = ArticleNlp.objects.filter(article_id=pk)
@@ -149,53 +252,47 @@ class ArticleViewSet(viewsets.ViewSet):
         
         return Response(response_data)
 
-    # cleans headline text by tokenizing it and removing stopwords and punctuation
-    def clean_headline(self, headline: str):
-        stop_words = set(stopwords.words('english'))
-        return [word for word in nltk.word_tokenize(headline) if word not in stop_words and word not in string.punctuation]
-
-    # given a list of tags, lookup the headline in the tag_lookup object
-    def get_headlines_by_tags(self, tags):
-        # load the tag lookup
-        with open(os.path.join(settings.STATIC_ROOT, 'tag_lookup.pickle'), 'rb') as f:
-            tag_lookup = pickle.load(f)
-
-        headlines = []
-
-        for tag in tags:
-            headlines.append(tag_lookup[tag])
-
-        return headlines
+    # get the articles with their NLP for a list of article IDs from one query, keeping the order of the IDs
+    def get_articles_by_ids(self, article_ids: list) -> list:
+        feed_queryset = get_article_feed(self.get_article_queryset().filter(pk__in=article_ids))
+        rows = {row['id']: row for row in feed_queryset}
 
-    # given a list of headlines, find the articles in the database and return a list of Article objects
-    def get_articles_by_headlines(self, headlines: list):
-        articles = []
+        return ArticleFeedSerializer([rows[i] for i in article_ids if i in rows], many=True).data
 
-        for h in headlines:
-            article = Article.objects.filter(headline=h).first()
+    # get up to num_results similar article IDs for each (article ID, headline), most similar first.
+    # Stored neighbours are read in one query, articles without enough stored neighbours are
+    # searched for together
+    def get_similar_article_ids(self, articles: list, num_results: int) -> dict:
+        similar_ids = get_stored_similar_article_ids([article_id for article_id, _ in articles], num_results)
+        missing = [article for article in articles if len(similar_ids.get(article[0], [])) < num_results]
 
-            # serialize the article and get the NLP for it
-            article_data = ArticleSerializer(article).data
-            article_nlp = ArticleNlp.objects.filter(article_id=article.id).first()
-            article_data['nlp'] = get_article_nlp(article_nlp)
+        if missing:
+            for (article_id, _), similar in zip(missing, find_similar_articles(missing, num_results)):
+                similar_ids[article_id] = [similar_id for similar_id, _ in similar]
 
-            articles.append(article_data)
-
-        return articles
+        return similar_ids
 
     # /api/article/<article ID>/get_similar
     # optional query param: numResults - number of articles to return
+    #
+    # the neighbours are read from the SimilarArticle table (manage.py compute_similar_articles),
+    # they are only searched for if the article doesn't have enough stored neighbours
     @action(methods=['GET'], detail=True)
     def get_similar(self, request, pk):
         # check for query params, number of results defaults to 10
-        # have to put 11 here since the first result is the same article, using 11 will give 10 similar articles
-        num_results = 11
+        num_results = 10
 
-        if request.query_params.get('numResults') and request.query_params.get('numResults').isnumeric():
-            num_results = int(request.query_params.get('numResults')) + 1 # need to add one since the first result is always the same article
+        if request.query_params.get('numResults'):
+            try:
+                num_results = int(request.query_params.get('numResults'))
+            except ValueError:
+                num_results = 0
 
-        # load the doc2vec model
-        model = Doc2Vec.load(os.path.join(settings.STATIC_ROOT, 'headline_model'))
+        if not 1 <= num_results <= self.max_similar_results:
+            return Response(
+                {'error': f'numResults must be an integer from 1 to {self.max_similar_results}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         # retrieve the headline from the database, return error if the pk doesn't exist
         article = Article.objects.filter(pk=pk).first()
@@ -203,21 +300,91 @@ class ArticleViewSet(viewsets.ViewSet):
         if not article:
             return Response({'error': 'article does not exist'})
 
-        headline = article.headline
+        article_ids = self.get_similar_article_ids([(article.id, article.headline)], num_results).get(article.id, [])
+
+        # get the articles for the response, most similar first
+        similar_articles = self.get_articles_by_ids(article_ids)
+
+        return Response(similar_articles)
+
+    # POST /api/article/get_similar_batch
+    # similar articles for many articles in one call, e.g. every article on a page
+    # body of request must be:
+    #   {"articleIds": [<article id>, ...], "numResults": <optional, number of similar articles per article, default 10>}
+    #
+    # response has an entry for each article ID in the same order:
+    # [
+    #   {"article_id": <article id>, "similar": [<article>, ...]},
+    #   {"article_id": <article id that doesn't exist>, "error": "article does not exist"},
+    #   ...
+    # ]
+    @action(methods=['POST'], detail=False)
+    def get_similar_batch(self, request):
+        article_ids = request.data.get('articleIds')
+        num_results = request.data.get('numResults', 10)
+
+        if type(article_ids) != list or not article_ids or any(type(article_id) != int for article_id in article_ids):
+            return Response({'error': 'articleIds must be a list of article ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(article_ids) > self.max_similar_batch_size:
+            return Response(
+                {'error': f'at most {self.max_similar_batch_size} articleIds can be given'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # find the top n most similar articles
-        clean_headline = self.clean_headline(headline)
-        similar = model.docvecs.most_similar(positive=[model.infer_vector(clean_headline)],topn=num_results)
+        if type(num_results) != int or not 1 <= num_results <= self.max_similar_results:
+            return Response(
+                {'error': f'numResults must be an integer from 1 to {self.max_similar_results}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # remove the first item since it is the same headline
-        similar.pop(0)
+        headlines = dict(Article.objects.filter(pk__in=article_ids).values_list('id', 'headline'))
+        similar_ids = self.get_similar_article_ids(list(headlines.items()), num_results)
 
-        # similar is a list of tuples of the form (tag, % similarity), we only need the tag
-        tags = [tag[0] for tag in similar]
-        headlines = self.get_headlines_by_tags(tags)
+        # every similar article for the whole batch is read in one query
+        all_similar_ids = list({similar_id for ids in similar_ids.values() for similar_id in ids})
+        similar_articles = {article['id']: article for article in self.get_articles_by_ids(all_similar_ids)}
 
-        # get the article objects for response
-        similar_articles = self.get_articles_by_headlines(headlines)
+        response_data = []
+
+        for article_id in article_ids:
+            if article_id not in headlines:
+                response_data.append({'article_id': article_id, 'error': 'article does not exist'})
+                continue
+
+            response_data.append({
+                'article_id': article_id,
+                'similar': [similar_articles[i] for i in similar_ids[article_id] if i in similar_articles]
+            })
+
+        return Response(response_data)
+
+    # POST /api/article/get_similar_to_text
+    # find the stored articles most similar to any text, e.g. a headline from somewhere else
+    # body of request must be:
+    #   {"text": "<text data>", "numResults": <optional, number of articles to return, default 10>}
+    #
+    # the vector inferred for the text is cached, see inferred_vectors in /api/article/cache_stats
+    @action(methods=['POST'], detail=False)
+    def get_similar_to_text(self, request):
+        # request body must contain "text"
+        if 'text' not in request.data:
+            return Response({'error': 'must supply text'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # "text" must be a string
+        if type(request.data['text']) != str or not request.data['text'].strip():
+            return Response({'error': 'text must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+
+        num_results = request.data.get('numResults', 10)
+
+        if type(num_results) != int or not 1 <= num_results <= self.max_similar_results:
+            return Response(
+                {'error': f'numResults must be an integer from 1 to {self.max_similar_results}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        similar = infer_similar_articles(request.data['text'], num_results)
+        similar_articles = self.get_articles_by_ids([article_id for article_id, _ in similar])
 
         return Response(similar_articles)
 
@@ -251,6 +418,7 @@ class ArticleViewSet(viewsets.ViewSet):
     #
     # If not query param specified, it will count all the articles.
     @action(methods=['GET'], detail=False)
+    @cached_response('count_by_sentiment')
     def count_by_sentiment(self, request):
         articles = Article.objects.all()
         query_params = request.query_params
@@ -273,6 +441,7 @@ class ArticleViewSet(viewsets.ViewSet):
     #              this specifies whether the count should be for articles from the past day, week, etc.
     # TODO: allow this to be filtered by topic
     @action(methods=['GET'], detail=False)
+    @cached_response('subjectivity_by_sentiment')
     def subjectivity_by_sentiment(self, request):
         articles = Article.objects.all()
         query_params = request.query_params
@@ -297,6 +466,7 @@ class ArticleViewSet(viewsets.ViewSet):
     #   ...
     # }
     @action(methods=['GET'], detail=False)
+    @cached_response('count_by_topic_date')
     def count_by_topic_date(self, request):
         query_params = request.query_params
         timeframe = query_params.get('timeFrame')
@@ -308,6 +478,7 @@ class ArticleViewSet(viewsets.ViewSet):
     # /api/article/publishers
     # list all publishers that exist in the database
     @action(methods=['GET'], detail=False)
+    @cached_response('publishers')
     def publishers(self, request):
         publisher_queryset = Article.objects.values('publisher').distinct()
         
@@ -321,3 +492,23 @@ class ArticleViewSet(viewsets.ViewSet):
 
         return Response(res)
 
+    # /api/article/cache_stats
+    # hit/miss counts of the response cache and the inferred vector cache for this server process
+    # response looks like this:
+    # {
+    #   "enabled": true,
+    #   "hits": <count>,
+    #   "misses": <count>,
+    #   "hit_rate": <hits / (hits + misses)>,
+    #   "endpoints": {
+    #       "<endpoint>": {"hits": <count>, "misses": <count>},
+    #       ...
+    #   },
+    #   "inferred_vectors": {"size": <count>, "maxsize": <count>, "hits": <count>, "misses": <count>, "hit_rate": <rate>}
+    # }
+    @action(methods=['GET'], detail=False)
+    def cache_stats(self, request):
+        stats = get_cache_stats()
+        stats['inferred_vectors'] = inferred_vectors.get_stats()
+
+        return Response(stats)
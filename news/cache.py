@@ -0,0 +1,149 @@
+# Response cache for the read-only article/analytics endpoints.
+#
+# Responses are stored in the Django cache named by the NEWS_RESPONSE_CACHE setting (a local
+# memory cache with LRU eviction by default, see CACHES in settings.py). The key is the endpoint,
+# the normalized query params and the current 'articles' data version. The version is bumped
+# whenever articles, their NLP or topics change, so old entries are never read again and just
+# fall out of the LRU.
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.response import Response
+from .models import DataVersion, TopicLkp
+from functools import wraps
+from hashlib import sha1
+from threading import Lock
+from urllib.parse import urlencode
+
+ARTICLES_DATA_VERSION = 'articles'
+TOPICS_DATA_VERSION = 'topics'
+
+# hit/miss counters for this process, key is the endpoint name
+_stats = {}
+_stats_lock = Lock()
+
+# (version, {topic_id: topic_name}) for this process, see get_topic_names
+_topic_names = (None, {})
+
+
+def cache_enabled() -> bool:
+    return getattr(settings, 'NEWS_RESPONSE_CACHE', None) is not None
+
+def get_response_cache():
+    return caches[settings.NEWS_RESPONSE_CACHE]
+
+def get_data_version(name: str = ARTICLES_DATA_VERSION) -> str:
+    """
+    Get the current version of a set of data. This is read from the database on every
+    request so all worker processes see a write as soon as it's committed.
+
+    The time of the last bump is part of the version. The counter alone can repeat after
+    a rolled back transaction, which would let a different set of data reuse old entries.
+    """
+    version = DataVersion.objects.filter(name=name).values_list('version', 'updated').first()
+
+    if not version:
+        return '0'
+
+    return f'{version[0]}.{version[1].timestamp()}'
+
+def bump_data_version(name: str = ARTICLES_DATA_VERSION):
+    # invalidates every cached response built from this data
+    now = timezone.now()
+    updated = DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated=now)
+
+    if not updated:
+        DataVersion.objects.get_or_create(name=name, defaults={'version': 1, 'updated': now})
+
+def get_cache_key(endpoint: str, query_params, view_kwargs: dict, version: str) -> str:
+    # sort the params so the same query in a different order hits the same entry. The values of a
+    # repeated param keep their order, the views read the last one
+    params = sorted((key, query_params.getlist(key)) for key in query_params)
+    params += sorted((f'view:{key}', [str(value)]) for key, value in view_kwargs.items())
+    params_hash = sha1(urlencode(params, doseq=True).encode()).hexdigest()
+
+    return f'news:{endpoint}:{version}:{params_hash}'
+
+def record(endpoint: str, hit: bool):
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {'hits': 0, 'misses': 0})
+        stats['hits' if hit else 'misses'] += 1
+
+def get_cache_stats() -> dict:
+    """
+    Hit/miss counters for this process.
+
+    Returns:
+        dict: total hits, misses and hit rate plus the same counts for each endpoint
+    """
+    with _stats_lock:
+        endpoints = {name: dict(stats) for name, stats in _stats.items()}
+
+    hits = sum(stats['hits'] for stats in endpoints.values())
+    misses = sum(stats['misses'] for stats in endpoints.values())
+
+    return {
+        'enabled': cache_enabled(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0,
+        'endpoints': endpoints
+    }
+
+def cached_response(endpoint: str):
+    """
+    Cache the data of successful responses from a view method until the article data changes.
+    The response has an X-Cache header that says whether it was a HIT or a MISS.
+    Put it below @action so the action wraps the cached method.
+
+    Args:
+        endpoint (str): name of the endpoint, used for the cache key and the stats
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if not cache_enabled():
+                return view_method(self, request, *args, **kwargs)
+
+            response_cache = get_response_cache()
+            key = get_cache_key(endpoint, request.query_params, kwargs, get_data_version())
+            data = response_cache.get(key)
+
+            if data is not None:
+                record(endpoint, hit=True)
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+
+                return response
+
+            record(endpoint, hit=False)
+            response = view_method(self, request, *args, **kwargs)
+
+            if response.status_code == 200:
+                response_cache.set(key, response.data, getattr(settings, 'NEWS_RESPONSE_CACHE_TIMEOUT', 300))
+
+            response['X-Cache'] = 'MISS'
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+def get_topic_names() -> dict:
+    """
+    Map of topic ID to topic name kept in memory. It's read again when the 'topics' data version
+    changes, so a renamed topic shows up in every process without querying TopicLkp per topic.
+
+    Returns:
+        dict: key is TopicLkp.topic_id, value is the topic name
+    """
+    global _topic_names
+
+    version = get_data_version(TOPICS_DATA_VERSION)
+
+    if version != _topic_names[0]:
+        _topic_names = (version, dict(TopicLkp.objects.values_list('topic_id', 'topic_name')))
+
+    return _topic_names[1]
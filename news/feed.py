@@ -0,0 +1,53 @@
+# Keeps the ArticleFeed read model in sync with Article, ArticleNlp and TopicLkp
+from django.conf import settings
+from django.db import transaction
+from .cache import bump_data_version
+from .models import Article, ArticleFeed
+from .utils import get_article_feed
+
+
+def read_from_feed() -> bool:
+    # the article endpoints read from ArticleFeed instead of joining the tables when this is on
+    return getattr(settings, 'NEWS_READ_FROM_FEED', False)
+
+def refresh_article_feed(article_ids: list):
+    """
+    Recompute the ArticleFeed rows for the given articles from Article, ArticleNlp and TopicLkp.
+    Articles that were deleted or don't have NLP yet are removed from the feed.
+
+    Args:
+        article_ids (list): IDs of the articles to refresh
+    """
+    articles = Article.objects.filter(id__in=article_ids, articlenlp__isnull=False)
+    feed_rows = {}
+
+    for row in get_article_feed(articles):
+        # keep the first NLP row if an article somehow has more than one
+        article_id = row.pop('id')
+        feed_rows.setdefault(article_id, ArticleFeed(article_id=article_id, **row))
+
+    with transaction.atomic():
+        ArticleFeed.objects.filter(article_id__in=article_ids).delete()
+        ArticleFeed.objects.bulk_create(feed_rows.values())
+
+def rebuild_article_feed(batch_size: int = 500) -> int:
+    """
+    Throw away the whole ArticleFeed table and build it again from scratch.
+
+    Args:
+        batch_size (int): number of articles to refresh at a time
+
+    Returns:
+        int: number of rows in the rebuilt feed
+    """
+    article_ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+
+    with transaction.atomic():
+        ArticleFeed.objects.all().delete()
+
+        for start in range(0, len(article_ids), batch_size):
+            refresh_article_feed(article_ids[start:start + batch_size])
+
+        bump_data_version()
+
+    return ArticleFeed.objects.count()
@@ -0,0 +1,214 @@
+# Bulk loading of new articles with their NLP, used by the ingest_articles management command.
+#
+# Rows are read from the input a batch at a time, the sentiment, keywords and topic of each batch
+# are scored in the analysis worker pool (see analysis_pool.py) and the batch is written with
+# bulk_create in one transaction. bulk_create doesn't send the signals that keep the feed and the
+# response cache in sync, so the feed rows are refreshed here and the data version is bumped at the end.
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .analysis_pool import analyze_texts
+from .cache import bump_data_version
+from .feed import refresh_article_feed
+from .models import Article, ArticleNlp, TopicLkp
+from .nlp import ANALYSES
+from .sentiment import TEXTBLOB
+from datetime import datetime
+import csv
+import json
+
+ARTICLE_FIELDS = ('post_id', 'post_title', 'url', 'score', 'publisher', 'headline', 'date_published', 'content')
+REQUIRED_FIELDS = ('url', 'headline', 'content')
+# fields that must be strings, JSON can have any type and TextBlob fails on anything else
+TEXT_FIELDS = ('post_id', 'post_title', 'url', 'publisher', 'headline', 'content')
+FILE_FORMATS = ('jsonl', 'csv')
+
+# ArticleNlp.keywords holds the keywords separated by semicolons
+KEYWORD_SEPARATOR = ';'
+
+
+def read_rows(file, file_format: str):
+    """
+    Args:
+        file: open text file
+        file_format (str): 'jsonl' for one JSON object per line, or 'csv' with a header row
+
+    Returns:
+        generator: (line number, row) for each row, the row is a dict of field name to value for
+                   CSV and the line for JSONL, it's decoded by parse_article so a bad line is skipped
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(file)
+
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                yield line_number, line
+
+def parse_date_published(value: str) -> datetime:
+    date_published = parse_datetime(value)
+
+    if date_published is None:
+        date = parse_date(value)
+
+        if date is None:
+            raise ValueError(f'date_published is not a date: {value}')
+
+        date_published = datetime(date.year, date.month, date.day)
+
+    return date_published if timezone.is_aware(date_published) else timezone.make_aware(date_published)
+
+def parse_article(row) -> Article:
+    """
+    Args:
+        row: dict of field name to value or a JSON object, fields that aren't Article fields are ignored
+
+    Raises:
+        ValueError: if the row isn't a JSON object, a required field is missing, a text field isn't a string
+                    or a value doesn't fit its column
+
+    Returns:
+        Article: unsaved article
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object of field names to values')
+
+    fields = {name: row.get(name) for name in ARTICLE_FIELDS if row.get(name) not in (None, '')}
+
+    for name in REQUIRED_FIELDS:
+        if name not in fields:
+            raise ValueError(f'missing {name}')
+
+    for name in TEXT_FIELDS:
+        if name in fields and not isinstance(fields[name], str):
+            raise ValueError(f'{name} must be a string')
+
+    # the title is usually the headline
+    fields.setdefault('post_title', fields['headline'])
+
+    if 'score' in fields:
+        fields['score'] = int(fields['score'])
+
+    if 'date_published' in fields:
+        fields['date_published'] = parse_date_published(fields['date_published'])
+
+    for name, value in fields.items():
+        max_length = Article._meta.get_field(name).max_length
+
+        if max_length and len(str(value)) > max_length:
+            raise ValueError(f'{name} is longer than {max_length} characters')
+
+    return Article(**fields)
+
+def score_articles(articles: list, topic_ids: set, sentiment_engine: str = TEXTBLOB, num_workers: int = None) -> list:
+    """
+    Score the sentiment, keywords and topic of each article's content in the analysis worker pool.
+
+    Args:
+        articles (list): unsaved articles
+        topic_ids (set): topic IDs in TopicLkp
+        sentiment_engine (str): 'textblob' or 'lexicon', see sentiment.py
+        num_workers (int): worker processes to use, defaults to NEWS_ANALYSIS_WORKERS
+
+    Raises:
+        ValueError: if an article's topic isn't in TopicLkp
+
+    Returns:
+        list: unsaved ArticleNlp for each article, without the article set
+    """
+    results = analyze_texts([article.content for article in articles], ANALYSES, sentiment_engine, num_workers)
+    nlp_rows = []
+
+    for result in results:
+        # the most likely topic, gensim always gives at least one
+        topic_id, _ = max(result['topics'], key=lambda topic: topic[1])
+
+        if topic_id not in topic_ids:
+            raise ValueError(f'topic {topic_id} is not in TopicLkp')
+
+        nlp_rows.append(ArticleNlp(
+            topic_id=topic_id,
+            sentiment=round(result['sentiment']['sentiment'], 3),
+            subjectivity=round(result['sentiment']['subjectivity'], 3),
+            keywords=KEYWORD_SEPARATOR.join(result['keywords'])[:ArticleNlp._meta.get_field('keywords').max_length]
+        ))
+
+    return nlp_rows
+
+def write_articles(articles: list, nlp_rows: list):
+    # writes a batch of articles and their NLP in one transaction and adds them to the feed
+    with transaction.atomic():
+        Article.objects.bulk_create(articles)
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # databases that can't return the new IDs (e.g. SQLite) write one transaction at a
+            # time, so the new articles are the ones with the highest IDs
+            article_ids = Article.objects.order_by('-id').values_list('id', flat=True)[:len(articles)]
+
+            for article, article_id in zip(articles, reversed(list(article_ids))):
+                article.id = article_id
+
+        for article, nlp in zip(articles, nlp_rows):
+            nlp.article_id = article.id
+
+        ArticleNlp.objects.bulk_create(nlp_rows)
+        refresh_article_feed([article.id for article in articles])
+
+def ingest_articles(rows, batch_size: int = 1000, sentiment_engine: str = TEXTBLOB, num_workers: int = None,
+                    on_invalid_row=None, on_batch=None) -> dict:
+    """
+    Score and write articles a batch at a time.
+
+    Args:
+        rows: iterable of (line number, row), e.g. from read_rows, see parse_article for the rows
+        batch_size (int): number of articles to score and write at a time
+        sentiment_engine (str): 'textblob' or 'lexicon', see sentiment.py
+        num_workers (int): worker processes used to score the articles, defaults to NEWS_ANALYSIS_WORKERS
+        on_invalid_row (callable): called with the line number and error of rows that are skipped
+        on_batch (callable): called with the number of articles written so far after each batch
+
+    Raises:
+        ValueError: if an article's topic isn't in TopicLkp, the batches before it are kept
+
+    Returns:
+        dict: number of articles 'ingested' and invalid rows 'skipped'
+    """
+    topic_ids = set(TopicLkp.objects.values_list('topic_id', flat=True))
+    stats = {'ingested': 0, 'skipped': 0}
+    batch = []
+
+    def write_batch():
+        write_articles(batch, score_articles(batch, topic_ids, sentiment_engine, num_workers))
+        stats['ingested'] += len(batch)
+        batch.clear()
+
+        if on_batch:
+            on_batch(stats['ingested'])
+
+    for line_number, row in rows:
+        try:
+            batch.append(parse_article(row))
+        except (ValueError, TypeError) as e:
+            stats['skipped'] += 1
+
+            if on_invalid_row:
+                on_invalid_row(line_number, e)
+
+            continue
+
+        if len(batch) >= batch_size:
+            write_batch()
+
+    if batch:
+        write_batch()
+
+    # the cached responses are built from the article data
+    if stats['ingested']:
+        bump_data_version()
+
+    return stats
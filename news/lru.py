@@ -0,0 +1,65 @@
+# Small thread safe LRU cache for values that are expensive to compute, e.g. inferred vectors
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """
+    Keeps the maxsize most recently used values in memory for this process and counts hits
+    and misses so the hit rate can be reported.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._data.move_to_end(key)
+
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            # drop the least recently used values
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> dict:
+        """
+        Returns:
+            dict: current size, maxsize, hits, misses and the hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0
+            }
@@ -0,0 +1,115 @@
+from django.core.management.base import BaseCommand, CommandError
+from news.nlp import find_keywords
+from nltk.corpus import stopwords
+from nltk.tokenize import sent_tokenize, word_tokenize
+import math
+import random
+import statistics
+import time
+
+WORDS = [
+    'the', 'a', 'of', 'and', 'to', 'in', 'is', 'was', 'said', 'for', 'on', 'with', 'that', 'by', 'it',
+    'market', 'election', 'storm', 'vaccine', 'court', 'team', 'rates', 'senate', 'wildfire', 'startup',
+    'climate', 'border', 'trial', 'budget', 'strike', 'merger', 'playoffs', 'launch', 'protest', 'study',
+    'Reuters', 'Tuesday', 'officials', 'percent', 'government', 'company', 'million', 'people', 'report'
+]
+
+
+def find_keywords_reference(content: str) -> list:
+    """
+    The original AnalysisView.find_keywords, kept to check that nlp.find_keywords gives the same
+    keywords and to measure the speedup. Don't use it for anything else, it's quadratic in the
+    number of unique terms and rebuilds the stopword list for every token.
+    """
+    sentences = sent_tokenize(content)
+    tokens = []
+
+    for sent in sentences:
+        tokens += word_tokenize(sent)
+
+    tokens = [t for t in tokens if t.lower() not in stopwords.words('english') and len(t) >= 3 and t.lower() != 'said']
+
+    unique_terms = []
+
+    for token in tokens:
+        if token not in unique_terms:
+            unique_terms.append(token)
+
+    term_counts = {term: 0 for term in unique_terms}
+
+    for token in tokens:
+        term_counts[token] += 1
+
+    term_freqs = {term: term_counts[term] / len(tokens) for term in unique_terms}
+
+    sentences = [word_tokenize(sent) for sent in sent_tokenize(content)]
+    sentence_freqs = {term: 0 for term in unique_terms}
+
+    for term in unique_terms:
+        for sent in sentences:
+            if term in sent:
+                sentence_freqs[term] += 1
+
+    idf = {}
+
+    for term in unique_terms:
+        term_val = 0
+
+        if sentence_freqs[term] != 0:
+            term_val = math.log(len(sentences) / sentence_freqs[term])
+
+        idf[term] = term_val
+
+    tfidf_scores = {term: term_freqs[term] * idf[term] for term in unique_terms}
+    top_ten = sorted((score, term) for term, score in tfidf_scores.items())[-1:-11:-1]
+
+    return [item[1] for item in top_ten]
+
+def generate_article(num_sentences: int, rng: random.Random) -> str:
+    # long articles with a growing vocabulary, so there are many unique terms like a real article
+    sentences = []
+
+    for i in range(num_sentences):
+        words = [rng.choice(WORDS) if rng.random() < 0.7 else f'term{rng.randrange(num_sentences * 2)}' for _ in range(20)]
+        sentences.append(' '.join(words).capitalize() + '.')
+
+    return ' '.join(sentences)
+
+
+class Command(BaseCommand):
+    help = 'Compare the speed of the keyword extractor with the original implementation on long synthetic articles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sentences', type=int, nargs='+', default=[50, 200, 800],
+            help='article lengths to benchmark, in sentences'
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per article')
+        parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic articles')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f'{"sentences":>10}{"words":>10}{"original ms":>14}{"new ms":>10}{"speedup":>10}')
+
+        for num_sentences in options['sentences']:
+            article = generate_article(num_sentences, rng)
+
+            if find_keywords(article) != find_keywords_reference(article):
+                raise CommandError(f'keywords differ from the original implementation for {num_sentences} sentences')
+
+            original = self.time(find_keywords_reference, article, options['repeat'])
+            new = self.time(find_keywords, article, options['repeat'])
+
+            self.stdout.write(
+                f'{num_sentences:>10}{len(article.split()):>10}{original:>14.1f}{new:>10.1f}{original / new:>9.1f}x'
+            )
+
+    def time(self, function, article: str, repeat: int) -> float:
+        timings = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(article)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return statistics.median(timings)
@@ -0,0 +1,212 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+)
+from django.utils import timezone
+from rest_framework.test import APIClient
+from news.feed import rebuild_article_feed
+from news.models import Article, ArticleFeed, ArticleNlp, TopicLkp
+from datetime import timedelta
+import random
+import statistics
+import time
+
+PUBLISHERS = [f'publisher {i}' for i in range(25)]
+NUM_TOPICS = 10
+WORDS = [
+    'market', 'election', 'storm', 'vaccine', 'court', 'team', 'rates', 'senate', 'wildfire', 'startup',
+    'climate', 'border', 'trial', 'budget', 'strike', 'merger', 'playoffs', 'launch', 'protest', 'study'
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large synthetic corpus into a throwaway test database, then report the query plan '
+        'and latency of each article endpoint before and after the filter indexes are created.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=100000, help='number of synthetic articles to seed')
+        parser.add_argument('--repeat', type=int, default=5, help='number of timed requests per endpoint')
+        parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic corpus')
+        parser.add_argument('--no-plans', action='store_true', help="don't print the query plans")
+        parser.add_argument(
+            '--noinput', action='store_false', dest='interactive',
+            help='destroy an existing test database without asking'
+        )
+
+    def handle(self, *args, **options):
+        self.verbose = options['verbosity'] > 0
+        old_name = connection.settings_dict['NAME']
+
+        # everything runs against the test database, never against real data. DEBUG is turned off
+        # so the timed requests don't pay for query logging, and the response cache is turned off so
+        # every timed request reaches the database
+        setup_test_environment(debug=False)
+        no_response_cache = override_settings(NEWS_RESPONSE_CACHE=None)
+        no_response_cache.enable()
+        connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'], serialize=False)
+
+        try:
+            self.seed(options['articles'], random.Random(options['seed']))
+            indexes = self.get_filter_indexes()
+
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.remove_index(model, index)
+
+            self.log('running endpoints without indexes')
+            before = self.run_endpoints(options['repeat'])
+
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.add_index(model, index)
+
+            self.log('running endpoints with indexes')
+            after = self.run_endpoints(options['repeat'])
+
+            self.report(before, after, show_plans=not options['no_plans'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            no_response_cache.disable()
+            teardown_test_environment()
+
+    def log(self, message: str):
+        if self.verbose:
+            self.stderr.write(message)
+
+    def seed(self, num_articles: int, rng: random.Random, batch_size: int = 5000):
+        self.log(f'seeding {num_articles} articles')
+
+        TopicLkp.objects.bulk_create([
+            TopicLkp(topic_id=i, topic_name=f'topic {i}') for i in range(NUM_TOPICS)
+        ])
+
+        # publish dates are spread over the last three years so the timeframe filters hit a fraction of the rows
+        now = timezone.now()
+
+        for start in range(0, num_articles, batch_size):
+            Article.objects.bulk_create([
+                Article(
+                    post_id=f'{i}',
+                    post_title=f'post {i}',
+                    url=f'www.article.com/{i}',
+                    score=rng.randint(0, 1000),
+                    publisher=rng.choice(PUBLISHERS),
+                    headline=' '.join(rng.choice(WORDS) for _ in range(8)),
+                    date_published=now - timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60)),
+                    content=' '.join(rng.choice(WORDS) for _ in range(300))
+                )
+                for i in range(start, min(start + batch_size, num_articles))
+            ])
+
+        # bulk_create doesn't return ids on every backend, so read them back for the NLP rows
+        article_ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+
+        for start in range(0, len(article_ids), batch_size):
+            ArticleNlp.objects.bulk_create([
+                ArticleNlp(
+                    article_id=article_id,
+                    topic_id=rng.randrange(NUM_TOPICS),
+                    sentiment=round(rng.uniform(-1, 1), 3),
+                    subjectivity=round(rng.random(), 3),
+                    keywords=';'.join(rng.sample(WORDS, 10))
+                )
+                for article_id in article_ids[start:start + batch_size]
+            ])
+
+        # bulk_create doesn't send the signals that keep the read model in sync
+        rebuild_article_feed()
+
+    def get_filter_indexes(self) -> list:
+        return [(model, index) for model in (Article, ArticleNlp, ArticleFeed) for index in model._meta.indexes]
+
+    def get_endpoints(self) -> list:
+        deep_page = max(Article.objects.count() // 40, 1)
+        start_date = (timezone.now() - timedelta(days=60)).strftime('%Y-%m-%d')
+
+        return [
+            ('article list', '/api/article?page=1'),
+            ('article list deep page', f'/api/article?page={deep_page}'),
+            ('article list topic + sentiment', '/api/article?page=1&topic=1&minSentiment=0.1&maxSentiment=0.6'),
+            ('article list subjectivity', '/api/article?page=1&minSubjectivity=0.2&maxSubjectivity=0.3'),
+            ('article list publisher', f'/api/article?page=1&publisher={PUBLISHERS[0]}'),
+            ('article list date range', f'/api/article?page=1&startDate={start_date}'),
+            ('article list oldest first', '/api/article?page=1&order=old'),
+            ('article list headlineLike', '/api/article?page=1&headlineLike=wildfire'),
+            ('article list headlineSearch', '/api/article?page=1&headlineSearch=wildfire budget&order=relevance'),
+            ('article count for topic', '/api/article/get_article_count?topic=1'),
+            ('count_by_sentiment', '/api/article/count_by_sentiment?timeFrame=month'),
+            ('subjectivity_by_sentiment', '/api/article/subjectivity_by_sentiment?timeFrame=week'),
+            ('count_by_topic_date', '/api/article/count_by_topic_date?timeFrame=month'),
+            ('topic counts', '/api/topics/counts?timeFrame=year'),
+            ('publishers', '/api/article/publishers'),
+        ]
+
+    def run_endpoints(self, repeat: int) -> dict:
+        """
+        Request each endpoint repeatedly and record the median latency, the number of
+        queries and the plan of the slowest query.
+
+        Returns:
+            dict: key is the endpoint name, value is a dictionary with latency, queries and plan
+        """
+        client = APIClient()
+        results = {}
+
+        for name, url in self.get_endpoints():
+            # first request warms up the connection and caches, it also captures the SQL
+            with CaptureQueriesContext(connection) as captured:
+                client.get(url)
+
+            # read the captured queries now, every request clears the connection's query log
+            queries = captured.captured_queries
+
+            timings = []
+
+            for _ in range(repeat):
+                start = time.perf_counter()
+                client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            slowest = max(queries, key=lambda q: float(q['time']), default=None)
+
+            results[name] = {
+                'latency': statistics.median(timings),
+                'queries': len(queries),
+                'plan': self.explain(slowest['sql']) if slowest else ''
+            }
+
+        return results
+
+    def explain(self, sql: str) -> str:
+        if not sql.lstrip().lower().startswith('select'):
+            return ''
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            rows = cursor.fetchall()
+
+        # postgres returns one column per plan line, sqlite returns (id, parent, notused, detail)
+        return '\n'.join(str(row[-1]) for row in rows)
+
+    def report(self, before: dict, after: dict, show_plans: bool = True):
+        self.stdout.write(f'{"endpoint":<34}{"queries":>8}{"before ms":>12}{"after ms":>12}{"speedup":>10}')
+
+        for name in before:
+            speedup = before[name]['latency'] / max(after[name]['latency'], 1e-6)
+            self.stdout.write(
+                f'{name:<34}{after[name]["queries"]:>8}{before[name]["latency"]:>12.2f}'
+                f'{after[name]["latency"]:>12.2f}{speedup:>9.1f}x'
+            )
+
+        if not show_plans:
+            return
+
+        for name in before:
+            self.stdout.write(f'\n=== {name}')
+            self.stdout.write('--- before')
+            self.stdout.write(before[name]['plan'])
+            self.stdout.write('--- after')
+            self.stdout.write(after[name]['plan'])
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from news.vector_index import VectorIndex
+import numpy as np
+import statistics
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the latency of exact and approximate (LSH) search on the article vector index, '
+        'and the recall of the approximate search against the exact results.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='benchmark a clustered synthetic index with this many vectors instead of the built index'
+        )
+        parser.add_argument('--dim', type=int, default=100, help='vector size of the synthetic index')
+        parser.add_argument('--queries', type=int, default=200, help='number of queries')
+        parser.add_argument('--k', type=int, default=10, help='number of results per query')
+        parser.add_argument(
+            '--lsh-tables', type=int, nargs='+', default=[4, 8, 16],
+            help='LSH table counts to try, the hyperplanes are rebuilt in memory for each one'
+        )
+        parser.add_argument('--lsh-bits', type=int, default=10, help='hyperplanes per LSH table')
+        parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+
+        if options['synthetic']:
+            index = self.get_synthetic_index(options['synthetic'], options['dim'], rng)
+        else:
+            index = VectorIndex.load(settings.STATIC_ROOT)
+
+        # queries are indexed vectors with some noise, like an inferred vector of an indexed headline
+        rows = rng.choice(len(index), size=min(options['queries'], len(index)), replace=False)
+        queries = np.asarray(index.vectors[rows])
+        queries = queries + rng.normal(scale=0.1 / np.sqrt(queries.shape[1]), size=queries.shape).astype(np.float32)
+        k = options['k']
+
+        exact, exact_ms = self.run_queries(index, queries, k, approximate=False)
+        self.stdout.write(f'{len(index)} vectors, {len(queries)} queries, k={k}')
+        self.stdout.write(f'{"mode":<24}{"ms/query":>10}{"recall@k":>10}{"candidates":>12}')
+        self.stdout.write(f'{"exact":<24}{exact_ms:>10.3f}{1:>10.3f}{len(index):>12}')
+
+        for num_tables in options['lsh_tables']:
+            index.build_lsh(num_tables, options['lsh_bits'], options['seed'])
+            approximate, approximate_ms = self.run_queries(index, queries, k, approximate=True)
+
+            recall = statistics.mean(
+                len({a for a, _ in found} & {a for a, _ in expected}) / max(len(expected), 1)
+                for found, expected in zip(approximate, exact)
+            )
+            candidates = statistics.mean(len(index.get_candidate_rows(query)) for query in queries)
+
+            mode = f'lsh {num_tables}x{options["lsh_bits"]} bits'
+            self.stdout.write(f'{mode:<24}{approximate_ms:>10.3f}{recall:>10.3f}{candidates:>12.0f}')
+
+    def get_synthetic_index(self, num_vectors: int, dim: int, rng) -> VectorIndex:
+        # headlines about the same story cluster together, so the vectors are drawn around random centres
+        centres = rng.standard_normal((max(num_vectors // 50, 1), dim))
+        vectors = centres[rng.integers(len(centres), size=num_vectors)] + rng.standard_normal((num_vectors, dim))
+
+        return VectorIndex.build(vectors, np.arange(1, num_vectors + 1))
+
+    def run_queries(self, index: VectorIndex, queries, k: int, approximate: bool) -> tuple:
+        results = []
+        timings = []
+
+        # one query at a time, like get_similar
+        for query in queries:
+            start = time.perf_counter()
+            results += index.search(query, k, approximate=approximate)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return results, statistics.median(timings)
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from news.model_registry import registry
+from news.similarity import TAG_INDEX_FILE, TagIndex
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the index from headline model tags to article IDs used by get_similar. '
+        'Run it again whenever the headline model is retrained, then restart the server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=os.path.join(settings.STATIC_ROOT, TAG_INDEX_FILE),
+            help='where to write the index'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        tag_lookup = registry.get('tag_lookup')
+        index = TagIndex.build(tag_lookup)
+        index.save(options['output'])
+
+        self.stdout.write(
+            f'matched {len(index)} of {len(tag_lookup)} tags to articles in {time.perf_counter() - start:.1f}s, '
+            f'wrote {options["output"]}'
+        )
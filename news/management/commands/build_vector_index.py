@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from news.model_registry import registry
+from news.similarity import get_article_ids_by_tags
+from news.vector_index import VectorIndex
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the article vector index used by get_similar from the document vectors of the headline model. '
+        'Run it again whenever the headline model is retrained, then restart the server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.STATIC_ROOT, help='directory to write the index files to')
+        parser.add_argument(
+            '--lsh-tables', type=int, default=0,
+            help='number of LSH hash tables for approximate search, 0 builds an exact index only'
+        )
+        parser.add_argument('--lsh-bits', type=int, default=10, help='hyperplanes per LSH table')
+        parser.add_argument('--seed', type=int, default=0, help='random seed for the LSH hyperplanes')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        model = registry.get('headline_model')
+        vectors = model.docvecs.vectors_docs
+
+        # string tags are listed by offset, plain int tags are the offset itself
+        tags = list(model.docvecs.offset2doctag) or list(range(len(vectors)))
+        article_ids = get_article_ids_by_tags(tags)
+
+        # tags that don't match an article are left out, if several tags match the same
+        # article (same headline) the first one is kept
+        rows = {}
+
+        for row, article_id in enumerate(article_ids):
+            if article_id is not None:
+                rows.setdefault(article_id, row)
+
+        index = VectorIndex.build(vectors[list(rows.values())], list(rows.keys()))
+
+        if options['lsh_tables']:
+            index.build_lsh(options['lsh_tables'], options['lsh_bits'], options['seed'])
+
+        index.save(options['output'])
+
+        self.stdout.write(
+            f'indexed {len(index)} of {len(tags)} document vectors in {time.perf_counter() - start:.1f}s, '
+            f'wrote {options["output"]}'
+        )
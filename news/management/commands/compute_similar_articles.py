@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from news.similarity import compute_similar_articles
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute the most similar articles of every article with the headline model and store them '
+        'in the SimilarArticle table that get_similar reads from.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=10, help='number of similar articles to store per article')
+        parser.add_argument('--batch-size', type=int, default=500, help='number of articles to write at a time')
+        parser.add_argument('--article', type=int, nargs='+', dest='article_ids', help='only these article IDs')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        num_rows = compute_similar_articles(options['article_ids'], options['top_k'], options['batch_size'])
+
+        self.stdout.write(f'stored {num_rows} similar articles in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from news.analysis_pool import shutdown_executor
+from news.ingest import FILE_FORMATS, ingest_articles, read_rows
+from news.sentiment import SENTIMENT_ENGINES, TEXTBLOB
+import os
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Load articles from a JSONL or CSV file, score their sentiment, keywords and topic in a pool of '
+        'worker processes and write them in batches. Each row needs url, headline and content, and can '
+        'have post_id, post_title, score, publisher and date_published.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file to load, - reads JSONL from stdin')
+        parser.add_argument('--format', choices=FILE_FORMATS, help='file format, by default from the file extension')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, help='number of articles to score and write at a time'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='worker processes used to score the articles, 0 scores them in this process'
+        )
+        parser.add_argument(
+            '--sentiment-engine', choices=SENTIMENT_ENGINES, default=TEXTBLOB, help='see news/sentiment.py'
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        start = time.perf_counter()
+
+        def report_batch(num_rows):
+            seconds = time.perf_counter() - start
+            self.stdout.write(f'{num_rows} articles in {seconds:.1f}s ({num_rows / seconds:.0f} rows/s)')
+
+        def report_invalid_row(line_number, error):
+            self.stderr.write(f'skipped line {line_number}: {error}')
+
+        try:
+            with self.open(options['path']) as file:
+                stats = ingest_articles(
+                    read_rows(file, file_format), options['batch_size'], options['sentiment_engine'],
+                    options['workers'], on_invalid_row=report_invalid_row, on_batch=report_batch
+                )
+        except ValueError as e:
+            raise CommandError(f'{e}, the batches before this one were written')
+        finally:
+            shutdown_executor()
+
+        seconds = time.perf_counter() - start
+        self.stdout.write(
+            f'ingested {stats["ingested"]} articles and skipped {stats["skipped"]} invalid rows in {seconds:.1f}s '
+            f'({stats["ingested"] / max(seconds, 1e-9):.0f} rows/s)'
+        )
+
+    def open(self, path: str):
+        if path == '-':
+            # keep stdin open when the with block ends
+            return open(sys.stdin.fileno(), encoding='utf-8', closefd=False)
+
+        # newline='' so the csv module handles line breaks inside quoted fields
+        return open(path, encoding='utf-8', newline='')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from news.feed import rebuild_article_feed
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized ArticleFeed table from Article, ArticleNlp and TopicLkp.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='number of articles to refresh at a time')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        num_rows = rebuild_article_feed(options['batch_size'])
+
+        self.stdout.write(f'rebuilt article feed with {num_rows} rows in {time.perf_counter() - start:.1f}s')
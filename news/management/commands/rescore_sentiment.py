@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from news.sentiment import LEXICON, SENTIMENT_ENGINES, rescore_article_sentiment
+import time
+
+
+class Command(BaseCommand):
+    help = 'Score the sentiment of every article again and store it in ArticleNlp and the ArticleFeed table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine', choices=SENTIMENT_ENGINES, default=LEXICON,
+            help='sentiment engine, lexicon scores a whole batch at once and gives the same scores as textblob'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='number of articles to score at a time')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        num_rows = rescore_article_sentiment(options['engine'], options['batch_size'])
+        seconds = time.perf_counter() - start
+
+        self.stdout.write(f'rescored {num_rows} articles in {seconds:.1f}s ({num_rows / max(seconds, 1e-9):.0f} articles/s)')
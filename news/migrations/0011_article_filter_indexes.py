@@ -0,0 +1,33 @@
+# Generated by Django 3.1.5 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0010_auto_20220323_0059'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['date_published', 'id'], name='news_art_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['publisher', 'date_published'], name='news_art_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlenlp',
+            index=models.Index(fields=['topic', 'article'], name='news_nlp_topic_art_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlenlp',
+            index=models.Index(fields=['sentiment', 'subjectivity'], name='news_nlp_sent_subj_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlenlp',
+            index=models.Index(fields=['subjectivity', 'sentiment'], name='news_nlp_subj_sent_idx'),
+        ),
+    ]
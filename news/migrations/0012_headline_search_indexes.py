@@ -0,0 +1,73 @@
+from django.db import migrations, transaction
+from django.db.utils import OperationalError, ProgrammingError
+import logging
+
+logger = logging.getLogger(__name__)
+
+# These indexes only exist on postgres. SQLite (used for local tests) has no trigram or
+# full text search support, so the headline search falls back to LIKE there and the
+# migration is a no-op.
+
+# pg_trgm is a trusted extension from postgres 13, so the database owner can create it. A role
+# without that privilege can still migrate, the trigram index is skipped, see create_indexes
+CREATE_EXTENSION = 'CREATE EXTENSION IF NOT EXISTS pg_trgm'
+
+TRIGRAM_INDEXES = [
+    # headlineLike uses Django's icontains, which compiles to UPPER("headline"::text) LIKE UPPER(%s).
+    # A trigram index on the same expression lets postgres answer it without a sequential scan
+    'CREATE INDEX IF NOT EXISTS news_art_headline_trgm_idx ON news_article USING gin (UPPER(headline::text) gin_trgm_ops)',
+]
+
+CREATE_INDEXES = [
+    # headlineSearch matches on SearchVector('headline', config='english'), which compiles to this expression
+    "CREATE INDEX IF NOT EXISTS news_art_headline_fts_idx ON news_article USING gin (to_tsvector('english'::regconfig, COALESCE(headline, '')))",
+]
+
+DROP_INDEXES = [
+    'DROP INDEX IF EXISTS news_art_headline_trgm_idx',
+    'DROP INDEX IF EXISTS news_art_headline_fts_idx',
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    try:
+        # in a savepoint, so a failure doesn't abort the rest of the migration
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(CREATE_EXTENSION)
+    except (OperationalError, ProgrammingError) as e:
+        logger.warning(
+            'Skipped the trigram headline index, pg_trgm could not be created: %s. headlineLike searches will '
+            'scan the table until it is installed and the index is created, see Database in the README',
+            str(e).strip()
+        )
+    else:
+        for statement in TRIGRAM_INDEXES:
+            schema_editor.execute(statement)
+
+    for statement in CREATE_INDEXES:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0011_article_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, run_on_postgres(DROP_INDEXES)),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 3.1.5 on 2026-10-17 21:48
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+import logging
+
+logger = logging.getLogger(__name__)
+
+# the feed table gets the same headline search indexes as news_article (see 0012), postgres only
+TRIGRAM_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS news_feed_headline_trgm_idx ON news_articlefeed USING gin (UPPER(headline::text) gin_trgm_ops)',
+]
+
+CREATE_SEARCH_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS news_feed_headline_fts_idx ON news_articlefeed USING gin (to_tsvector('english'::regconfig, COALESCE(headline, '')))",
+]
+
+DROP_SEARCH_INDEXES = [
+    'DROP INDEX IF EXISTS news_feed_headline_trgm_idx',
+    'DROP INDEX IF EXISTS news_feed_headline_fts_idx',
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        has_trigram = cursor.fetchone() is not None
+
+    # 0012 skips the extension if this role isn't allowed to create it
+    if has_trigram:
+        statements = TRIGRAM_INDEXES + CREATE_SEARCH_INDEXES
+    else:
+        statements = CREATE_SEARCH_INDEXES
+        logger.warning('Skipped the trigram feed headline index, pg_trgm is not installed, see Database in the README')
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+# fill the feed from the existing articles, same join as news.feed.refresh_article_feed
+def backfill_article_feed(apps, schema_editor):
+    Article = apps.get_model('news', 'Article')
+    ArticleFeed = apps.get_model('news', 'ArticleFeed')
+
+    rows = Article.objects.filter(articlenlp__isnull=False).order_by('id').values(
+        'post_title', 'url', 'publisher', 'headline', 'date_published', 'content',
+        article_id=F('id'),
+        sentiment=F('articlenlp__sentiment'),
+        subjectivity=F('articlenlp__subjectivity'),
+        topic=F('articlenlp__topic'),
+        keywords=F('articlenlp__keywords'),
+        topic_name=F('articlenlp__topic__topic_name')
+    )
+
+    batch = {}
+
+    for row in rows.iterator(chunk_size=2000):
+        # keep the first NLP row if an article somehow has more than one
+        batch.setdefault(row['article_id'], ArticleFeed(**row))
+
+        if len(batch) >= 2000:
+            ArticleFeed.objects.bulk_create(batch.values())
+            batch = {}
+
+    ArticleFeed.objects.bulk_create(batch.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0012_headline_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleFeed',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed', serialize=False, to='news.article')),
+                ('post_title', models.CharField(max_length=400)),
+                ('url', models.CharField(max_length=1000)),
+                ('publisher', models.CharField(max_length=50, null=True)),
+                ('headline', models.CharField(max_length=400)),
+                ('date_published', models.DateTimeField(null=True)),
+                ('content', models.CharField(max_length=65000)),
+                ('sentiment', models.DecimalField(decimal_places=3, max_digits=4)),
+                ('subjectivity', models.DecimalField(decimal_places=3, max_digits=4)),
+                ('topic', models.IntegerField()),
+                ('topic_name', models.CharField(max_length=50)),
+                ('keywords', models.CharField(max_length=1000, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='articlefeed',
+            index=models.Index(fields=['date_published', 'article'], name='news_feed_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlefeed',
+            index=models.Index(fields=['publisher', 'date_published'], name='news_feed_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlefeed',
+            index=models.Index(fields=['topic', 'date_published'], name='news_feed_topic_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlefeed',
+            index=models.Index(fields=['sentiment', 'subjectivity'], name='news_feed_sent_subj_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlefeed',
+            index=models.Index(fields=['subjectivity', 'sentiment'], name='news_feed_subj_sent_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, run_on_postgres(DROP_SEARCH_INDEXES)),
+        migrations.RunPython(backfill_article_feed, migrations.RunPython.noop),
+    ]
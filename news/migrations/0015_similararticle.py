@@ -0,0 +1,28 @@
+# Generated by Django 3.1.5 on 2026-10-17 22:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0014_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarArticle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('similarity', models.FloatField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_articles', to='news.article')),
+                ('similar_article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='news.article')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='similararticle',
+            constraint=models.UniqueConstraint(fields=('article', 'rank'), name='news_similar_art_rank_uniq'),
+        ),
+    ]
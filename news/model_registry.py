@@ -0,0 +1,207 @@
+# Process-wide registry of the trained model artifacts in STATIC_ROOT.
+#
+# Each artifact is loaded the first time it's needed (or when the app starts, see the
+# NEWS_PRELOAD_MODELS setting) and then shared by every request in the process. Large numpy
+# arrays saved next to a gensim model are memory-mapped read-only, so they're paged in from
+# the file on demand and shared between worker processes through the OS page cache.
+from django.conf import settings
+from gensim.models import LdaMulticore
+from gensim.models.doc2vec import Doc2Vec
+from .vector_index import VectorIndex
+from threading import Lock
+import numpy as np
+import os
+import pickle
+import sys
+import time
+
+
+def load_doc2vec(file_name: str):
+    return Doc2Vec.load(os.path.join(settings.STATIC_ROOT, file_name), mmap='r')
+
+def load_lda(file_name: str):
+    return LdaMulticore.load(os.path.join(settings.STATIC_ROOT, file_name), mmap='r')
+
+def warm_up_lda(model):
+    # the first inference sets up gensim's internal state and pages in part of the topic matrix
+    model[model.id2word.doc2bow(['news'])]
+
+def load_pickle(file_name: str):
+    with open(os.path.join(settings.STATIC_ROOT, file_name), 'rb') as f:
+        return pickle.load(f)
+
+def load_tags_by_headline() -> dict:
+    # the reverse of tag_lookup, the first tag trained on each headline
+    tags = {}
+
+    for tag, headline in registry.get('tag_lookup').items():
+        tags.setdefault(headline, tag)
+
+    return tags
+
+def load_tag_index():
+    # imported here since similarity.py uses the registry
+    from .similarity import TAG_INDEX_FILE, TagIndex
+
+    return TagIndex.load(os.path.join(settings.STATIC_ROOT, TAG_INDEX_FILE))
+
+def load_sentiment_lexicon():
+    # imported here since sentiment.py uses nlp.py, which uses the registry
+    from .sentiment import LexiconSentiment
+
+    return LexiconSentiment.from_textblob()
+
+def load_vector_index():
+    return VectorIndex.load(settings.STATIC_ROOT, mmap=True)
+
+def get_footprint(obj, max_depth: int = 3) -> dict:
+    """
+    Estimate how much memory a loaded artifact takes up by walking its attributes.
+
+    numpy arrays are counted by their size in bytes, memory-mapped arrays are counted
+    separately since they live in the page cache and not on the heap. Everything else
+    is counted with sys.getsizeof, so this is a lower bound for plain Python objects.
+
+    Args:
+        obj: the loaded artifact
+        max_depth (int): how many levels of attributes and containers to follow
+
+    Returns:
+        dict: 'heap_bytes' and 'mapped_bytes'
+    """
+    footprint = {'heap_bytes': 0, 'mapped_bytes': 0}
+    seen = set()
+
+    def visit(value, depth):
+        if id(value) in seen:
+            return
+
+        seen.add(id(value))
+
+        if isinstance(value, np.ndarray):
+            # a view of a memory-mapped array is an ndarray whose base is the memmap
+            mapped = isinstance(value, np.memmap) or isinstance(value.base, np.memmap)
+            footprint['mapped_bytes' if mapped else 'heap_bytes'] += value.nbytes
+            return
+
+        footprint['heap_bytes'] += sys.getsizeof(value)
+
+        if depth >= max_depth:
+            return
+
+        if isinstance(value, dict):
+            for key, item in value.items():
+                visit(key, depth + 1)
+                visit(item, depth + 1)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            for item in value:
+                visit(item, depth + 1)
+        elif hasattr(value, '__dict__'):
+            visit(vars(value), depth + 1)
+
+    visit(obj, 0)
+
+    return footprint
+
+
+class ModelRegistry:
+    """
+    Loads each registered artifact once per process and keeps it for the life of the process.
+    Loading is thread safe, concurrent requests for an artifact that isn't loaded yet wait
+    for the first one instead of loading it again.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._warm_ups = {}
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+
+    def register(self, name: str, loader, warm_up=None):
+        """
+        Register a function that loads an artifact.
+
+        Args:
+            name (str): name used to get the artifact
+            loader (callable): function with no arguments that returns the loaded artifact
+            warm_up (callable): optional function that is given the loaded artifact by load_all,
+                                e.g. to run it once so the first request isn't slower than the rest
+        """
+        self._loaders[name] = loader
+        self._locks[name] = Lock()
+
+        if warm_up:
+            self._warm_ups[name] = warm_up
+
+    def get(self, name: str):
+        """
+        Get a loaded artifact, loading it first if this is the first time it's used in this process.
+
+        Args:
+            name (str): name the artifact was registered with
+
+        Raises:
+            KeyError: if no artifact was registered with this name
+
+        Returns:
+            the loaded artifact
+        """
+        if name in self._models:
+            return self._models[name]
+
+        with self._locks[name]:
+            # another thread may have loaded it while this one was waiting for the lock
+            if name not in self._models:
+                start = time.perf_counter()
+                model = self._loaders[name]()
+                load_seconds = time.perf_counter() - start
+
+                self._stats[name] = dict(load_seconds=load_seconds, **get_footprint(model))
+                self._models[name] = model
+
+        return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def load_all(self):
+        # warm up every artifact, used at app start so the first requests don't pay for loading
+        for name in self._loaders:
+            try:
+                model = self.get(name)
+            except FileNotFoundError:
+                # artifacts that haven't been built yet are tried again when they're first used
+                continue
+
+            if name in self._warm_ups:
+                self._warm_ups[name](model)
+
+    def unload(self, name: str = None):
+        # drop one or all loaded artifacts so they're loaded again the next time they're used
+        for loaded in [name] if name else list(self._models):
+            self._models.pop(loaded, None)
+            self._stats.pop(loaded, None)
+
+    def get_stats(self) -> dict:
+        """
+        Load time and memory footprint of each registered artifact.
+
+        Returns:
+            dict: key is the artifact name, value has 'loaded' and, once loaded,
+                  'load_seconds', 'heap_bytes' and 'mapped_bytes'
+        """
+        return {
+            name: dict(loaded=self.is_loaded(name), **self._stats.get(name, {}))
+            for name in self._loaders
+        }
+
+
+registry = ModelRegistry()
+registry.register('headline_model', lambda: load_doc2vec('headline_model'))
+registry.register('tag_lookup', lambda: load_pickle('tag_lookup.pickle'))
+registry.register('tags_by_headline', load_tags_by_headline)
+registry.register('tag_index', load_tag_index)
+registry.register('vector_index', load_vector_index)
+registry.register('lda_model', lambda: load_lda('news_lda_model'), warm_up=warm_up_lda)
+registry.register('sentiment_lexicon', load_sentiment_lexicon)
@@ -11,6 +11,14 @@ class Article(models.Model):
     date_published = models.DateTimeField(null=True)
     content = models.CharField(max_length=65000)
 
+    class Meta:
+        indexes = [
+            # feed ordering, cursor pagination and the timeframe/startDate/endDate filters
+            models.Index(fields=['date_published', 'id'], name='news_art_date_id_idx'),
+            # publisher filter sorted by date, also serves the distinct publishers list
+            models.Index(fields=['publisher', 'date_published'], name='news_art_pub_date_idx'),
+        ]
+
 class SavedArticle(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     article = models.ForeignKey(Article, on_delete=models.CASCADE)
@@ -25,3 +33,72 @@ class ArticleNlp(models.Model):
     sentiment = models.DecimalField(max_digits=4, decimal_places=3)
     subjectivity = models.DecimalField(max_digits=4, decimal_places=3)
     keywords = models.CharField(max_length=1000, null=True)
+
+    class Meta:
+        indexes = [
+            # topic filter/counts, article_id is included so the join back to article can use the index
+            models.Index(fields=['topic', 'article'], name='news_nlp_topic_art_idx'),
+            # sentiment range filters and the count_by_sentiment buckets
+            models.Index(fields=['sentiment', 'subjectivity'], name='news_nlp_sent_subj_idx'),
+            # subjectivity range filters
+            models.Index(fields=['subjectivity', 'sentiment'], name='news_nlp_subj_sent_idx'),
+        ]
+
+# Denormalized copy of an article with its NLP and topic name, kept in sync with Article,
+# ArticleNlp and TopicLkp by the signals in signals.py. The article endpoints can read
+# from this table instead of joining news_article, news_articlenlp and news_topiclkp.
+# Rebuild it with: python manage.py rebuild_article_feed
+class ArticleFeed(models.Model):
+    article = models.OneToOneField(Article, primary_key=True, on_delete=models.CASCADE, related_name='feed')
+    post_title = models.CharField(max_length=400)
+    url = models.CharField(max_length=1000)
+    publisher = models.CharField(max_length=50, null=True)
+    headline = models.CharField(max_length=400)
+    date_published = models.DateTimeField(null=True)
+    content = models.CharField(max_length=65000)
+    sentiment = models.DecimalField(max_digits=4, decimal_places=3)
+    subjectivity = models.DecimalField(max_digits=4, decimal_places=3)
+    topic = models.IntegerField() # TopicLkp.topic_id
+    topic_name = models.CharField(max_length=50)
+    keywords = models.CharField(max_length=1000, null=True)
+
+    class Meta:
+        # same access patterns as the Article and ArticleNlp indexes
+        indexes = [
+            models.Index(fields=['date_published', 'article'], name='news_feed_date_id_idx'),
+            models.Index(fields=['publisher', 'date_published'], name='news_feed_pub_date_idx'),
+            models.Index(fields=['topic', 'date_published'], name='news_feed_topic_date_idx'),
+            models.Index(fields=['sentiment', 'subjectivity'], name='news_feed_sent_subj_idx'),
+            models.Index(fields=['subjectivity', 'sentiment'], name='news_feed_subj_sent_idx'),
+        ]
+
+# Counters that get bumped whenever a set of data changes, e.g. 'articles' is bumped on every
+# Article/ArticleNlp/TopicLkp write. Cached responses are keyed on the version so they are
+# invalidated across all worker processes as soon as the data changes.
+class DataVersion(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated = models.DateTimeField()
+
+# Precomputed nearest neighbours from the headline model, rank 1 is the most similar article.
+# get_similar reads from here and only runs the model for articles that aren't in the table.
+# Fill it with: python manage.py compute_similar_articles
+class SimilarArticle(models.Model):
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='similar_articles')
+    similar_article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    similarity = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # also the index get_similar reads with, an article's neighbours in rank order
+            models.UniqueConstraint(fields=['article', 'rank'], name='news_similar_art_rank_uniq'),
+        ]
+
+# Memoized output of the text analyses, keyed on a hash of the text, the analysis and the
+# version of the model that produced it. Written and read by analysis_cache.py
+class AnalysisResult(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    analysis = models.CharField(max_length=20)
+    result = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,371 @@
+# Text analysis shared by the analysis endpoints
+from .model_registry import registry
+from collections import Counter
+from functools import lru_cache
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import sent_tokenize, word_tokenize
+from textblob import TextBlob
+import heapq
+import math
+import numpy as np
+import re
+
+NUM_KEYWORDS = 10
+ANALYSES = ('sentiment', 'keywords', 'topics')
+
+WHITESPACE = re.compile(r'\s')
+
+
+@lru_cache(maxsize=None)
+def get_stopwords(language: str = 'english') -> frozenset:
+    # stopwords.words reads the corpus file and builds a new list on every call
+    return frozenset(stopwords.words(language))
+
+@lru_cache(maxsize=None)
+def get_lemmatizer() -> WordNetLemmatizer:
+    return WordNetLemmatizer()
+
+def warm_up():
+    """
+    Load the NLTK data the analyses use, so the first request in each process doesn't pay for it.
+    NLTK loads the punkt tokenizer and the WordNet corpus lazily on first use.
+
+    Raises:
+        LookupError: if the NLTK data hasn't been downloaded
+    """
+    tokenize_sentences('Warm up the tokenizer. It loads punkt on first use.')
+    get_stopwords()
+    get_lemmatizer().lemmatize('articles')
+
+def lemmatize_tokens(tokens, lemmas: dict = None):
+    # news text repeats the same words a lot, so each distinct token is only lemmatized once per text.
+    # Pass the same lemmas dict for every part of a text that's lemmatized a part at a time
+    lemmatizer = get_lemmatizer()
+    lemmas = {} if lemmas is None else lemmas
+
+    for token in tokens:
+        lemma = lemmas.get(token)
+
+        if lemma is None:
+            lemma = lemmas[token] = lemmatizer.lemmatize(token)
+
+        yield lemma
+
+def iter_chunks(text: str, chunk_length: int):
+    """
+    Split a long text into chunks of about chunk_length characters that end between sentences,
+    so it can be analyzed a chunk at a time. The sentences are the same as sent_tokenize gives
+    for the whole text, except that a sentence longer than chunk_length is split.
+
+    Args:
+        text (str): text to split
+        chunk_length (int): number of characters to sentence tokenize at a time
+
+    Returns:
+        generator: (start, end, sentences) for each chunk, text[start:end] contains the sentences
+    """
+    start = 0
+
+    while start < len(text):
+        # don't cut a word in half, punkt looks at the word after a period
+        end = start + chunk_length
+        match = WHITESPACE.search(text, end, end + chunk_length)
+        end = match.start() if match else min(end, len(text))
+
+        sentences = sent_tokenize(text[start:end])
+
+        if end < len(text) and len(sentences) > 1:
+            # the last sentence may carry on past the end of the chunk, it's tokenized again with the next one
+            next_start = text.rfind(sentences.pop(), start, end)
+            yield start, next_start, sentences
+            start = next_start
+        else:
+            yield start, end, sentences
+            start = end
+
+def tokenize_sentences(content: str, chunk_length: int = None):
+    """
+    Word tokens of each sentence, sentence tokenizing first keeps the tokens the same as
+    tokenizing each sentence separately.
+
+    Args:
+        content (str): text to tokenize
+        chunk_length (int): texts longer than this are tokenized a chunk at a time, see iter_chunks
+
+    Returns:
+        list: list of word tokens for each sentence, a generator of them for texts longer than chunk_length
+    """
+    if chunk_length is None or len(content) <= chunk_length:
+        return [word_tokenize(sentence) for sentence in sent_tokenize(content)]
+
+    return (
+        word_tokenize(sentence)
+        for _, _, sentences in iter_chunks(content, chunk_length)
+        for sentence in sentences
+    )
+
+def get_sentiment(text: str, chunk_length: int = None) -> dict:
+    """
+    Args:
+        text (str): text to score
+        chunk_length (int): texts longer than this are scored a chunk at a time, see iter_chunks
+
+    Returns:
+        dict: 'sentiment' (polarity from -1 to 1) and 'subjectivity' (0 to 1) of the text from TextBlob
+    """
+    if chunk_length is None or len(text) <= chunk_length:
+        blob = TextBlob(text)
+
+        return {
+            'sentiment': blob.sentiment.polarity,
+            'subjectivity': blob.sentiment.subjectivity
+        }
+
+    # TextBlob averages the scores of every sentiment word or phrase in the text, so adding them
+    # up in the same order over the chunks gives the same averages. The only difference is a
+    # negation at the very end of a chunk, TextBlob would apply it to the next chunk's first word
+    polarity = 0
+    subjectivity = 0
+    num_assessments = 0
+
+    for start, end, _ in iter_chunks(text, chunk_length):
+        for _, chunk_polarity, chunk_subjectivity, _ in TextBlob(text[start:end]).sentiment_assessments.assessments:
+            polarity += chunk_polarity
+            subjectivity += chunk_subjectivity
+            num_assessments += 1
+
+    return {
+        'sentiment': polarity / float(num_assessments or 1),
+        'subjectivity': subjectivity / float(num_assessments or 1)
+    }
+
+def is_keyword_candidate(token: str, stop_words: frozenset) -> bool:
+    lower = token.lower()
+
+    return lower not in stop_words and len(token) >= 3 and lower != 'said'
+
+
+class KeywordCounts:
+    """
+    Term counts and sentence counts for the TF-IDF keywords (see find_keywords), added up one
+    sentence at a time. Only the counts are kept, so the memory used depends on the number of
+    distinct terms and not the length of the text.
+    """
+
+    def __init__(self):
+        self.stop_words = get_stopwords()
+        self.term_counts = Counter()
+        # number of sentences containing each term, each sentence counts a term once
+        self.sentence_counts = Counter()
+        self.num_sentences = 0
+
+    def add(self, sentence: list):
+        terms = [token for token in sentence if is_keyword_candidate(token, self.stop_words)]
+
+        self.term_counts.update(terms)
+        self.sentence_counts.update(set(terms))
+        self.num_sentences += 1
+
+    def get_keywords(self, num_keywords: int = NUM_KEYWORDS) -> list:
+        """
+        Args:
+            num_keywords (int): number of keywords to return
+
+        Returns:
+            list: keywords, highest TF-IDF score first
+        """
+        num_terms = sum(self.term_counts.values())
+
+        if not num_terms:
+            return []
+
+        scores = (
+            (count / num_terms * math.log(self.num_sentences / self.sentence_counts[term]), term)
+            for term, count in self.term_counts.items()
+        )
+
+        return [term for _, term in heapq.nlargest(num_keywords, scores)]
+
+
+def find_keywords(content: str, num_keywords: int = NUM_KEYWORDS, chunk_length: int = None) -> list:
+    """
+    Find the top key words using the TF-IDF calculation.
+
+    Term Frequency = (# of times term appears) / (total # of terms in article)
+    Inverse Document Frequency = log(# of sentences / # of sentences with the term)
+    TF-IDF - term frequency * inverse document frequency
+
+    Higher TF-IDF score means the term is more important. Ties are broken by the term,
+    in reverse alphabetical order.
+
+    Args:
+        content (str): content from news article to find keywords for
+        num_keywords (int): number of keywords to return
+        chunk_length (int): texts longer than this are tokenized a chunk at a time, see iter_chunks
+
+    Returns:
+        list: keywords, highest TF-IDF score first
+    """
+    return find_keywords_in_sentences(tokenize_sentences(content, chunk_length), num_keywords)
+
+def find_keywords_in_sentences(sentences: list, num_keywords: int = NUM_KEYWORDS) -> list:
+    """
+    Same as find_keywords for text that has already been tokenized.
+
+    Args:
+        sentences: list, or any iterable, of word tokens for each sentence
+        num_keywords (int): number of keywords to return
+
+    Returns:
+        list: keywords, highest TF-IDF score first
+    """
+    counts = KeywordCounts()
+
+    for sentence in sentences:
+        counts.add(sentence)
+
+    return counts.get_keywords(num_keywords)
+
+def get_topic_words(tokens, lemmas: dict = None):
+    # lowercase, lemmatized tokens without stop words or words of three characters or less
+    stop_words = get_stopwords()
+    tokens = (token.lower() for token in tokens)
+
+    return lemmatize_tokens((token for token in tokens if len(token) > 3 and token not in stop_words), lemmas)
+
+def preprocess_for_topics(text: str, chunk_length: int = None):
+    """
+    Preprocess text for topic modeling.
+    This involves removing stop words and any words less than
+    three characters. It also word tokenizes sentences and
+    lemmatizes each word.
+
+    Args:
+        text (str): Article to preprocess
+        chunk_length (int): texts longer than this are tokenized a chunk at a time, see iter_chunks
+
+    Returns:
+        list: list of lowercase, lemmatized tokens from the article, a generator of them for
+              texts longer than chunk_length
+    """
+    text = text.lower() # make all text lower case
+
+    if chunk_length is None or len(text) <= chunk_length:
+        return list(get_topic_words(word_tokenize(text)))
+
+    lemmas = {}
+
+    return (word for sentence in tokenize_sentences(text, chunk_length) for word in get_topic_words(sentence, lemmas))
+
+def get_topic_probabilities(preprocessed: list) -> list:
+    """
+    Use the trained LDA model to predict the topic of an article.
+
+    Args:
+        preprocessed: tokens of the article from preprocess_for_topics, a list or any iterable
+
+    Returns:
+        list: (topic ID, probability) tuples, topics with a very small probability are left out by gensim
+    """
+    # the LDA model is loaded once per process
+    model = registry.get('lda_model')
+
+    # create bag of words with preprocessed article
+    bow = model.id2word.doc2bow(preprocessed)
+
+    return [(int(topic_id), float(probability)) for topic_id, probability in model[bow]]
+
+def infer_topic_distributions(documents: list, chunk_size: int = 2000) -> np.ndarray:
+    """
+    Topic distributions of many documents at once. Each chunk of documents goes through the LDA
+    model's E-step in one model.inference call instead of one model[bow] call per document.
+
+    Args:
+        documents (list): tokens of each document from preprocess_for_topics
+        chunk_size (int): number of documents inferred at a time
+
+    Returns:
+        np.ndarray: (number of documents, number of topics) array, row i is the probability of
+                    each topic for documents[i] and sums to 1
+    """
+    model = registry.get('lda_model')
+    distributions = np.empty((len(documents), model.num_topics))
+
+    for start in range(0, len(documents), chunk_size):
+        corpus = [model.id2word.doc2bow(document) for document in documents[start:start + chunk_size]]
+        gamma, _ = model.inference(corpus)
+
+        # normalized the same way as model[bow]
+        distributions[start:start + len(corpus)] = gamma / gamma.sum(axis=1, keepdims=True)
+
+    return distributions
+
+def get_batch_topic_probabilities(documents: list, chunk_size: int = 2000) -> tuple:
+    """
+    Same as get_topic_probabilities for many documents, see infer_topic_distributions.
+
+    Args:
+        documents (list): tokens of each document from preprocess_for_topics
+        chunk_size (int): number of documents inferred at a time
+
+    Returns:
+        tuple: the (number of documents, number of topics) array from infer_topic_distributions,
+               and a list of (topic ID, probability) tuples for each document without the topics
+               that gensim leaves out for having a very small probability
+    """
+    distributions = infer_topic_distributions(documents, chunk_size)
+    # the same cut off as model[bow]
+    minimum_probability = max(registry.get('lda_model').minimum_probability, 1e-8)
+
+    probabilities = [
+        [(int(topic_id), float(row[topic_id])) for topic_id in np.flatnonzero(row >= minimum_probability)]
+        for row in distributions
+    ]
+
+    return distributions, probabilities
+
+def analyze_text(text: str, analyses: tuple = ANALYSES, chunk_length: int = None) -> dict:
+    """
+    Run the requested analyses on one text. The text is tokenized once and the sentences and
+    tokens are shared by keywords and topics. Sentiment is scored by TextBlob on the raw text,
+    its pattern analyzer does its own word splitting and gives different scores on NLTK tokens.
+
+    Keywords and topics only keep counts of the words as they go through the sentences, so a
+    text longer than chunk_length is analyzed a chunk at a time without holding all of its
+    tokens in memory, and gives the same results.
+
+    Args:
+        text (str): text to analyze
+        analyses (tuple): any of 'sentiment', 'keywords' and 'topics'
+        chunk_length (int): texts longer than this are analyzed a chunk at a time, see iter_chunks
+
+    Returns:
+        dict: 'sentiment' ({'sentiment', 'subjectivity'}), 'keywords' (list) and 'topics'
+              (list of (topic ID, probability)) for the analyses that were asked for
+    """
+    result = {}
+
+    if 'sentiment' in analyses:
+        result['sentiment'] = get_sentiment(text, chunk_length)
+
+    if 'keywords' in analyses or 'topics' in analyses:
+        keyword_counts = KeywordCounts()
+        topic_word_counts = Counter()
+        lemmas = {}
+
+        for sentence in tokenize_sentences(text, chunk_length):
+            if 'keywords' in analyses:
+                keyword_counts.add(sentence)
+
+            if 'topics' in analyses:
+                topic_word_counts.update(get_topic_words(sentence, lemmas))
+
+        if 'keywords' in analyses:
+            result['keywords'] = keyword_counts.get_keywords()
+
+        if 'topics' in analyses:
+            # the bag of words only depends on the counts, not the order of the words
+            result['topics'] = get_topic_probabilities(topic_word_counts.elements())
+
+    return result
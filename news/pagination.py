@@ -0,0 +1,92 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from backend import settings
+import json
+
+
+class ArticleCursorPagination:
+    """
+    Keyset (cursor) pagination for article feeds, keyed on (date_published, id).
+
+    PageNumberPagination has to COUNT(*) the filtered join for total_pages and uses
+    OFFSET, so every page scans all the rows before it. This instead remembers the
+    last (date_published, id) that was returned and asks for the rows after it, so
+    any page costs the same as the first one.
+
+    The cursor is opaque to the client, it is just the last key encoded as base64.
+    Articles without a publish date can't be placed on the timeline, so they are
+    left out of cursor pages.
+    """
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, newest_first: bool = True) -> list:
+        """
+        Get one page of results from a queryset of feed rows.
+
+        Args:
+            queryset (QuerySet): feed rows (dictionaries with 'id' and 'date_published')
+            request (Request): request containing the cursor query param, an empty cursor gets the first page
+            newest_first (bool): order from newest to oldest if True, otherwise oldest to newest
+
+        Returns:
+            list: rows for the requested page
+        """
+        cursor = self.decode_cursor(request.query_params.get('cursor'))
+
+        if newest_first:
+            queryset = queryset.order_by('-date_published', '-pk')
+        else:
+            queryset = queryset.order_by('date_published', 'pk')
+
+        queryset = queryset.filter(date_published__isnull=False)
+
+        if cursor:
+            queryset = queryset.filter(self.get_cursor_filter(cursor, newest_first))
+
+        # fetch one extra row to find out if there is another page without counting
+        results = list(queryset[:self.page_size + 1])
+        has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        self.next_cursor = self.encode_cursor(results[-1]) if has_next else None
+
+        return results
+
+    def get_cursor_filter(self, cursor: tuple, newest_first: bool) -> Q:
+        date_published, pk = cursor
+
+        # the plain range on date_published is redundant, but unlike the OR it can be used
+        # as an index condition so the scan starts at the cursor instead of the first row
+        if newest_first:
+            return Q(date_published__lte=date_published) & (
+                Q(date_published__lt=date_published) | Q(date_published=date_published, pk__lt=pk)
+            )
+
+        return Q(date_published__gte=date_published) & (
+            Q(date_published__gt=date_published) | Q(date_published=date_published, pk__gt=pk)
+        )
+
+    def encode_cursor(self, row: dict) -> str:
+        key = json.dumps([row['date_published'].isoformat(), row['id']])
+
+        return urlsafe_b64encode(key.encode()).decode()
+
+    def decode_cursor(self, cursor: str):
+        # no cursor means the first page
+        if not cursor:
+            return None
+
+        try:
+            date_str, pk = json.loads(urlsafe_b64decode(cursor.encode()))
+            date_published = parse_datetime(date_str)
+        except (Base64Error, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if date_published is None or type(pk) != int:
+            raise NotFound(self.invalid_cursor_message)
+
+        return date_published, pk
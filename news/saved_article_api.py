@@ -3,9 +3,10 @@ from rest_framework import permissions
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .serializers import ArticleSerializer, SavedArticleSerializer
-from .models import Article, ArticleNlp, SavedArticle
-from .utils import get_article_nlp, get_counts_by_topic, get_counts_by_sentiment, get_subjectivity_by_sentiment, get_counts_by_date_per_topic
+from .serializers import ArticleFeedSerializer, SavedArticleSerializer
+from .models import Article, ArticleFeed, SavedArticle
+from .feed import read_from_feed
+from .utils import get_article_feed, get_feed_fields, get_counts_by_topic, get_counts_by_sentiment, get_subjectivity_by_sentiment, get_counts_by_date_per_topic
 
 
 # ModelViewSet includes methods to get objects, create, edit and delete by default.
@@ -18,23 +19,25 @@ class SavedArticleViewset(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'delete'] # ModelViewSet includes many methods out of the box, so this limits them to only what is needed
 
     # list all articles saved by the current user
+    # supports the same fields, exclude and summary query params as /api/article
     def list(self, request):
-        # query the saved articles for this user
-        user_saved_articles = self.queryset.filter(user=request.user)
-        article_ids = [saved_article.article_id for saved_article in user_saved_articles]
-        articles = Article.objects.filter(id__in=article_ids)
-        
-        # serialize the result
-        article_serializer = ArticleSerializer(articles, many=True)
-        response_data = article_serializer.data
-
-        # add the NLP data to the response object
-        # this is duplicate code from ArticleViewSet, need to refactor this file to make this stuff more reusable
-        for article in response_data:
-            nlp_queryset = ArticleNlp.objects.filter(article_id=article['id'])
-            article_nlp = nlp_queryset.first()
-            article['nlp'] = get_article_nlp(article_nlp)
-        
+        try:
+            fields, summary_length = get_feed_fields(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # query the saved articles for this user, from the ArticleFeed read model if it's turned on,
+        # otherwise joined with their NLP in one query
+        if read_from_feed():
+            saved_article_ids = self.queryset.filter(user=request.user).values('article_id')
+            articles = ArticleFeed.objects.filter(article_id__in=saved_article_ids)
+        else:
+            articles = self.get_saved_articles(request.user)
+
+        feed_queryset = get_article_feed(articles, fields, summary_length)
+        feed_serializer = ArticleFeedSerializer(feed_queryset, many=True, response_fields=fields)
+        response_data = feed_serializer.data
+
         return Response(response_data)
 
     # save an article
@@ -92,9 +95,7 @@ class SavedArticleViewset(viewsets.ModelViewSet):
 
     def get_saved_articles(self, user):
         # get saved articles for the current user
-        user_saved_articles = self.queryset.filter(user=user)
-        article_ids = [saved_article.article_id for saved_article in user_saved_articles]
-        articles = Article.objects.filter(id__in=article_ids)
+        articles = Article.objects.filter(savedarticle__user=user)
 
         return articles
 
@@ -0,0 +1,200 @@
+# Sentiment scoring for many texts at once with TextBlob's lexicon and numpy.
+#
+# TextBlob's PatternAnalyzer looks every word up in its lexicon in pure Python, keeping track
+# of modifiers ("very good"), negations ("not good"), exclamation marks and emoticons as it goes.
+# For a text without any of those the score is simply the average polarity and subjectivity of
+# the words found in the lexicon, which for a batch of texts is a sparse text-word count matrix
+# times the lexicon's score vectors. Texts that have any of them are scored by TextBlob instead,
+# so the scores are always the same as TextBlob's, up to floating point rounding.
+from django.db import transaction
+from .cache import bump_data_version
+from .feed import refresh_article_feed
+from .model_registry import registry
+from .models import ArticleNlp
+from .nlp import get_sentiment
+from scipy.sparse import csr_matrix
+import numpy as np
+import re
+
+# TextBlob scores a text like this as a WordNet synset ID instead of a string of words
+SYNSET_ID = re.compile(r'^[acdnrv][-_][0-9]+$')
+
+TEXTBLOB = 'textblob'
+LEXICON = 'lexicon'
+SENTIMENT_ENGINES = (TEXTBLOB, LEXICON)
+
+
+def rescore_article_sentiment(engine: str = LEXICON, batch_size: int = 1000) -> int:
+    """
+    Score the sentiment of every article's content again and store it in ArticleNlp and the feed.
+
+    Args:
+        engine (str): 'lexicon' to score each batch at once, or 'textblob'
+        batch_size (int): number of articles to score and write at a time
+
+    Returns:
+        int: number of ArticleNlp rows updated
+    """
+    rows = ArticleNlp.objects.order_by('id').values_list('id', 'article_id', 'article__content')
+    last_id = 0
+    num_rows = 0
+
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+
+        if not batch:
+            break
+
+        texts = [content for _, _, content in batch]
+
+        if engine == LEXICON:
+            sentiments = registry.get('sentiment_lexicon').score_texts(texts)
+        else:
+            sentiments = [get_sentiment(text) for text in texts]
+
+        # the columns have three decimal places
+        updated = [
+            ArticleNlp(
+                id=nlp_id, sentiment=round(sentiment['sentiment'], 3), subjectivity=round(sentiment['subjectivity'], 3)
+            )
+            for (nlp_id, _, _), sentiment in zip(batch, sentiments)
+        ]
+
+        # bulk_update doesn't send the signals that keep the feed in sync
+        with transaction.atomic():
+            ArticleNlp.objects.bulk_update(updated, ['sentiment', 'subjectivity'])
+            refresh_article_feed([article_id for _, article_id, _ in batch])
+
+        last_id = batch[-1][0]
+        num_rows += len(batch)
+
+    bump_data_version()
+
+    return num_rows
+
+
+class LexiconSentiment:
+    """
+    TextBlob's sentiment lexicon compiled into sorted numpy arrays: the words, and their
+    polarity, subjectivity and intensity. Words are looked up with a binary search over the
+    whole batch at once.
+
+    Build one from TextBlob with from_textblob, it's loaded once per process by the model
+    registry as 'sentiment_lexicon'.
+    """
+
+    def __init__(self, words, polarity, subjectivity, intensity, special_words, tokenizer=str.split):
+        order = np.argsort(np.asarray(words, dtype=str))
+        self.words = np.asarray(words, dtype=str)[order]
+        self.polarity = np.asarray(polarity, dtype=np.float64)[order]
+        self.subjectivity = np.asarray(subjectivity, dtype=np.float64)[order]
+        # only used by TextBlob for modifiers, which aren't scored here, kept so the table is complete
+        self.intensity = np.asarray(intensity, dtype=np.float64)[order]
+
+        # words that make TextBlob change the scores of the words around them
+        self.special_words = np.unique(np.asarray(special_words, dtype=str))
+        self.tokenizer = tokenizer
+
+        # longer tokens can't be in the lexicon, so they're left out of the token arrays
+        self.max_word_length = max(self.words.dtype.itemsize, self.special_words.dtype.itemsize) // 4
+
+    def __len__(self):
+        return len(self.words)
+
+    @classmethod
+    def from_textblob(cls):
+        """
+        Returns:
+            LexiconSentiment: TextBlob's English lexicon with the same tokenizer TextBlob uses
+        """
+        from textblob._text import EMOTICONS
+        from textblob.en import sentiment as lexicon
+
+        # the lexicon loads itself the first time it's used, None has the average scores of all
+        # the word's parts of speech, which is what TextBlob uses for untagged text
+        entries = list(lexicon.items())
+        scores = np.array([pos[None] for _, pos in entries], dtype=np.float64)
+
+        modifiers = [word for word, pos in entries if any(modifier in pos for modifier in lexicon.modifiers)]
+        emoticons = [emoticon.lower() for group in EMOTICONS.values() for emoticon in group]
+        special_words = list(lexicon.negations) + modifiers + emoticons + ['!', '(!)']
+
+        return cls(
+            [word for word, _ in entries], scores[:, 0], scores[:, 1], scores[:, 2], special_words, lexicon.tokenizer
+        )
+
+    def tokenize(self, text: str) -> list:
+        # the same lowercase words TextBlob scores
+        return ' '.join(self.tokenizer(text)).lower().split()
+
+    def find(self, sorted_words: np.ndarray, tokens: np.ndarray) -> np.ndarray:
+        # row of each token in sorted_words, -1 for tokens that aren't in it
+        if not len(sorted_words):
+            return np.full(len(tokens), -1)
+
+        rows = np.minimum(np.searchsorted(sorted_words, tokens), len(sorted_words) - 1)
+
+        return np.where(sorted_words[rows] == tokens, rows, -1)
+
+    def score(self, documents: list) -> tuple:
+        """
+        Score a batch of tokenized documents.
+
+        Args:
+            documents (list): list of lowercase tokens for each document, see tokenize
+
+        Returns:
+            tuple: polarity, subjectivity and exact arrays with a value for each document. Exact is
+                   False for documents with modifiers, negations, exclamation marks or emoticons,
+                   their polarity and subjectivity ignore those and don't match TextBlob
+        """
+        lengths = [len(document) for document in documents]
+        tokens = np.array(
+            [token if len(token) <= self.max_word_length else '' for document in documents for token in document],
+            dtype=f'U{max(self.max_word_length, 1)}'
+        )
+        document_ids = np.repeat(np.arange(len(documents)), lengths)
+
+        rows = self.find(self.words, tokens)
+        known = rows >= 0
+
+        # number of times each lexicon word appears in each document
+        counts = csr_matrix(
+            (np.ones(known.sum()), (document_ids[known], rows[known])), shape=(len(documents), len(self.words))
+        )
+        num_words = np.bincount(document_ids[known], minlength=len(documents))
+
+        # TextBlob averages the scores of the words it found, 0 if it didn't find any
+        polarity = counts @ self.polarity / np.maximum(num_words, 1)
+        subjectivity = counts @ self.subjectivity / np.maximum(num_words, 1)
+
+        special = self.find(self.special_words, tokens) >= 0
+        exact = np.bincount(document_ids[special], minlength=len(documents)) == 0
+
+        return polarity, subjectivity, exact
+
+    def score_texts(self, texts: list, chunk_length: int = None) -> list:
+        """
+        Score a batch of texts, the ones that can't be scored exactly from the lexicon are
+        scored by TextBlob.
+
+        Args:
+            texts (list): texts to score
+            chunk_length (int): texts longer than this are scored by TextBlob a chunk at a time
+                                instead of being tokenized all at once, see nlp.get_sentiment
+
+        Returns:
+            list: {'sentiment', 'subjectivity'} for each text, the same as nlp.get_sentiment
+        """
+        scored = [i for i, text in enumerate(texts) if chunk_length is None or len(text) <= chunk_length]
+        polarity, subjectivity, exact = self.score([self.tokenize(texts[i]) for i in scored])
+        results = [None] * len(texts)
+
+        for row, i in enumerate(scored):
+            if exact[row] and not SYNSET_ID.match(texts[i]):
+                results[i] = {'sentiment': float(polarity[row]), 'subjectivity': float(subjectivity[row])}
+
+        return [
+            result if result is not None else get_sentiment(text, chunk_length)
+            for text, result in zip(texts, results)
+        ]
@@ -11,6 +11,48 @@ class ArticleNlpSerializer(serializers.ModelSerializer):
         model = ArticleNlp
         fields = ('sentiment', 'subjectivity', 'topic', 'keywords')
 
+# Flat serializer for the rows built by utils.get_article_feed. The article, NLP and topic
+# name all come from one joined query, this just nests the NLP columns under 'nlp' so the
+# response has the same shape as ArticleSerializer + get_article_nlp.
+# response_fields picks which top level fields are returned, e.g. ['id', 'headline', 'nlp']
+class ArticleFeedSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    post_title = serializers.CharField()
+    url = serializers.CharField()
+    publisher = serializers.CharField()
+    headline = serializers.CharField()
+    date_published = serializers.DateTimeField()
+    content = serializers.CharField()
+    summary = serializers.CharField()
+    sentiment = serializers.DecimalField(max_digits=4, decimal_places=3)
+    subjectivity = serializers.DecimalField(max_digits=4, decimal_places=3)
+    topic = serializers.IntegerField()
+    keywords = serializers.CharField()
+    topic_name = serializers.CharField()
+
+    nlp_fields = ('sentiment', 'subjectivity', 'topic', 'keywords', 'topic_name')
+    default_response_fields = ('id', 'post_title', 'url', 'publisher', 'headline', 'date_published', 'content', 'nlp')
+
+    def __init__(self, *args, response_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if response_fields is None:
+            response_fields = self.default_response_fields
+
+        # drop the fields that weren't asked for, the NLP fields all go under 'nlp'
+        for name in list(self.fields):
+            if ('nlp' if name in self.nlp_fields else name) not in response_fields:
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        nlp = {field: data.pop(field) for field in self.nlp_fields if field in data}
+
+        if nlp:
+            data['nlp'] = nlp
+
+        return data
+
 class SavedArticleSerializer(serializers.ModelSerializer):
     class Meta:
         model = SavedArticle
@@ -0,0 +1,41 @@
+# Signal handlers that keep derived data (the ArticleFeed read model and the response
+# cache version) in sync when articles, their NLP or topic names are written through the
+# ORM. bulk_create and queryset.update() don't send signals, anything using them has to
+# call feed.refresh_article_feed and cache.bump_data_version itself.
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import TOPICS_DATA_VERSION, bump_data_version
+from .feed import refresh_article_feed
+from .models import Article, ArticleFeed, ArticleNlp, TopicLkp
+
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, created, **kwargs):
+    # a new article has no NLP yet so it can't be in the feed, it gets added when its NLP is saved
+    if not created:
+        refresh_article_feed([instance.pk])
+
+@receiver(post_save, sender=ArticleNlp)
+@receiver(post_delete, sender=ArticleNlp)
+def article_nlp_changed(sender, instance, **kwargs):
+    refresh_article_feed([instance.article_id])
+
+@receiver(post_save, sender=TopicLkp)
+def topic_saved(sender, instance, **kwargs):
+    ArticleFeed.objects.filter(topic=instance.topic_id).update(topic_name=instance.topic_name)
+
+# any change to the article data invalidates the cached responses
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+@receiver(post_save, sender=ArticleNlp)
+@receiver(post_delete, sender=ArticleNlp)
+@receiver(post_save, sender=TopicLkp)
+@receiver(post_delete, sender=TopicLkp)
+def article_data_changed(sender, **kwargs):
+    bump_data_version()
+
+# reloads the topic name map (cache.get_topic_names) in every process
+@receiver(post_save, sender=TopicLkp)
+@receiver(post_delete, sender=TopicLkp)
+def topics_changed(sender, **kwargs):
+    bump_data_version(TOPICS_DATA_VERSION)
@@ -0,0 +1,323 @@
+# Similar articles from the Doc2Vec headline model, and lookups between the model and the database
+from django.conf import settings
+from django.db import transaction
+from .lru import LRUCache
+from .model_registry import registry
+from .models import Article, SimilarArticle
+from .nlp import get_stopwords
+from nltk import word_tokenize
+from hashlib import sha1
+import numpy as np
+import os
+import string
+
+# built by the build_tag_index management command, lives next to the model in STATIC_ROOT
+TAG_INDEX_FILE = 'tag_article_ids.npz'
+
+# vectors inferred for text the headline model wasn't trained on, see infer_vector
+inferred_vectors = LRUCache(getattr(settings, 'NEWS_INFERRED_VECTOR_CACHE_SIZE', 1024))
+
+
+class TagIndex:
+    """
+    Maps the document tags of the headline model (e.g. 'SENT_12') straight to article IDs.
+
+    The tags are kept sorted in one numpy array with the matching article IDs in another, so
+    a lookup is a binary search and the whole index takes a few bytes per tag instead of a
+    dictionary of headline strings.
+    """
+
+    def __init__(self, tags, article_ids):
+        order = np.argsort(tags)
+        self.tags = np.asarray(tags)[order]
+        self.article_ids = np.asarray(article_ids, dtype=np.int64)[order]
+        self._tag_by_article_id = None
+
+    def __len__(self):
+        return len(self.tags)
+
+    @classmethod
+    def build(cls, tag_lookup: dict, batch_size: int = 500):
+        """
+        Match each tag's headline to an article. Headlines are looked up in batches instead
+        of one query per tag. If several articles share a headline the oldest one is used,
+        same as Article.objects.filter(headline=h).first() did.
+
+        Args:
+            tag_lookup (dict): key is the tag, value is the headline it was trained on
+            batch_size (int): number of headlines to look up per query
+
+        Returns:
+            TagIndex: index of the tags that matched an article, tags that didn't match are left out
+        """
+        headlines = list(set(tag_lookup.values()))
+        article_by_headline = {}
+
+        for start in range(0, len(headlines), batch_size):
+            articles = Article.objects.filter(headline__in=headlines[start:start + batch_size])
+
+            for headline, article_id in articles.order_by('-id').values_list('headline', 'id'):
+                article_by_headline[headline] = article_id
+
+        tags = [tag for tag, headline in tag_lookup.items() if headline in article_by_headline]
+
+        return cls(tags, [article_by_headline[tag_lookup[tag]] for tag in tags])
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as index:
+            return cls(index['tags'], index['article_ids'])
+
+    def save(self, path: str):
+        # write to a temporary file first so a running server never loads a half written index
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, tags=self.tags, article_ids=self.article_ids)
+        os.replace(tmp_path, path)
+
+    def get_article_ids(self, tags: list) -> list:
+        """
+        Args:
+            tags (list): document tags from the headline model
+
+        Returns:
+            list: article ID for each tag in the same order, None for tags that aren't in the index
+        """
+        if not len(self.tags) or not len(tags):
+            return [None] * len(tags)
+
+        # don't cast to the index dtype, that would cut off tags longer than the longest indexed tag
+        tags = np.asarray(tags, dtype=str)
+        positions = np.searchsorted(self.tags, tags).clip(max=len(self.tags) - 1)
+        found = self.tags[positions] == tags
+
+        return [int(article_id) if ok else None for article_id, ok in zip(self.article_ids[positions], found)]
+
+    def get_tag(self, article_id: int):
+        # tag of an article in the headline model, None if it wasn't trained on the article
+        if self._tag_by_article_id is None:
+            self._tag_by_article_id = {}
+
+            for tag, indexed_id in zip(self.tags.tolist(), self.article_ids.tolist()):
+                self._tag_by_article_id.setdefault(indexed_id, tag)
+
+        return self._tag_by_article_id.get(article_id)
+
+
+# cleans headline text by tokenizing it and removing stopwords and punctuation
+def clean_headline(headline: str) -> list:
+    stop_words = get_stopwords()
+    return [word for word in word_tokenize(headline) if word not in stop_words and word not in string.punctuation]
+
+def get_article_ids_by_tags(tags: list) -> list:
+    """
+    Args:
+        tags (list): document tags from the headline model
+
+    Returns:
+        list: article ID for each tag in the same order, None for tags that don't match an article
+    """
+    try:
+        return registry.get('tag_index').get_article_ids(tags)
+    except FileNotFoundError:
+        # the index hasn't been built yet (manage.py build_tag_index), go through the headlines instead
+        tag_lookup = registry.get('tag_lookup')
+        headlines = [tag_lookup.get(tag) for tag in tags]
+
+        # if several articles share a headline use the oldest one
+        articles = Article.objects.filter(headline__in=headlines).order_by('-id').values_list('headline', 'id')
+        article_by_headline = dict(articles)
+
+        return [article_by_headline.get(headline) for headline in headlines]
+
+def infer_vector(text: str) -> np.ndarray:
+    """
+    Embedding of a headline or other text that the headline model wasn't trained on.
+
+    Inference runs many epochs of SGD and gives a slightly different vector each time, so
+    the vectors are kept in an LRU keyed by a hash of the cleaned tokens. The same text then
+    costs a dictionary lookup and always gets the same neighbours within a process.
+
+    Args:
+        text (str): text to embed
+
+    Returns:
+        np.ndarray: the inferred vector, read-only since it's shared through the cache
+    """
+    tokens = clean_headline(text)
+    key = sha1(' '.join(tokens).encode()).hexdigest()
+    vector = inferred_vectors.get(key)
+
+    if vector is None:
+        vector = registry.get('headline_model').infer_vector(tokens)
+        vector.setflags(write=False)
+        inferred_vectors.set(key, vector)
+
+    return vector
+
+def get_stored_vector(article_id: int, headline: str = None):
+    """
+    Trained vector of an article from the vector index, or from the headline model if the index
+    hasn't been built. The article's tag comes from the tag index, or from its headline if that
+    hasn't been built either.
+
+    Args:
+        article_id (int): ID of the article
+        headline (str): headline of the article, used to find its tag without the tag index
+
+    Returns:
+        np.ndarray: the article's vector, None if the model wasn't trained on the article
+    """
+    try:
+        return registry.get('vector_index').get_vector(article_id)
+    except FileNotFoundError:
+        pass
+
+    try:
+        tag = registry.get('tag_index').get_tag(article_id)
+    except FileNotFoundError:
+        try:
+            tag = registry.get('tags_by_headline').get(headline)
+        except FileNotFoundError:
+            return None
+
+    return None if tag is None else registry.get('headline_model').docvecs[tag]
+
+def get_article_vector(article_id: int, headline: str) -> np.ndarray:
+    # articles the model was trained on already have a vector, only infer one for new articles
+    vector = get_stored_vector(article_id, headline)
+
+    return vector if vector is not None else infer_vector(headline)
+
+def search_similar(vectors: list, num_results: int, exclude_ids: list) -> list:
+    """
+    Find the most similar articles to each vector. Uses the vector index (manage.py build_vector_index),
+    approximate search is used if the NEWS_SIMILARITY_SEARCH setting is 'approximate'. Without an index
+    this falls back to scanning the vectors in the headline model.
+
+    Args:
+        vectors (list): embeddings to find similar articles for
+        num_results (int): number of similar articles to find for each vector
+        exclude_ids (list): article ID to leave out of the results of each vector, or None
+
+    Returns:
+        list: for each vector a list of (article ID, similarity) tuples, most similar first
+    """
+    try:
+        index = registry.get('vector_index')
+    except FileNotFoundError:
+        return [search_headline_model(vector, num_results, exclude_id) for vector, exclude_id in zip(vectors, exclude_ids)]
+
+    approximate = getattr(settings, 'NEWS_SIMILARITY_SEARCH', 'exact') == 'approximate'
+
+    return index.search(vectors, num_results, exclude_ids, approximate=approximate)
+
+def search_headline_model(vector, num_results: int, exclude_id: int = None) -> list:
+    # brute force search with gensim, only used until the vector index is built
+    model = registry.get('headline_model')
+
+    # ask for one extra result since the closest match is usually the article itself
+    similar = model.docvecs.most_similar(positive=[vector], topn=num_results + 1)
+    article_ids = get_article_ids_by_tags([tag for tag, _ in similar])
+
+    results = []
+    seen = {exclude_id, None}
+
+    # tags that share a headline map to the same article, only keep the first one
+    for article_id, (_, similarity) in zip(article_ids, similar):
+        if article_id not in seen:
+            seen.add(article_id)
+            results.append((article_id, similarity))
+
+    return results[:num_results]
+
+def find_similar_articles(articles: list, num_results: int) -> list:
+    """
+    Find the most similar articles to each of a list of articles with the headline model. All the
+    articles are searched with one matrix product. get_similar only does this for articles that
+    aren't in the SimilarArticle table.
+
+    Args:
+        articles (list): (article ID, headline) tuples, each article is left out of its own results.
+                         The headline is only used if the model wasn't trained on the article
+        num_results (int): number of similar articles to find for each article
+
+    Returns:
+        list: for each article a list of (article ID, similarity) tuples, most similar first
+    """
+    if not articles:
+        return []
+
+    vectors = [get_article_vector(article_id, headline) for article_id, headline in articles]
+
+    return search_similar(vectors, num_results, [article_id for article_id, _ in articles])
+
+def infer_similar_articles(text: str, num_results: int) -> list:
+    """
+    Find the most similar articles to any text, e.g. a headline that isn't in the database.
+    The inferred vector is cached, so the same text is only run through the model once.
+
+    Args:
+        text (str): text to find similar articles for
+        num_results (int): number of similar articles to find
+
+    Returns:
+        list: (article ID, similarity) tuples, most similar first
+    """
+    return search_similar([infer_vector(text)], num_results, [None])[0]
+
+def get_stored_similar_article_ids(article_ids: list, num_results: int) -> dict:
+    """
+    Precomputed neighbours of several articles from one query.
+
+    Returns:
+        dict: key is the article ID, value is a list of up to num_results similar article IDs, most
+              similar first. Articles without stored neighbours aren't in the dictionary
+    """
+    similar = SimilarArticle.objects.filter(article_id__in=article_ids, rank__lte=num_results).order_by('article_id', 'rank')
+    similar_ids = {}
+
+    for article_id, similar_id in similar.values_list('article_id', 'similar_article_id'):
+        similar_ids.setdefault(article_id, []).append(similar_id)
+
+    return similar_ids
+
+def compute_similar_articles(article_ids: list = None, top_k: int = 10, batch_size: int = 500) -> int:
+    """
+    Fill the SimilarArticle table with the top_k most similar articles of each article.
+    Each batch replaces the stored neighbours of its articles in one transaction, so
+    get_similar never sees a partly written list.
+
+    Args:
+        article_ids (list): articles to compute neighbours for, defaults to every article
+        top_k (int): number of neighbours to store per article
+        batch_size (int): number of articles per transaction
+
+    Returns:
+        int: number of rows written
+    """
+    articles = Article.objects.order_by('id')
+
+    if article_ids is not None:
+        articles = articles.filter(id__in=article_ids)
+
+    articles = list(articles.values_list('id', 'headline'))
+    num_rows = 0
+
+    for start in range(0, len(articles), batch_size):
+        batch = articles[start:start + batch_size]
+        batch_ids = [article_id for article_id, _ in batch]
+
+        # the whole batch is searched at once, a matrix product instead of one scan per article
+        rows = [
+            SimilarArticle(article_id=article_id, similar_article_id=similar_id, rank=rank, similarity=similarity)
+            for article_id, similar in zip(batch_ids, find_similar_articles(batch, top_k))
+            for rank, (similar_id, similarity) in enumerate(similar, start=1)
+        ]
+
+        with transaction.atomic():
+            SimilarArticle.objects.filter(article_id__in=batch_ids).delete()
+            SimilarArticle.objects.bulk_create(rows)
+
+        num_rows += len(rows)
+
+    return num_rows
@@ -1,10 +1,34 @@
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
-from .models import Article, ArticleNlp, TopicLkp
-from random import random
-from datetime import datetime, timedelta
+from .models import AnalysisResult, Article, ArticleFeed, ArticleNlp, SimilarArticle, TopicLkp
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from .serializers import ArticleSerializer
+from .analysis_api import AnalysisView
+from .analysis_cache import analysis_results, get_cache_key
+from .analysis_pool import get_executor, shutdown_executor
+from .article_api import ArticleViewSet
+from .model_registry import ModelRegistry
+from .lru import LRUCache
+from .management.commands.benchmark_keywords import find_keywords_reference, generate_article
+from .nlp import analyze_text, find_keywords, get_batch_topic_probabilities, get_sentiment, iter_chunks, preprocess_for_topics
+from .sentiment import LexiconSentiment
+from .similarity import TagIndex, compute_similar_articles, get_article_vector, inferred_vectors
+from .vector_index import VectorIndex, normalize
+from .utils import get_article_nlp
+from nltk.tokenize import sent_tokenize
+from random import Random, random
+from datetime import datetime, timedelta, timezone
+import io
 import json
+import numpy as np
+import os
+import tempfile
+from unittest import mock
 
 NUM_ARTICLES = 500
 NUM_TOPICS = 4
@@ -76,6 +100,310 @@ class ArticleViewSetTestCase(APITestCase):
 
         self.assertEqual(len(response_data['articles']), 20)
 
+    # the feed is built from one joined query no matter how many articles are returned
+    @override_settings(NEWS_RESPONSE_CACHE=None)
+    def test_list_articles_query_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/article')
+
+        self.assertEqual(len(json.loads(response.content)), NUM_ARTICLES)
+
+        # one query for the page count and one for the page itself
+        with self.assertNumQueries(2):
+            self.client.get('/api/article', data={'page': 1})
+
+    # the joined feed should have the same shape as serializing the article and NLP separately
+    def test_list_articles_response_shape(self):
+        response = self.client.get('/api/article', data={'page': 1})
+        article_data = json.loads(response.content)['articles'][0]
+
+        article = Article.objects.get(pk=article_data['id'])
+        expected = ArticleSerializer(article).data
+        expected['nlp'] = get_article_nlp(ArticleNlp.objects.get(article=article))
+
+        self.assertEqual(article_data, json.loads(json.dumps(expected)))
+
+    # follow next_cursor until the end and make sure every article comes back once, in order
+    @override_settings(NEWS_RESPONSE_CACHE=None)
+    def test_cursor_pagination(self):
+        # add a few articles that share a publish date so the id tie-breaker is used
+        for i in range(3):
+            article = Article.objects.create(
+                post_title=f'same day {i}',
+                url='www.article.com',
+                publisher='test publisher',
+                headline='some very important news',
+                date_published=datetime(2021, 4, 30).strftime('%Y-%m-%d'),
+                content='same day'
+            )
+            ArticleNlp.objects.create(article=article, topic=self.topics[0], sentiment=0, subjectivity=0)
+
+        def str_to_dt(date_str):
+            return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%SZ')
+
+        for order in ['new', 'old']:
+            keys = []
+            cursor = ''
+
+            while cursor is not None:
+                # each page is a single query, no COUNT(*)
+                with self.assertNumQueries(1):
+                    response = self.client.get('/api/article', data={'cursor': cursor, 'order': order})
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                response_data = json.loads(response.content)
+                self.assertLessEqual(len(response_data['articles']), 20)
+
+                keys += [(str_to_dt(a['date_published']), a['id']) for a in response_data['articles']]
+                cursor = response_data['next_cursor']
+
+            self.assertEqual(len(keys), NUM_ARTICLES + 3)
+            self.assertEqual(keys, sorted(keys, reverse=order == 'new'))
+
+    # filters should be applied to every cursor page
+    def test_cursor_pagination_with_filters(self):
+        params = {
+            'cursor': '',
+            'topic': 1,
+            'minSentiment': -0.5
+        }
+
+        ids = []
+
+        while params['cursor'] is not None:
+            response_data = json.loads(self.client.get('/api/article', data=params).content)
+            ids += [a['id'] for a in response_data['articles']]
+            params['cursor'] = response_data['next_cursor']
+
+        expected = Article.objects.filter(articlenlp__topic=1, articlenlp__sentiment__gte=-0.5)
+        self.assertEqual(sorted(ids), sorted(expected.values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/article', data={'cursor': 'not a cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # every word in headlineSearch has to match, this works on postgres and the sqlite fallback
+    def test_headline_search(self):
+        headlines = ['Hurricane makes landfall in Florida', 'Florida passes new budget', 'Hurricane season forecast']
+
+        for headline in headlines:
+            article = Article.objects.create(
+                post_title=headline,
+                url='www.article.com',
+                publisher='test publisher',
+                headline=headline,
+                date_published=datetime(2021, 5, 1).strftime('%Y-%m-%d'),
+                content='search test'
+            )
+            ArticleNlp.objects.create(article=article, topic=self.topics[0], sentiment=0, subjectivity=0)
+
+        for order in ['new', 'relevance']:
+            response = self.client.get('/api/article', data={'headlineSearch': 'hurricane florida', 'order': order})
+            response_data = json.loads(response.content)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([a['headline'] for a in response_data], [headlines[0]])
+
+        response = self.client.get('/api/article', data={'headlineSearch': 'hurricane', 'page': 1})
+        response_data = json.loads(response.content)
+
+        self.assertEqual(len(response_data['articles']), 2)
+
+    # the ArticleFeed read model should follow writes to articles, NLP and topics
+    def test_article_feed_kept_in_sync(self):
+        self.assertEqual(ArticleFeed.objects.count(), NUM_ARTICLES)
+
+        article_nlp = ArticleNlp.objects.first()
+        article_nlp.sentiment = 0.5
+        article_nlp.save()
+
+        self.assertEqual(float(ArticleFeed.objects.get(pk=article_nlp.article_id).sentiment), 0.5)
+
+        topic = self.topics[0]
+        topic.topic_name = 'renamed topic'
+        topic.save()
+
+        self.assertFalse(ArticleFeed.objects.filter(topic=topic.topic_id).exclude(topic_name='renamed topic').exists())
+
+        article_nlp.delete()
+
+        self.assertFalse(ArticleFeed.objects.filter(pk=article_nlp.article_id).exists())
+
+    def test_rebuild_article_feed(self):
+        ArticleFeed.objects.all().delete()
+        call_command('rebuild_article_feed', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(ArticleFeed.objects.count(), NUM_ARTICLES)
+
+    # reading from the feed shouldn't need any joins and should give the same response as the joined tables
+    @override_settings(NEWS_READ_FROM_FEED=True)
+    @override_settings(NEWS_RESPONSE_CACHE=None)
+    def test_list_articles_from_feed(self):
+        params = {
+            'page': 2,
+            'topic': 1,
+            'minSubjectivity': 0.2
+        }
+
+        with CaptureQueriesContext(connection) as captured:
+            feed_response = self.client.get('/api/article', data=params)
+
+        for query in captured.captured_queries:
+            self.assertNotIn('JOIN', query['sql'])
+
+        with override_settings(NEWS_READ_FROM_FEED=False):
+            table_response = self.client.get('/api/article', data=params)
+
+        self.assertEqual(json.loads(feed_response.content), json.loads(table_response.content))
+
+    @override_settings(NEWS_READ_FROM_FEED=True)
+    def test_retrieve_article_from_feed(self):
+        article = self.articles[0]
+
+        with self.assertNumQueries(1):
+            feed_response = self.client.get(f'/api/article/{article.id}')
+
+        with override_settings(NEWS_READ_FROM_FEED=False):
+            table_response = self.client.get(f'/api/article/{article.id}')
+
+        self.assertEqual(json.loads(feed_response.content), json.loads(table_response.content))
+
+    # the same request should be served from the cache until the articles change
+    def test_response_cache(self):
+        response = self.client.get('/api/article/count_by_sentiment')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        counts = json.loads(response.content)
+
+        # the only query on a hit is reading the data version
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/article/count_by_sentiment')
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(json.loads(response.content), counts)
+
+        # params in a different order are the same request
+        self.client.get('/api/article', data={'page': 1, 'topic': 1})
+        response = self.client.get('/api/article?topic=1&page=1')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        # the views read the last value of a repeated param, so the order of its values matters
+        response = self.client.get('/api/article?page=1&topic=0&topic=1')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = self.client.get('/api/article?page=1&topic=1&topic=0')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(
+            json.loads(response.content), json.loads(self.client.get('/api/article', data={'page': 1, 'topic': 0}).content)
+        )
+        self.assertNotEqual(
+            json.loads(response.content), json.loads(self.client.get('/api/article', data={'page': 1, 'topic': 1}).content)
+        )
+
+        # adding an article invalidates every cached response
+        article = Article.objects.create(
+            post_title='new article',
+            url='www.article.com',
+            publisher='test publisher',
+            headline='breaking news',
+            date_published=datetime(2021, 5, 1).strftime('%Y-%m-%d'),
+            content='breaking news'
+        )
+        ArticleNlp.objects.create(article=article, topic=self.topics[0], sentiment=0.5, subjectivity=0.5)
+
+        response = self.client.get('/api/article/count_by_sentiment')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(response.content), dict(counts, positive=counts['positive'] + 1))
+
+        response = self.client.get('/api/article/cache_stats')
+        stats = json.loads(response.content)
+        self.assertTrue(stats['enabled'])
+        self.assertGreaterEqual(stats['endpoints']['count_by_sentiment']['hits'], 1)
+        self.assertGreaterEqual(stats['endpoints']['count_by_sentiment']['misses'], 2)
+
+    # only the requested fields should come back, and content shouldn't be read if it isn't requested
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/api/article', data={'page': 1, 'fields': 'id,headline,nlp'})
+        response_data = json.loads(response.content)
+
+        for article in response_data['articles']:
+            self.assertEqual(list(article.keys()), ['id', 'headline', 'nlp'])
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/article', data={'page': 1, 'exclude': 'content,nlp'})
+
+        response_data = json.loads(response.content)
+        self.assertNotIn('content', response_data['articles'][0])
+        self.assertNotIn('nlp', response_data['articles'][0])
+
+        for query in captured.captured_queries:
+            self.assertNotIn('"content"', query['sql'])
+
+        # sparse fieldsets should work with cursor pagination too
+        response = self.client.get('/api/article', data={'cursor': '', 'fields': 'headline'})
+        response_data = json.loads(response.content)
+
+        self.assertEqual(list(response_data['articles'][0].keys()), ['headline'])
+        self.assertIsNotNone(response_data['next_cursor'])
+
+    def test_summary(self):
+        response = self.client.get('/api/article', data={'page': 1, 'summary': 10})
+        response_data = json.loads(response.content)
+
+        for article in response_data['articles']:
+            self.assertNotIn('content', article)
+            self.assertEqual(article['summary'], self.articles[0].content[:10])
+            self.assertIn('nlp', article)
+
+    # the export should stream every article once as a line of JSON, in id order, from a single query
+    def test_export(self):
+        response = self.client.get('/api/article/export')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        with self.assertNumQueries(1):
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        articles = [json.loads(line) for line in lines]
+        self.assertEqual([a['id'] for a in articles], sorted(a.id for a in self.articles))
+
+        # each line should look the same as an article from the list endpoint
+        list_articles = json.loads(self.client.get('/api/article').content)
+        self.assertEqual(articles, sorted(list_articles, key=lambda a: a['id']))
+
+    def test_export_filters_and_resume(self):
+        params = {'topic': 1, 'minSentiment': 0, 'fields': 'id,nlp'}
+        response = self.client.get('/api/article/export', data=params)
+        articles = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        expected_ids = list(
+            Article.objects.filter(articlenlp__topic=1, articlenlp__sentiment__gte=0).order_by('id').values_list('id', flat=True)
+        )
+        self.assertEqual([a['id'] for a in articles], expected_ids)
+        self.assertEqual(list(articles[0].keys()), ['id', 'nlp'])
+
+        # resuming after an id should give the rest of the export
+        after_id = expected_ids[len(expected_ids) // 2]
+        response = self.client.get('/api/article/export', data=dict(params, afterId=after_id))
+        resumed = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(resumed, [a for a in articles if a['id'] > after_id])
+
+        response = self.client.get('/api/article/export', data={'afterId': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_fields(self):
+        bad_params = [
+            {'fields': 'id,not_a_field'},
+            {'exclude': 'not_a_field'},
+            {'summary': 'abc'},
+            {'fields': 'id,summary'}
+        ]
+
+        for params in bad_params:
+            response = self.client.get('/api/article', data=params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # make sure we get 404 when a page is too big or small
     def test_page_out_of_bounds(self):
         big_page = {
@@ -319,6 +647,9 @@ class TopicViewSetTestCase(APITestCase):
         self.topics = []
         self.topic_counts = {}
 
+        # results memoized by an earlier test may have come from a different mocked model
+        analysis_results.clear()
+
         date = datetime(2021, 11, 30)
 
         # create 500 articles
@@ -387,6 +718,9 @@ class AnalysisViewSetTestCase(APITestCase):
         self.topics = []
         self.topic_counts = {}
 
+        # results memoized by an earlier test may have come from a different mocked model
+        analysis_results.clear()
+
         date = datetime(2021, 11, 30)
 
         # create 500 articles
@@ -431,6 +765,9 @@ class AnalysisViewSetTestCase(APITestCase):
                 topic.topic_name: ArticleNlp.objects.filter(topic__id=topic.id).count()
             })
 
+    def tearDown(self):
+        analysis_results.clear()
+
     def test_positive_sentiment_analysis(self):
         data = {
             'text': 'I think dogs are good'
@@ -470,6 +807,274 @@ class AnalysisViewSetTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    # the model should only be loaded once and the topic names shouldn't be queried per topic
+    def test_topic_probability_names(self):
+        model = mock.MagicMock()
+        model.__getitem__.return_value = [(0, 0.75), (2, 0.25)]
+        data = {'text': 'This new technology is really cool'}
+
+        with mock.patch('news.analysis_api.registry.get', return_value=model) as get_model, \
+                mock.patch.object(AnalysisView, 'preprocess', return_value=['technology', 'cool']):
+            self.client.post('/api/analysis/get_topic_probability', data=data, format='json')
+
+            # only the topic name version is read once the names are in memory
+            with self.assertNumQueries(1):
+                response = self.client.post('/api/analysis/get_topic_probability', data=data, format='json')
+
+            get_model.assert_called_with('lda_model')
+            self.assertEqual(json.loads(response.content), [
+                {'topic_name': 'topic 0', 'probability': 0.75},
+                {'topic_name': 'topic 2', 'probability': 0.25}
+            ])
+
+            # renaming a topic reloads the names
+            topic = TopicLkp.objects.get(topic_id=2)
+            topic.topic_name = 'renamed topic'
+            topic.save()
+
+            response = self.client.post('/api/analysis/get_topic_probability', data=data, format='json')
+
+            self.assertEqual(json.loads(response.content)[1]['topic_name'], 'renamed topic')
+
+    # the combined endpoint should tokenize the text once for keywords and topics
+    def test_analyze(self):
+        model = mock.MagicMock()
+        model.__getitem__.return_value = [(0, 0.75), (2, 0.25)]
+        lemmatizer = mock.Mock()
+        lemmatizer.lemmatize.side_effect = lambda token: token
+        text = 'Stocks fell sharply on Tuesday. Traders worried about rates. Stocks recovered later.'
+        data = {'text': text, 'analyses': ['keywords', 'topics']}
+
+        with mock.patch('news.nlp.registry.get', return_value=model), \
+                mock.patch('news.nlp.get_lemmatizer', return_value=lemmatizer), \
+                mock.patch('news.nlp.sent_tokenize', wraps=sent_tokenize) as tokenize:
+            response = self.client.post('/api/analysis/analyze', data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(tokenize.call_count, 1)
+        self.assertEqual(json.loads(response.content), {
+            'keywords': find_keywords(text),
+            'topics': [
+                {'topic_name': 'topic 0', 'probability': 0.75},
+                {'topic_name': 'topic 2', 'probability': 0.25}
+            ]
+        })
+        # the bag of words is made from the word counts, so only the words matter and not their order
+        model.id2word.doc2bow.assert_called_once()
+        self.assertCountEqual(
+            model.id2word.doc2bow.call_args[0][0],
+            ['stocks', 'fell', 'sharply', 'tuesday', 'traders', 'worried', 'rates', 'stocks', 'recovered', 'later']
+        )
+
+        for data in [{}, {'text': 1}, {'text': 'text', 'analyses': []}, {'text': 'text', 'analyses': ['nope']}]:
+            response = self.client.post('/api/analysis/analyze', data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # a text that was analyzed before should come from the memory or database tier without
+    # tokenizing it or running the model again
+    def test_analysis_memoization(self):
+        model = mock.MagicMock()
+        model.__getitem__.return_value = [(1, 1.0)]
+        lemmatizer = mock.Mock()
+        lemmatizer.lemmatize.side_effect = lambda token: token
+        data = {'text': 'Stocks fell sharply on Tuesday. Traders worried about rates.'}
+
+        with mock.patch('news.nlp.registry.get', return_value=model), \
+                mock.patch('news.nlp.get_lemmatizer', return_value=lemmatizer):
+            for analyses in [['keywords', 'topics'], ['keywords']]:
+                self.client.post('/api/analysis/analyze', data=dict(data, analyses=analyses), format='json')
+
+        expected = json.loads(self.client.post(
+            '/api/analysis/analyze', data=dict(data, analyses=['keywords', 'topics']), format='json'
+        ).content)
+
+        self.assertEqual(AnalysisResult.objects.count(), 2)
+        self.assertEqual(model.__getitem__.call_count, 1)
+
+        with mock.patch('news.nlp.sent_tokenize') as tokenize:
+            response = self.client.post(
+                '/api/analysis/analyze', data=dict(data, analyses=['keywords', 'topics']), format='json'
+            )
+            self.assertEqual(json.loads(response.content), expected)
+
+            # only the database tier left
+            analysis_results.clear()
+            response = self.client.post(
+                '/api/analysis/analyze', data=dict(data, analyses=['keywords', 'topics']), format='json'
+            )
+            self.assertEqual(json.loads(response.content), expected)
+
+            response = self.client.post('/api/analysis/get_keywords', data=data, format='json')
+            self.assertEqual(json.loads(response.content), {'keywords': expected['keywords']})
+
+            tokenize.assert_not_called()
+
+        # a new model version doesn't reuse the old results
+        with mock.patch('news.analysis_cache.get_model_version', return_value='new'), \
+                mock.patch('news.analysis_api.analyze_texts', return_value=[{'keywords': []}]) as analyze:
+            response = self.client.post('/api/analysis/analyze', data=dict(data, analyses=['keywords']), format='json')
+
+            analyze.assert_called_once_with([data['text']], ('keywords',))
+            self.assertEqual(json.loads(response.content), {'keywords': []})
+
+        # only the texts that weren't analyzed before are sent to the workers
+        texts = ['Brand new text.', data['text']]
+
+        with mock.patch('news.analysis_api.analyze_texts', return_value=[{'keywords': ['Brand']}]) as analyze:
+            response = self.client.post(
+                '/api/analysis/analyze_batch', data={'texts': texts, 'analyses': ['keywords']}, format='json'
+            )
+
+            analyze.assert_called_once_with(['Brand new text.'], ('keywords',), 'textblob')
+            self.assertEqual(json.loads(response.content), [
+                {'keywords': ['Brand']}, {'keywords': expected['keywords']}
+            ])
+
+    # results from another sentiment engine or chunk length shouldn't be reused
+    def test_memoized_sentiment_options(self):
+        def score_sentiment(text, engine):
+            return {'sentiment': 1.0 if engine == 'lexicon' else 0.0, 'subjectivity': 0.0}
+
+        data = {'text': 'Stocks fell sharply on Tuesday.'}
+
+        with mock.patch.object(AnalysisView, 'score_sentiment', side_effect=score_sentiment) as score:
+            for engine in ['textblob', 'lexicon', 'textblob', 'lexicon']:
+                response = self.client.post('/api/analysis/get_sentiment', data=dict(data, engine=engine), format='json')
+                self.assertEqual(json.loads(response.content)['sentiment'], 1.0 if engine == 'lexicon' else 0.0)
+
+        self.assertEqual(score.call_count, 2)
+
+        with mock.patch('news.analysis_api.analyze_texts', side_effect=lambda texts, analyses, engine: [
+            {'sentiment': score_sentiment(text, engine)} for text in texts
+        ]) as analyze:
+            for engine in ['textblob', 'lexicon']:
+                response = self.client.post(
+                    '/api/analysis/analyze_batch', data={'texts': [data['text']], 'analyses': ['sentiment'], 'engine': engine},
+                    format='json'
+                )
+                self.assertEqual(json.loads(response.content)[0]['sentiment']['sentiment'], 1.0 if engine == 'lexicon' else 0.0)
+
+        # the batch endpoint reuses the results of get_sentiment
+        analyze.assert_not_called()
+
+        # the chunk length only changes the key of texts long enough to be chunked
+        long_text = 'word ' * 100
+
+        with override_settings(NEWS_ANALYSIS_CHUNK_LENGTH=100):
+            keys = [get_cache_key(data['text'], 'sentiment'), get_cache_key(long_text, 'sentiment')]
+
+        with override_settings(NEWS_ANALYSIS_CHUNK_LENGTH=200):
+            self.assertEqual(get_cache_key(data['text'], 'sentiment'), keys[0])
+            self.assertNotEqual(get_cache_key(long_text, 'sentiment'), keys[1])
+
+    # texts over NEWS_ANALYSIS_MAX_TEXT_LENGTH should be refused by every endpoint
+    @override_settings(NEWS_ANALYSIS_MAX_TEXT_LENGTH=20)
+    def test_max_text_length(self):
+        text = 'This text is too long to analyze.'
+        endpoints = ['get_sentiment', 'get_keywords', 'get_topic_probability', 'analyze']
+
+        for endpoint in endpoints:
+            response = self.client.post(f'/api/analysis/{endpoint}', data={'text': text}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post('/api/analysis/analyze_batch', data={'texts': ['short', text]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # short texts are still analyzed
+        response = self.client.post('/api/analysis/get_keywords', data={'text': 'Short text.'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # the sentiment engine can be picked per request
+    def test_sentiment_engine(self):
+        lexicon = LexiconSentiment(['good', 'bad'], [0.7, -0.7], [0.6, 0.7], [1.0, 1.0], ['not'])
+        data = {'text': 'good good bad', 'engine': 'lexicon'}
+
+        with mock.patch('news.analysis_api.registry.get', return_value=lexicon):
+            response = self.client.post('/api/analysis/get_sentiment', data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(json.loads(response.content)['sentiment'], 0.7 / 3)
+
+        response = self.client.post('/api/analysis/get_sentiment', data=dict(data, engine='nope'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            '/api/analysis/analyze_batch', data={'texts': ['good'], 'engine': 'nope'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # batch topic inference should run the model once per chunk of texts and normalize like model[bow]
+    def test_topic_probability_batch(self):
+        gamma = np.array([[1.0, 2.0, 997.0], [5.0, 5.0, 0.0], [2.0, 1.0, 1.0]])
+        model = mock.MagicMock(num_topics=3, minimum_probability=0.01)
+        model.inference.side_effect = lambda corpus: (gamma[:len(corpus)], None)
+        texts = ['Markets rallied on Tuesday.', 'Storms hit the coast.', 'The election results are in.']
+
+        with mock.patch('news.nlp.registry.get', return_value=model), \
+                mock.patch.object(AnalysisView, 'preprocess', side_effect=lambda text: text.lower().split()):
+            response = self.client.post('/api/analysis/get_topic_probability_batch', data={'texts': texts}, format='json')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(model.inference.call_count, 1)
+            self.assertEqual(model.id2word.doc2bow.call_count, 3)
+
+            results = json.loads(response.content)
+            self.assertEqual(results['topic_names'], ['topic 0', 'topic 1', 'topic 2'])
+            np.testing.assert_allclose(results['distributions'], gamma / gamma.sum(axis=1, keepdims=True))
+            self.assertEqual(results['topics'][1], [
+                {'topic_name': 'topic 0', 'probability': 0.5}, {'topic_name': 'topic 1', 'probability': 0.5}
+            ])
+            # below gensim's minimum probability
+            self.assertEqual(len(results['topics'][0]), 1)
+
+            # chunks of documents are inferred separately
+            model.inference.side_effect = lambda corpus: (gamma[:len(corpus)] + 1, None)
+            distributions, _ = get_batch_topic_probabilities([['a'], ['b'], ['c']], chunk_size=2)
+
+            self.assertEqual(model.inference.call_count, 3)
+            np.testing.assert_allclose(distributions.sum(axis=1), 1)
+
+        for data in [{}, {'texts': []}, {'texts': 'text'}, {'texts': [1]}]:
+            response = self.client.post('/api/analysis/get_topic_probability_batch', data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # batch results should come back in the same order as the texts, whether or not the pool is used
+    def test_analyze_batch(self):
+        texts = [
+            'Stocks fell sharply on Tuesday. Traders worried about rates.',
+            'The storm moved north. Residents were told to leave. The storm weakened overnight.',
+            'Officials said the election was fair. The election results were certified.'
+        ]
+        expected = [{'keywords': find_keywords(text)} for text in texts]
+
+        # without memoized results, so the second pass really runs in the worker processes
+        for num_workers in [0, 2]:
+            with override_settings(NEWS_ANALYSIS_WORKERS=num_workers, NEWS_ANALYSIS_RESULT_CACHE_SIZE=0), \
+                    mock.patch('news.analysis_pool.get_executor', wraps=get_executor) as executor:
+                response = self.client.post(
+                    '/api/analysis/analyze_batch', data={'texts': texts, 'analyses': ['keywords']}, format='json'
+                )
+
+            self.assertEqual(executor.called, num_workers > 0)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(response.content), expected)
+
+        shutdown_executor()
+
+        bad_data = [{}, {'texts': []}, {'texts': 'text'}, {'texts': [1]}, {'texts': ['text'], 'analyses': ['nope']}]
+
+        for data in bad_data:
+            response = self.client.post('/api/analysis/analyze_batch', data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_model_stats(self):
+        response = self.client.get('/api/analysis/model_stats')
+        stats = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('headline_model', stats)
+        self.assertIn('tag_lookup', stats)
+
 class SavedArticleViewSetTestCase(APITestCase):
     # add dummy data to the test database
     def setUp(self):
@@ -587,3 +1192,629 @@ class SavedArticleViewSetTestCase(APITestCase):
         resp_data = json.loads(resp.content)
 
         self.assertEqual(resp_data['result'], 'saved article deleted')
+
+    def test_list_saved_articles(self):
+        # register for an account
+        creds = {
+            'username': 'test_user',
+            'email': 'testing@test.com',
+            'password': 'verysecurepwd'
+        }
+
+        reg_resp = self.client.post('/api/auth/register', data=creds)
+        resp_data = json.loads(reg_resp.content)
+        token = resp_data['token']
+
+        # save an article
+        art_to_save = Article.objects.first()
+        data = {
+            'article': art_to_save.id
+        }
+
+        self.client.post(
+            '/api/savearticle',
+            data=json.dumps(data),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+
+        # list the saved articles, the NLP should be nested in each article
+        resp = self.client.get(
+            '/api/savearticle',
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+
+        resp_data = json.loads(resp.content)
+
+        self.assertEqual(len(resp_data), 1)
+        self.assertEqual(resp_data[0]['id'], art_to_save.id)
+        self.assertIn('topic_name', resp_data[0]['nlp'])
+
+class ModelRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        self.registry = ModelRegistry()
+        self.load_count = 0
+
+        def load_vectors():
+            self.load_count += 1
+            return {'vectors': np.zeros((100, 10), dtype=np.float32), 'tags': ['a', 'b']}
+
+        self.registry.register('vectors', load_vectors)
+
+    # artifacts should only be loaded the first time they are used
+    def test_loads_once(self):
+        self.assertFalse(self.registry.is_loaded('vectors'))
+        self.assertEqual(self.registry.get_stats(), {'vectors': {'loaded': False}})
+
+        first = self.registry.get('vectors')
+        second = self.registry.get('vectors')
+
+        self.assertIs(first, second)
+        self.assertEqual(self.load_count, 1)
+
+        stats = self.registry.get_stats()['vectors']
+        self.assertTrue(stats['loaded'])
+        self.assertGreaterEqual(stats['load_seconds'], 0)
+        self.assertGreaterEqual(stats['heap_bytes'], 100 * 10 * 4)
+        self.assertEqual(stats['mapped_bytes'], 0)
+
+        # warm up runs on the loaded artifact, artifacts that haven't been built are skipped
+        warmed_up = []
+        self.registry.register('warm', lambda: 'model', warm_up=warmed_up.append)
+        self.registry.register('missing', lambda: open('/does/not/exist'))
+        self.registry.load_all()
+
+        self.assertEqual(warmed_up, ['model'])
+        self.assertFalse(self.registry.is_loaded('missing'))
+
+        # unloading means the next get loads it again
+        self.registry.unload('vectors')
+        self.registry.get('vectors')
+        self.assertEqual(self.load_count, 2)
+
+    def test_memory_mapped_footprint(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'vectors.npy')
+            np.save(path, np.ones((50, 8), dtype=np.float32))
+
+            self.registry.register('mapped', lambda: {'vectors': np.load(path, mmap_mode='r')})
+            vectors = self.registry.get('mapped')['vectors']
+
+            self.assertFalse(vectors.flags.writeable)
+            self.assertEqual(self.registry.get_stats()['mapped']['mapped_bytes'], 50 * 8 * 4)
+
+            # release the mapping before the directory is removed
+            self.registry.unload('mapped')
+            del vectors
+
+class SimilarityTestCase(APITestCase):
+    def setUp(self):
+        topic = TopicLkp.objects.create(topic_id=0, topic_name='topic 0')
+        self.articles = []
+
+        # the last two articles share a headline
+        for i, headline in enumerate(['first headline', 'second headline', 'third headline', 'third headline']):
+            article = Article.objects.create(
+                post_title=f'test title {i}',
+                url='www.article.com',
+                publisher='test publisher',
+                headline=headline,
+                date_published=datetime(2021, 11, 30).strftime('%Y-%m-%d'),
+                content='some content'
+            )
+            ArticleNlp.objects.create(article=article, topic=topic, sentiment=0, subjectivity=0)
+            self.articles.append(article)
+
+        self.tag_lookup = {
+            'SENT_0': 'first headline',
+            'SENT_1': 'second headline',
+            'SENT_2': 'third headline',
+            'SENT_3': 'not in the database'
+        }
+
+    def test_build_index(self):
+        index = TagIndex.build(self.tag_lookup, batch_size=2)
+        self.assertEqual(len(index), 3)
+
+        article_ids = index.get_article_ids(['SENT_2', 'SENT_0', 'SENT_3', 'SENT_1', 'SENT_10', 'SENT_'])
+        expected = [self.articles[2].id, self.articles[0].id, None, self.articles[1].id, None, None]
+        self.assertEqual(article_ids, expected)
+
+    def test_save_and_load(self):
+        index = TagIndex.build(self.tag_lookup)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'tag_article_ids.npz')
+            index.save(path)
+            loaded = TagIndex.load(path)
+
+        tags = list(self.tag_lookup)
+        self.assertEqual(loaded.get_article_ids(tags), index.get_article_ids(tags))
+
+    # the similar articles should come back from one query in the order of the IDs given
+    def test_get_articles_by_ids(self):
+        article_ids = [self.articles[2].id, self.articles[0].id, self.articles[1].id]
+
+        with self.assertNumQueries(1):
+            articles = ArticleViewSet().get_articles_by_ids(article_ids)
+
+        self.assertEqual([a['id'] for a in articles], article_ids)
+        self.assertEqual(articles[0]['nlp']['topic_name'], 'topic 0')
+
+    # stored neighbours should be returned without running the headline model
+    def test_get_similar_from_table(self):
+        article = self.articles[0]
+
+        for rank, similar in enumerate([self.articles[3], self.articles[1], self.articles[2]], start=1):
+            SimilarArticle.objects.create(article=article, similar_article=similar, rank=rank, similarity=1 / rank)
+
+        with mock.patch('news.article_api.find_similar_articles') as find:
+            response = self.client.get(f'/api/article/{article.id}/get_similar', data={'numResults': 2})
+
+        find.assert_not_called()
+        self.assertEqual([a['id'] for a in json.loads(response.content)], [self.articles[3].id, self.articles[1].id])
+
+        # asking for more than is stored runs the model
+        with mock.patch('news.article_api.find_similar_articles', return_value=[[(self.articles[1].id, 0.9)]]) as find:
+            response = self.client.get(f'/api/article/{article.id}/get_similar', data={'numResults': 5})
+
+        find.assert_called_once_with([(article.id, article.headline)], 5)
+        self.assertEqual([a['id'] for a in json.loads(response.content)], [self.articles[1].id])
+
+        # numResults must be from 1 to max_similar_results
+        for num_results in ['0', '-1', 'ten', str(ArticleViewSet.max_similar_results + 1)]:
+            response = self.client.get(f'/api/article/{article.id}/get_similar', data={'numResults': num_results})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_similar_batch(self):
+        first, second = self.articles[0], self.articles[1]
+        SimilarArticle.objects.create(article=first, similar_article=self.articles[2], rank=1, similarity=0.9)
+        SimilarArticle.objects.create(article=first, similar_article=self.articles[3], rank=2, similarity=0.8)
+
+        # the second article has no stored neighbours so it's searched for
+        found = [[(self.articles[3].id, 0.7), (first.id, 0.6)]]
+        data = {'articleIds': [first.id, 0, second.id], 'numResults': 2}
+
+        with mock.patch('news.article_api.find_similar_articles', return_value=found) as find:
+            # article IDs, stored neighbours, the article feed for every similar article
+            with self.assertNumQueries(3):
+                response = self.client.post('/api/article/get_similar_batch', data=data, format='json')
+
+        find.assert_called_once_with([(second.id, second.headline)], 2)
+        response_data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['article_id'] for entry in response_data], [first.id, 0, second.id])
+        self.assertEqual([a['id'] for a in response_data[0]['similar']], [self.articles[2].id, self.articles[3].id])
+        self.assertEqual(response_data[1], {'article_id': 0, 'error': 'article does not exist'})
+        self.assertEqual([a['id'] for a in response_data[2]['similar']], [self.articles[3].id, first.id])
+        self.assertIn('nlp', response_data[2]['similar'][0])
+
+        bad_data = [
+            {}, {'articleIds': []}, {'articleIds': ['1']}, {'articleIds': [1], 'numResults': 0},
+            {'articleIds': [1], 'numResults': ArticleViewSet.max_similar_results + 1}
+        ]
+
+        for data in bad_data:
+            response = self.client.post('/api/article/get_similar_batch', data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # the same text should only be run through the model once
+    def test_get_similar_to_text(self):
+        model = mock.Mock()
+        model.infer_vector.side_effect = lambda tokens: np.random.random(4)
+        found = [(self.articles[1].id, 0.9), (self.articles[0].id, 0.8)]
+        inferred_vectors.clear()
+
+        with mock.patch('news.similarity.registry.get', return_value=model), \
+                mock.patch('news.similarity.search_similar', return_value=[found]) as search:
+            for _ in range(3):
+                response = self.client.post(
+                    '/api/article/get_similar_to_text', data={'text': 'Election results are in', 'numResults': 2}, format='json'
+                )
+
+        self.assertEqual(model.infer_vector.call_count, 1)
+        self.assertEqual(search.call_args[0][1:], (2, [None]))
+        self.assertEqual([a['id'] for a in json.loads(response.content)], [self.articles[1].id, self.articles[0].id])
+
+        stats = json.loads(self.client.get('/api/article/cache_stats').content)['inferred_vectors']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+        bad_data = [
+            {}, {'text': 1}, {'text': ' '}, {'text': 'news', 'numResults': '5'},
+            {'text': 'news', 'numResults': ArticleViewSet.max_similar_results + 1}
+        ]
+
+        for data in bad_data:
+            response = self.client.post('/api/article/get_similar_to_text', data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compute_similar_articles(self):
+        # pretend every article is most similar to the articles after it
+        def search(vectors, num_results, exclude_ids):
+            self.assertEqual(len(vectors), len(exclude_ids))
+
+            return [
+                [(a.id, 1 - i / 10) for i, a in enumerate(self.articles) if a.id > exclude_id][:num_results]
+                for exclude_id in exclude_ids
+            ]
+
+        with mock.patch('news.similarity.get_article_vector', return_value=np.zeros(4)), \
+                mock.patch('news.similarity.search_similar', side_effect=search):
+            num_rows = compute_similar_articles(top_k=2, batch_size=3)
+
+            self.assertEqual(num_rows, 2 + 2 + 1)
+
+            stored = SimilarArticle.objects.filter(article=self.articles[0]).order_by('rank')
+            self.assertEqual([s.similar_article_id for s in stored], [self.articles[1].id, self.articles[2].id])
+
+            # running it again replaces the stored rows instead of adding to them
+            compute_similar_articles(top_k=1)
+
+        self.assertEqual(SimilarArticle.objects.count(), 3)
+
+    # vectors for new headlines should only be inferred once, articles the model knows use their stored vector
+    def test_article_vectors(self):
+        model = mock.Mock()
+        model.infer_vector.side_effect = lambda tokens: np.random.random(4)
+        inferred_vectors.clear()
+
+        with mock.patch('news.similarity.registry.get', return_value=model), \
+                mock.patch('news.similarity.get_stored_vector', return_value=None):
+            first = get_article_vector(self.articles[0].id, 'A new headline about the election')
+            # same tokens once stopwords and punctuation are removed
+            second = get_article_vector(self.articles[1].id, 'A new headline about the election.')
+
+        self.assertEqual(model.infer_vector.call_count, 1)
+        model.infer_vector.assert_called_with(['A', 'new', 'headline', 'election'])
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(inferred_vectors.get_stats()['hits'], 1)
+
+        with mock.patch('news.similarity.registry.get', return_value=model), \
+                mock.patch('news.similarity.get_stored_vector', return_value=np.ones(4)):
+            vector = get_article_vector(self.articles[0].id, 'A headline that was never seen')
+
+        self.assertEqual(model.infer_vector.call_count, 1)
+        np.testing.assert_array_equal(vector, np.ones(4))
+
+    # without the tag and vector indexes the trained vector should be found through the headline
+    def test_stored_vector_without_indexes(self):
+        model = mock.Mock()
+        model.docvecs = {'SENT_3': np.ones(4)}
+        inferred_vectors.clear()
+
+        def get(name):
+            if name in ('vector_index', 'tag_index'):
+                raise FileNotFoundError(name)
+
+            return {'tags_by_headline': {'Known headline': 'SENT_3'}, 'headline_model': model}[name]
+
+        with mock.patch('news.similarity.registry.get', side_effect=get):
+            vector = get_article_vector(self.articles[0].id, 'Known headline')
+            np.testing.assert_array_equal(vector, np.ones(4))
+            model.infer_vector.assert_not_called()
+
+            # only headlines the model wasn't trained on are inferred
+            model.infer_vector.return_value = np.zeros(4)
+            get_article_vector(self.articles[0].id, 'Unknown headline')
+            model.infer_vector.assert_called_once()
+
+class VectorIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+
+        # clusters of vectors so there are clear nearest neighbours
+        centres = rng.standard_normal((20, 16))
+        self.vectors = centres[np.arange(400) % 20] + 0.3 * rng.standard_normal((400, 16))
+        self.article_ids = np.arange(1000, 1400)
+        self.index = VectorIndex.build(self.vectors, self.article_ids)
+
+    def brute_force(self, query, k):
+        vectors = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = vectors @ (query / np.linalg.norm(query))
+
+        return [int(self.article_ids[row]) for row in np.argsort(-scores)[:k]]
+
+    # the blocked search should give the same results as scoring everything at once
+    def test_exact_search(self):
+        queries = self.vectors[:5]
+        results = self.index.search(queries, 10, block_size=64)
+
+        self.assertEqual(len(results), 5)
+
+        for query, result in zip(queries, results):
+            self.assertEqual([article_id for article_id, _ in result], self.brute_force(query, 10))
+
+            scores = [score for _, score in result]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+
+        # the article the query came from is left out
+        result = self.index.search(self.vectors[0], 5, exclude_ids=[1000])[0]
+        self.assertEqual([article_id for article_id, _ in result], self.brute_force(self.vectors[0], 6)[1:])
+
+    def test_save_and_load(self):
+        self.index.build_lsh(num_tables=4, num_bits=6)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.index.save(tmp_dir)
+            loaded = VectorIndex.load(tmp_dir)
+
+            self.assertIsInstance(loaded.vectors, np.memmap)
+            self.assertFalse(loaded.vectors.flags.writeable)
+            self.assertTrue(loaded.has_lsh)
+            self.assertEqual(loaded.search(self.vectors[:3], 5), self.index.search(self.vectors[:3], 5))
+            np.testing.assert_allclose(loaded.get_vector(1001), self.index.get_vector(1001))
+            self.assertIsNone(loaded.get_vector(1))
+
+            # release the mapping before the directory is removed
+            del loaded
+
+    # the approximate search should find most of the exact neighbours while scoring fewer vectors
+    def test_approximate_search(self):
+        self.index.build_lsh(num_tables=8, num_bits=6)
+        queries = self.vectors[:50]
+
+        exact = self.index.search(queries, 10)
+        approximate = self.index.search(queries, 10, approximate=True)
+
+        recall = np.mean([
+            len({a for a, _ in found} & {a for a, _ in expected}) / 10 for found, expected in zip(approximate, exact)
+        ])
+        self.assertGreater(recall, 0.9)
+        self.assertLess(np.mean([len(self.index.get_candidate_rows(q)) for q in normalize(queries)]), len(self.index))
+
+class LRUCacheTestCase(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # using 'a' makes 'b' the least recently used
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_stats(), {'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 1, 'hit_rate': 2 / 3})
+
+class KeywordsTestCase(SimpleTestCase):
+    # the keywords should be exactly the same as the original implementation, including the order of ties
+    def test_same_keywords_as_original(self):
+        rng = Random(0)
+        texts = [
+            '',
+            'The and of.',
+            'Said the officials. He said it was said.',
+            'Stocks fell on Tuesday. Stocks rose on Wednesday! Stocks, bonds and gold were flat?',
+            'Alpha beta gamma delta. Epsilon zeta eta theta. Iota kappa lambda. Omicron sigma tau upsilon.',
+            'Election officials say the election was fair. ELECTION results: Election day turnout was high.',
+        ] + [generate_article(num_sentences, rng) for num_sentences in (1, 5, 40)]
+
+        for text in texts:
+            self.assertEqual(find_keywords(text), find_keywords_reference(text))
+
+        self.assertEqual(len(find_keywords(texts[-1])), 10)
+
+    # repeated tokens in a text should only be lemmatized once, in the same order as the tokens
+    def test_lemmatize_tokens(self):
+        lemmatizer = mock.Mock()
+        lemmatizer.lemmatize.side_effect = lambda token: token.rstrip('s')
+
+        with mock.patch('news.nlp.get_lemmatizer', return_value=lemmatizer):
+            words = preprocess_for_topics('Markets rallied. The markets and the storms, markets everywhere.')
+
+        self.assertEqual(words, ['market', 'rallied', 'market', 'storm', 'market', 'everywhere'])
+        self.assertEqual(lemmatizer.lemmatize.call_count, 4)
+
+    # the NLTK data should only be loaded at startup when the setting is on
+    def test_preload_nltk(self):
+        config = apps.get_app_config('news')
+
+        for preload in [False, True]:
+            with override_settings(NEWS_PRELOAD_NLTK=preload), mock.patch('news.nlp.warm_up') as warm_up:
+                config.ready()
+
+            self.assertEqual(warm_up.called, preload)
+
+    # analyzing a text a chunk at a time should give the same sentences, keywords and topic words
+    def test_chunked_analysis(self):
+        model = mock.MagicMock()
+        lemmatizer = mock.Mock()
+        lemmatizer.lemmatize.side_effect = lambda token: token.rstrip('s')
+        texts = [
+            generate_article(60, Random(1)),
+            'Mr. Smith went to Washington. He said "it was fine." Then he left!  Prices rose 2.5 percent... '
+            'Did they? Yes.\n\nA new paragraph starts here. ' * 20,
+            'no punctuation at all ' * 50
+        ]
+
+        for text in texts:
+            for chunk_length in [40, 300, 1000]:
+                chunked = [sentence for _, _, sentences in iter_chunks(text, chunk_length) for sentence in sentences]
+
+                # sentences longer than the chunk length are split
+                if chunk_length > 40 and text != texts[-1]:
+                    self.assertEqual(chunked, sent_tokenize(text))
+
+                # the chunks cover the text in order without overlapping
+                spans = [(start, end) for start, end, _ in iter_chunks(text, chunk_length)]
+                self.assertEqual([start for start, _ in spans], [0] + [end for _, end in spans[:-1]])
+                self.assertEqual(spans[-1][1], len(text))
+
+            with mock.patch('news.nlp.registry.get', return_value=model), \
+                    mock.patch('news.nlp.get_lemmatizer', return_value=lemmatizer):
+                expected = analyze_text(text, ('keywords', 'topics'))
+                expected_words = list(model.id2word.doc2bow.call_args[0][0])
+
+                result = analyze_text(text, ('keywords', 'topics'), chunk_length=300)
+                words = list(model.id2word.doc2bow.call_args[0][0])
+
+                self.assertCountEqual(list(preprocess_for_topics(text, 300)), preprocess_for_topics(text))
+
+            if text != texts[-1]:
+                self.assertEqual(result['keywords'], expected['keywords'])
+                self.assertCountEqual(words, expected_words)
+                self.assertEqual(find_keywords(text, chunk_length=300), find_keywords(text))
+
+
+class SentimentTestCase(APITestCase):
+    # scored one word at a time like TextBlob does for text without modifiers or negations
+    def score_reference(self, lexicon: dict, tokens: list) -> tuple:
+        scores = [lexicon[token] for token in tokens if token in lexicon]
+        num_scores = float(len(scores) or 1)
+
+        return sum(p for p, _ in scores) / num_scores, sum(s for _, s in scores) / num_scores
+
+    # the vectorized scores should be the averages of the lexicon scores, with the texts that need
+    # TextBlob's modifier and negation handling marked as not exact
+    def test_lexicon_scores(self):
+        lexicon = {'good': (0.7, 0.6), 'bad': (-0.7, 0.67), 'great': (0.8, 0.75), 'very': (0.2, 0.3)}
+        scorer = LexiconSentiment(
+            list(lexicon), [p for p, _ in lexicon.values()], [s for _, s in lexicon.values()], [1.0, 1.0, 1.0, 1.3],
+            ['very', 'not', '!']
+        )
+        documents = [
+            ['a', 'good', 'day', 'and', 'a', 'great', 'good', 'night'],
+            ['bad'],
+            [],
+            ['nothing', 'to', 'see'],
+            ['not', 'good'],
+            ['very', 'bad', 'news'],
+            ['great', '!'],
+            ['x' * 1000, 'good']
+        ]
+
+        polarity, subjectivity, exact = scorer.score(documents)
+
+        for i, document in enumerate(documents):
+            expected_polarity, expected_subjectivity = self.score_reference(lexicon, document)
+            self.assertAlmostEqual(polarity[i], expected_polarity)
+            self.assertAlmostEqual(subjectivity[i], expected_subjectivity)
+
+        self.assertEqual(list(exact), [True, True, True, True, False, False, False, True])
+
+        # texts that aren't exact are scored by TextBlob
+        with mock.patch('news.sentiment.get_sentiment', return_value={'sentiment': 1, 'subjectivity': 1}) as get_sentiment:
+            scores = scorer.score_texts(['good day', 'not good', 'a long good text'], chunk_length=10)
+
+        self.assertAlmostEqual(scores[0]['sentiment'], 0.7)
+        self.assertEqual(scores[1:], [{'sentiment': 1, 'subjectivity': 1}] * 2)
+        self.assertEqual([args[0] for args, _ in get_sentiment.call_args_list], ['not good', 'a long good text'])
+
+    # rescoring should update the stored sentiment and the feed
+    def test_rescore_sentiment(self):
+        topic = TopicLkp.objects.create(topic_id=0, topic_name='topic 0')
+        scorer = LexiconSentiment(['good', 'bad'], [0.7, -0.7], [0.6, 0.7], [1.0, 1.0], ['not'])
+
+        for content in ['good good bad', 'bad', 'nothing here']:
+            article = Article.objects.create(
+                post_title='test title', url='www.article.com', headline='headline', content=content
+            )
+            ArticleNlp.objects.create(article=article, topic=topic, sentiment=0.5, subjectivity=0.5)
+
+        with mock.patch('news.sentiment.registry.get', return_value=scorer):
+            call_command('rescore_sentiment', batch_size=2, stdout=open(os.devnull, 'w'))
+
+        scores = list(ArticleNlp.objects.order_by('id').values_list('sentiment', 'subjectivity'))
+        self.assertEqual([(float(p), float(s)) for p, s in scores], [(0.233, 0.633), (-0.7, 0.7), (0, 0)])
+        self.assertEqual(
+            list(ArticleFeed.objects.order_by('article_id').values_list('sentiment', flat=True)), [p for p, _ in scores]
+        )
+
+    # the lexicon engine should give the same scores as TextBlob
+    def test_same_scores_as_textblob(self):
+        texts = [
+            'The market had a great day and investors were happy.',
+            'Officials said the storm caused terrible damage to the coast.',
+            'The new phone is beautiful, fast and cheap.',
+            'The team was not good enough to win the final.',
+            'This is a very bad decision!',
+            'Stocks rose 2 percent on Tuesday.',
+            'What a wonderful surprise :)',
+            ''
+        ]
+        scorer = LexiconSentiment.from_textblob()
+
+        for text, score in zip(texts, scorer.score_texts(texts)):
+            expected = get_sentiment(text)
+            self.assertAlmostEqual(score['sentiment'], expected['sentiment'])
+            self.assertAlmostEqual(score['subjectivity'], expected['subjectivity'])
+
+        # most of the plain texts are scored from the lexicon
+        _, _, exact = scorer.score([scorer.tokenize(text) for text in texts])
+        self.assertGreaterEqual(exact.sum(), 4)
+
+
+class IngestArticlesTestCase(APITestCase):
+    def setUp(self):
+        for i in range(2):
+            TopicLkp.objects.create(topic_id=i, topic_name=f'topic {i}')
+
+    def analyze(self, texts, analyses, sentiment_engine, num_workers):
+        # articles mentioning storms are topic 1
+        return [
+            {
+                'sentiment': {'sentiment': 0.12345, 'subjectivity': 0.5},
+                'keywords': text.split()[:2],
+                'topics': [(0, 0.3), (1, 0.7)] if 'storm' in text else [(0, 0.9), (1, 0.1)]
+            }
+            for text in texts
+        ]
+
+    def ingest(self, file_format: str, content: str, **options) -> str:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'articles.{file_format}')
+
+            with open(path, 'w') as f:
+                f.write(content)
+
+            with mock.patch('news.ingest.analyze_texts', side_effect=self.analyze) as analyze:
+                stdout = io.StringIO()
+                call_command('ingest_articles', path, workers=0, stdout=stdout, stderr=io.StringIO(), **options)
+                self.analyze_calls = analyze.call_count
+                self.assertEqual(analyze.call_args[0][3], 0)
+
+        return stdout.getvalue()
+
+    # articles should be written in batches with their NLP and feed rows, skipping invalid rows
+    def test_ingest_jsonl(self):
+        rows = [
+            {'url': 'www.a.com', 'headline': 'Markets rally', 'content': 'Markets rallied today', 'date_published': '2021-11-30'},
+            {'url': 'www.b.com', 'headline': 'Storm hits', 'content': 'A storm hit the coast', 'score': '5'},
+            {'url': 'www.c.com', 'headline': 'No content'},
+            {'url': 'www.d.com', 'headline': 'Bad date', 'content': 'text', 'date_published': 'yesterday'},
+            {'url': 'www.e.com', 'headline': 'Election', 'content': 'Election results are in', 'publisher': 'pub'},
+            {'url': 'www.f.com', 'headline': 'Not text', 'content': 123},
+            {'url': 'www.g.com', 'headline': ['Not text'], 'content': 'text'}
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n\n'
+
+        output = self.ingest('jsonl', content, batch_size=2)
+
+        self.assertIn('ingested 3 articles and skipped 5 invalid rows', output)
+        self.assertEqual(self.analyze_calls, 2)
+
+        articles = list(Article.objects.order_by('id'))
+        self.assertEqual([article.headline for article in articles], ['Markets rally', 'Storm hits', 'Election'])
+        self.assertEqual(articles[0].post_title, 'Markets rally')
+        self.assertEqual(articles[0].date_published, datetime(2021, 11, 30, tzinfo=timezone.utc))
+        self.assertEqual(articles[1].score, 5)
+
+        nlp = {row.article_id: row for row in ArticleNlp.objects.all()}
+        self.assertEqual([nlp[article.id].topic_id for article in articles], [0, 1, 0])
+        self.assertEqual(nlp[articles[0].id].keywords, 'Markets;rallied')
+        self.assertEqual(float(nlp[articles[0].id].sentiment), 0.123)
+
+        feed = ArticleFeed.objects.get(article_id=articles[1].id)
+        self.assertEqual(feed.topic_name, 'topic 1')
+
+    def test_ingest_csv(self):
+        content = 'url,headline,content,publisher\nwww.a.com,Storm hits,"A storm, then\nanother storm",pub\n'
+
+        output = self.ingest('csv', content)
+
+        self.assertIn('ingested 1 articles', output)
+        self.assertEqual(Article.objects.get().content, 'A storm, then\nanother storm')
+        self.assertEqual(ArticleNlp.objects.get().topic_id, 1)
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from .serializers import TopicSerializer
 from .models import Article, TopicLkp
+from .cache import cached_response
 from .utils import filter_articles_by_timeframe, get_counts_by_topic
 
 
@@ -29,6 +30,7 @@ class TopicViewSet(viewsets.ModelViewSet):
     # 
     # retrieve the count of articles for each topic
     @action(methods=['GET'], detail=False)
+    @cached_response('topic_counts')
     def counts(self, request):
         articles = Article.objects.all()
         query_params = request.query_params
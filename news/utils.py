@@ -1,7 +1,22 @@
 # Helper functions used by various API endpoints
 from .serializers import ArticleNlpSerializer
 from datetime import datetime, timedelta
-from news.models import Article, ArticleNlp, SavedArticle, TopicLkp
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Substr
+from news.models import Article, ArticleFeed, ArticleNlp, SavedArticle, TopicLkp
+
+# article columns returned by get_article_feed, these line up with ArticleFeedSerializer
+ARTICLE_FEED_FIELDS = ('id', 'post_title', 'url', 'publisher', 'headline', 'date_published', 'content')
+NLP_FEED_FIELDS = ('sentiment', 'subjectivity', 'topic', 'keywords', 'topic_name')
+
+# top level fields of the article feed response, the client can pick from these with the fields/exclude
+# query params. 'nlp' covers all the NLP fields, 'summary' is only included when asked for
+FEED_RESPONSE_FIELDS = ARTICLE_FEED_FIELDS + ('summary', 'nlp')
+DEFAULT_FEED_RESPONSE_FIELDS = ARTICLE_FEED_FIELDS + ('nlp',)
+
+# the cursor pagination needs these from every row even if they aren't in the response
+FEED_KEY_FIELDS = ('id', 'date_published')
 
 
 def get_article_nlp(article_nlp: ArticleNlp):
@@ -11,6 +26,140 @@ def get_article_nlp(article_nlp: ArticleNlp):
 
     return nlp
 
+def get_article_feed(articles: Article, fields: list = None, summary_length: int = None):
+    """
+    Join a queryset of articles with their NLP and topic name so the whole feed
+    comes back from a single query instead of one ArticleNlp query per article.
+
+    An ArticleFeed queryset can also be given, the read model already has every
+    column so no join is needed at all.
+
+    Only the columns needed for the requested fields are selected, so leaving out
+    content means the database never reads the article body.
+
+    Args:
+        articles (Article): Filtered or unfiltered queryset of articles or ArticleFeed rows, ordering is kept
+        fields (list): top level response fields to select (see FEED_RESPONSE_FIELDS), defaults to
+                       DEFAULT_FEED_RESPONSE_FIELDS. id and date_published are always selected
+        summary_length (int): if given, also select 'summary', the first summary_length characters
+                              of the content computed by the database
+
+    Returns:
+        QuerySet: dictionaries with the article columns plus sentiment, subjectivity,
+                  topic, keywords and topic_name. Meant to be serialized with ArticleFeedSerializer
+    """
+    if fields is None:
+        fields = DEFAULT_FEED_RESPONSE_FIELDS
+
+    columns = [f for f in ARTICLE_FEED_FIELDS if f in fields or f in FEED_KEY_FIELDS]
+    expressions = {}
+
+    if summary_length:
+        expressions['summary'] = Substr('content', 1, summary_length)
+
+    if articles.model is ArticleFeed:
+        columns = [c for c in columns if c != 'id']
+
+        if 'nlp' in fields:
+            columns += NLP_FEED_FIELDS
+
+        return articles.values(*columns, id=F('article_id'), **expressions)
+
+    if 'nlp' in fields:
+        expressions.update(
+            sentiment=F('articlenlp__sentiment'),
+            subjectivity=F('articlenlp__subjectivity'),
+            topic=F('articlenlp__topic'),
+            keywords=F('articlenlp__keywords'),
+            topic_name=F('articlenlp__topic__topic_name')
+        )
+
+    return articles.values(*columns, **expressions)
+
+def get_feed_fields(query_params) -> tuple:
+    """
+    Work out which fields of the article feed the client asked for.
+
+    Query params:
+        fields - comma separated list of fields to return, e.g. fields=id,headline,nlp
+        exclude - comma separated list of fields to leave out, e.g. exclude=content
+        summary - return a 'summary' field with the first N characters of the content instead of
+                  the full content, e.g. summary=200
+
+    Args:
+        query_params (QueryDict): query params from the request
+
+    Raises:
+        ValueError: if an unknown field or an invalid summary length was given
+
+    Returns:
+        tuple: list of top level fields to return, and the summary length (None if no summary)
+    """
+    fields = list(DEFAULT_FEED_RESPONSE_FIELDS)
+    summary_length = None
+
+    if query_params.get('summary'):
+        if not query_params.get('summary').isnumeric() or int(query_params.get('summary')) < 1:
+            raise ValueError('summary must be a positive integer')
+
+        summary_length = int(query_params.get('summary'))
+        fields = [f if f != 'content' else 'summary' for f in fields]
+
+    if query_params.get('fields'):
+        fields = [f.strip() for f in query_params.get('fields').split(',')]
+
+    if query_params.get('exclude'):
+        excluded = [f.strip() for f in query_params.get('exclude').split(',')]
+        fields = [f for f in fields if f not in excluded]
+    else:
+        excluded = []
+
+    unknown = [f for f in fields + excluded if f not in FEED_RESPONSE_FIELDS]
+
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(unknown)}')
+
+    if 'summary' in fields and not summary_length:
+        raise ValueError('the summary field needs a summary length, e.g. summary=200')
+
+    return fields, summary_length
+
+def search_headlines(articles: Article, search: str, rank: bool = False):
+    """
+    Full text search on article headlines.
+
+    On postgres this matches the headline's tsvector against a websearch style query
+    (quoted phrases, "or" and -exclusions work) using the GIN index from migration 0012,
+    so the search doesn't get slower as the archive grows. Other databases don't have
+    full text search, so every word in the search must appear somewhere in the headline.
+
+    Args:
+        articles (Article): Filtered or unfiltered queryset of articles to search
+        search (str): words to search for
+        rank (bool): order the results by relevance, most relevant first. Only supported on postgres,
+                     other databases keep the existing ordering
+
+    Returns:
+        Article: queryset of matching articles
+    """
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        # this has to compile to the same expression as news_art_headline_fts_idx for the index to be used
+        vector = SearchVector('headline', config='english')
+        query = SearchQuery(search, config='english', search_type='websearch')
+        articles = articles.annotate(headline_vector=vector).filter(headline_vector=query)
+
+        if rank:
+            articles = articles.annotate(rank=SearchRank(vector, query)).order_by('-rank', '-date_published')
+
+        return articles
+
+    for word in search.split():
+        articles = articles.filter(headline__icontains=word)
+
+    return articles
+
 # given a time frame of day, week, month or year, return the date that corresponds with that time frame
 def get_filter_date(timeframe: str):
     filter_date = datetime(1970, 1, 1) # default to this so if a valid value wasn't given for timeFrame, it won't filter anything
@@ -146,8 +295,9 @@ def get_subjectivity_by_sentiment(articles: Article, timeframe: str = None, topi
     # get list of IDs from the filtered set of articles
     article_ids = articles.values_list('id')
 
-    # get NLP info for all the articles provided
-    article_nlp = ArticleNlp.objects.filter(article_id__in=article_ids)
+    # get NLP info for all the articles provided, select_related so the topic name
+    # doesn't cost another query per article
+    article_nlp = ArticleNlp.objects.filter(article_id__in=article_ids).select_related('topic')
 
     values = []
 
@@ -156,7 +306,7 @@ def get_subjectivity_by_sentiment(articles: Article, timeframe: str = None, topi
             {
                 'x': float(art.sentiment),
                 'y': float(art.subjectivity),
-                'id': art.article.id,
+                'id': art.article_id,
                 'category': art.topic.topic_name
             }
         )
@@ -0,0 +1,236 @@
+# Nearest neighbour search over the article embeddings from the headline model.
+#
+# The embeddings are stored L2-normalized as float32 in a .npy file that is memory-mapped
+# read-only, row i is the vector of article_ids[i]. Cosine similarity is then a dot product,
+# and an exact search is a matrix-vector product done a block of rows at a time so only one
+# block of scores is in memory. The optional approximate mode hashes the vectors into buckets
+# with random hyperplanes (LSH) and only scores the rows in the query's buckets.
+import numpy as np
+import os
+
+# files written by the build_vector_index management command, they live next to the model in STATIC_ROOT
+VECTORS_FILE = 'article_vectors.npy'
+VECTOR_IDS_FILE = 'article_vector_ids.npy'
+LSH_FILE = 'article_vectors_lsh.npz'
+
+
+def normalize(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # leave zero vectors as they are instead of dividing by zero
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class VectorIndex:
+    """
+    Top-K cosine similarity search over article embeddings.
+
+    Build one from the raw vectors with VectorIndex.build, add LSH buckets with build_lsh
+    if approximate search is wanted, then save it. A loaded index memory-maps the vectors,
+    so worker processes share them through the page cache instead of each holding a copy.
+    """
+
+    def __init__(self, vectors, article_ids, planes=None, bucket_codes=None, bucket_rows=None):
+        self.vectors = vectors
+        self.article_ids = np.asarray(article_ids, dtype=np.int64)
+
+        # LSH tables, planes is (tables, bits, dim). For each table the row numbers are sorted by
+        # their hash code so a bucket is a contiguous slice found with a binary search
+        self.planes = planes
+        self.bucket_codes = bucket_codes
+        self.bucket_rows = bucket_rows
+
+        self.row_by_article_id = {int(article_id): row for row, article_id in enumerate(self.article_ids)}
+
+    def __len__(self):
+        return len(self.article_ids)
+
+    @property
+    def has_lsh(self) -> bool:
+        return self.planes is not None
+
+    @classmethod
+    def build(cls, vectors, article_ids):
+        """
+        Args:
+            vectors: (n, dim) embeddings, they don't need to be normalized
+            article_ids (list): article ID of each row
+
+        Returns:
+            VectorIndex: exact index held in memory, call save to write it out
+        """
+        return cls(normalize(vectors), article_ids)
+
+    def build_lsh(self, num_tables: int = 4, num_bits: int = 12, seed: int = 0):
+        """
+        Hash the vectors into buckets for approximate search. Each table has num_bits random
+        hyperplanes, a vector's code is which side of each plane it's on, so vectors with a
+        small angle between them are likely to share a code in at least one table.
+
+        More bits make smaller buckets (faster, lower recall), more tables raise recall.
+
+        Args:
+            num_tables (int): number of independent hash tables
+            num_bits (int): hyperplanes per table, at most 62
+            seed (int): random seed for the hyperplanes
+        """
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((num_tables, num_bits, self.vectors.shape[1])).astype(np.float32)
+
+        codes = np.stack([self.hash(self.vectors, table) for table in range(num_tables)])
+        order = np.argsort(codes, axis=1, kind='stable')
+
+        self.bucket_codes = np.take_along_axis(codes, order, axis=1)
+        self.bucket_rows = order.astype(np.int32 if len(self) < 2 ** 31 else np.int64)
+
+    def hash(self, vectors, table: int) -> np.ndarray:
+        bits = (vectors @ self.planes[table].T) > 0
+        weights = np.int64(1) << np.arange(bits.shape[1], dtype=np.int64)
+
+        return bits.astype(np.int64) @ weights
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        """
+        Args:
+            directory (str): directory containing the index files
+            mmap (bool): memory-map the vectors read-only instead of reading them into memory
+
+        Raises:
+            FileNotFoundError: if the index hasn't been built
+
+        Returns:
+            VectorIndex: the loaded index, with LSH tables if they were built
+        """
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode='r' if mmap else None)
+        article_ids = np.load(os.path.join(directory, VECTOR_IDS_FILE))
+        lsh_path = os.path.join(directory, LSH_FILE)
+
+        if not os.path.exists(lsh_path):
+            return cls(vectors, article_ids)
+
+        with np.load(lsh_path) as lsh:
+            return cls(vectors, article_ids, lsh['planes'], lsh['bucket_codes'], lsh['bucket_rows'])
+
+    def save(self, directory: str):
+        # every file is written to a temporary name first so a running server never loads half an index
+        files = [
+            (VECTORS_FILE, lambda path: np.save(path, np.ascontiguousarray(self.vectors, dtype=np.float32))),
+            (VECTOR_IDS_FILE, lambda path: np.save(path, self.article_ids))
+        ]
+
+        if self.has_lsh:
+            files.append((LSH_FILE, lambda path: np.savez(
+                path, planes=self.planes, bucket_codes=self.bucket_codes, bucket_rows=self.bucket_rows
+            )))
+        elif os.path.exists(os.path.join(directory, LSH_FILE)):
+            os.remove(os.path.join(directory, LSH_FILE))
+
+        for file_name, write in files:
+            path = os.path.join(directory, file_name)
+            # keep the extension so numpy doesn't add another one
+            tmp_path = f'{path[:-4]}.tmp{path[-4:]}'
+            write(tmp_path)
+            os.replace(tmp_path, path)
+
+    def get_vector(self, article_id: int):
+        # normalized embedding of an article, None if the article isn't in the index
+        row = self.row_by_article_id.get(article_id)
+
+        return None if row is None else np.asarray(self.vectors[row])
+
+    def search(self, queries, k: int, exclude_ids: list = None, approximate: bool = False,
+               block_size: int = 65536) -> list:
+        """
+        Find the k most similar articles for each query vector.
+
+        Args:
+            queries: one query vector or a (num_queries, dim) matrix, they don't need to be normalized
+            k (int): number of results per query
+            exclude_ids (list): an article ID for each query to leave out of its results, usually
+                                the article the query vector came from
+            approximate (bool): only score the rows in the query's LSH buckets, needs build_lsh
+            block_size (int): rows scored at a time by the exact search
+
+        Returns:
+            list: for each query a list of (article ID, similarity) tuples, most similar first
+        """
+        queries = normalize(queries)
+        exclude_ids = exclude_ids if exclude_ids is not None else [None] * len(queries)
+
+        # one extra result in case the excluded article is among the top k
+        num_candidates = min(k + 1, len(self))
+
+        if approximate and self.has_lsh:
+            top = [self.search_buckets(query, num_candidates) for query in queries]
+        else:
+            top = self.search_exact(queries, num_candidates, block_size)
+
+        results = []
+
+        for (rows, scores), exclude_id in zip(top, exclude_ids):
+            article_ids = self.article_ids[rows]
+            results.append([
+                (int(article_id), float(score))
+                for article_id, score in zip(article_ids, scores) if article_id != exclude_id
+            ][:k])
+
+        return results
+
+    def search_exact(self, queries: np.ndarray, k: int, block_size: int) -> list:
+        num_queries = len(queries)
+        top_rows = np.empty((num_queries, 0), dtype=np.int64)
+        top_scores = np.empty((num_queries, 0), dtype=np.float32)
+
+        for start in range(0, len(self), block_size):
+            scores = queries @ np.asarray(self.vectors[start:start + block_size]).T
+            rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+
+            # merge the block with the best rows so far and keep the top k, argpartition doesn't sort
+            # so this is linear in the block size
+            scores = np.concatenate([top_scores, scores], axis=1)
+            rows = np.concatenate([top_rows, rows], axis=1)
+
+            if scores.shape[1] > k:
+                best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, best, axis=1)
+                rows = np.take_along_axis(rows, best, axis=1)
+
+            top_scores, top_rows = scores, rows
+
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+
+        return list(zip(np.take_along_axis(top_rows, order, axis=1), np.take_along_axis(top_scores, order, axis=1)))
+
+    def get_candidate_rows(self, query: np.ndarray) -> np.ndarray:
+        # rows sharing a bucket with the query in any table, also probing the buckets one bit
+        # away since near neighbours often land just across one of the planes
+        candidates = []
+
+        for table in range(len(self.planes)):
+            code = int(self.hash(query[np.newaxis], table)[0])
+            probes = [code] + [code ^ (1 << bit) for bit in range(self.planes.shape[1])]
+            codes = self.bucket_codes[table]
+
+            for probe in probes:
+                start, end = np.searchsorted(codes, [probe, probe + 1])
+                candidates.append(self.bucket_rows[table][start:end])
+
+        return np.unique(np.concatenate(candidates))
+
+    def search_buckets(self, query: np.ndarray, k: int) -> tuple:
+        rows = self.get_candidate_rows(query)
+
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+
+        scores = np.asarray(self.vectors[rows]) @ query
+
+        if len(rows) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[best], scores[best]
+
+        order = np.argsort(-scores, kind='stable')
+
+        return rows[order], scores[order]